@@ -0,0 +1,146 @@
+# activity_log.py - Gravação em lote dos logs de atividade de usuários
+# Os eventos entram numa fila em memória limitada (custo quase zero na requisição)
+# e uma tarefa de fundo grava em lote a cada ACTIVITY_LOG_BATCH_SIZE eventos ou
+# ACTIVITY_LOG_FLUSH_MS milissegundos. Com a fila cheia o evento novo é descartado.
+# Se o insert do lote falhar, as linhas são regravadas uma a uma (só as inválidas se perdem).
+
+from typing import Any, Dict, List, Optional, Tuple
+from itertools import groupby
+import asyncio
+import logging
+import os
+from postgrest.types import ReturnMethod
+
+ACTIVITY_LOG_QUEUE_MAX = int(os.getenv("ACTIVITY_LOG_QUEUE_MAX", "10000"))
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "200"))
+ACTIVITY_LOG_FLUSH_MS = int(os.getenv("ACTIVITY_LOG_FLUSH_MS", "1000"))
+
+class ActivityLogWriter:
+    """Fila limitada de (tabela, linha) + tarefa que faz inserts em lote por tabela"""
+    def __init__(self, max_queue: int = ACTIVITY_LOG_QUEUE_MAX, batch_size: int = ACTIVITY_LOG_BATCH_SIZE,
+                 flush_ms: int = ACTIVITY_LOG_FLUSH_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._batch_ready = asyncio.Event()
+        self._inflight: List[Tuple[str, Dict[str, Any]]] = []
+        self._writing: Optional[asyncio.Task] = None
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'enfileirados': 0, 'gravados': 0, 'descartados': 0, 'falhas': 0, 'lotes': 0}
+
+    # --- Produção de eventos ---
+
+    def enqueue(self, table: str, row: Dict[str, Any]):
+        """Não bloqueia; pode ser chamado do loop ou de threads do pool"""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                loop.call_soon_threadsafe(self._put, table, row)
+                return
+        self._put(table, row)
+
+    def _put(self, table: str, row: Dict[str, Any]):
+        try:
+            self._queue.put_nowait((table, row))
+        except asyncio.QueueFull:
+            self.stats['descartados'] += 1
+            if self.stats['descartados'] % 1000 == 1:
+                logging.warning(f"Fila de logs de atividade cheia: {self.stats['descartados']} eventos descartados até agora")
+            return
+        self.stats['enfileirados'] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    # --- Gravação ---
+
+    def _drain(self, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        items = []
+        while not self._queue.empty() and (limit is None or len(items) < limit):
+            items.append(self._queue.get_nowait())
+        return items
+
+    def _insert(self, table: str, rows: List[Dict[str, Any]]):
+        # missing=default: colunas ausentes numa linha usam o default do banco (ex.: created_at)
+        self._client.table(table).insert(rows, returning=ReturnMethod.minimal, default_to_null=False).execute()
+
+    def _insert_each(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """Uma linha por insert, para que uma linha inválida não descarte o lote inteiro"""
+        written = 0
+        for row in rows:
+            try:
+                self._insert(table, [row])
+                written += 1
+            except Exception as e:
+                logging.error(f"Erro ao gravar log de atividade em {table}: {e} ({row})")
+        return written
+
+    async def _write(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        ordered = sorted(batch, key=lambda item: item[0])
+        for table, items in groupby(ordered, key=lambda item: item[0]):
+            rows = [row for _, row in items]
+            try:
+                await asyncio.to_thread(self._insert, table, rows)
+                written = len(rows)
+                self.stats['lotes'] += 1
+            except Exception as e:
+                logging.error(f"Erro ao gravar {len(rows)} logs de atividade em {table}, gravando um a um: {e}")
+                written = await asyncio.to_thread(self._insert_each, table, rows) if len(rows) > 1 else 0
+            self.stats['gravados'] += written
+            self.stats['falhas'] += len(rows) - written
+
+    async def _run(self):
+        while True:
+            self._inflight = [await self._queue.get()]
+            if self._queue.qsize() + 1 < self.batch_size:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._inflight + self._drain(self.batch_size - 1)
+            self._inflight = []
+            # O lote em gravação roda numa tarefa própria: cancelar _run não o interrompe,
+            # e stop() espera por ele antes do flush final
+            self._writing = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    # --- Ciclo de vida ---
+
+    def start(self, client):
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+        logging.info(f"Gravação de logs de atividade em lote iniciada (lote {self.batch_size}, intervalo {int(self.flush_interval * 1000)} ms)")
+
+    async def flush(self):
+        """Grava tudo o que está na fila (inclusive o lote em montagem)"""
+        pending = self._inflight + self._drain()
+        self._inflight = []
+        for start in range(0, len(pending), self.batch_size):
+            await self._write(pending[start:start + self.batch_size])
+
+    async def stop(self):
+        """Encerra a tarefa de fundo, termina o lote em gravação e grava o que restou na fila"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        if self._client is not None:
+            await self.flush()
+        logging.info(f"Gravação de logs de atividade encerrada: {self.stats}")
+
+# Instância global do processo
+activity_log = ActivityLogWriter()
@@ -0,0 +1,182 @@
+# analytics_engine.py - Motor analítico embutido (DuckDB) sobre o snapshot colunar
+# Opcional: só é usado se o pacote duckdb estiver instalado e ANALYTICS_ENGINE != "off".
+# As agregações rodam em SQL vetorizado (multithread) sobre a tabela Arrow do snapshot,
+# sem cópia; o marcador de consistência é o coleta_id mais recente do snapshot.
+
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime
+import logging
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from price_analytics import assign_categories
+
+try:
+    import duckdb
+except ImportError:  # dependência opcional
+    duckdb = None
+
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "duckdb").lower()
+
+def _prepare_table(table: pa.Table) -> pa.Table:
+    """Ajusta o snapshot para o SQL: datas sem fuso (mesmo relógio do banco) e categoria preenchida"""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type) and field.type.tz is not None:
+            table = table.set_column(i, field.name, pc.cast(table.column(i), pa.timestamp(field.type.unit)))
+    # Registros anteriores à coluna categoria recebem a mesma categorização do pandas
+    categoria = table.column('categoria')
+    if categoria.null_count:
+        filled = categoria.to_pandas()
+        missing = filled.isna()
+        filled[missing] = assign_categories(table.column('nome_produto').to_pandas()[missing])
+        table = table.set_column(table.schema.get_field_index('categoria'), 'categoria', pa.array(filled, type=pa.string()))
+    return table
+
+class AnalyticsEngine:
+    """Conexão DuckDB em memória com a view `produtos` apontando para o snapshot"""
+    def __init__(self):
+        self.enabled = duckdb is not None and ANALYTICS_ENGINE != "off"
+        self.coleta_id: Optional[int] = None
+        self._source: Optional[pa.Table] = None
+        self._con = duckdb.connect(database=':memory:') if self.enabled else None
+        self._lock = threading.Lock()
+
+    def sync(self, table: pa.Table, coleta_id: Optional[int]):
+        """Aponta a view para o snapshot atual (só re-registra se a tabela mudou)"""
+        if table is self._source and coleta_id == self.coleta_id:
+            return
+        with self._lock:
+            self._con.register('produtos', _prepare_table(table))
+            self._source = table
+            self.coleta_id = coleta_id
+        logging.info(f"Motor analítico sincronizado com o snapshot (coleta #{coleta_id}, {table.num_rows} registros)")
+
+    def is_consistent(self, coleta_id: Optional[int]) -> bool:
+        return self.enabled and self._source is not None and self.coleta_id == coleta_id
+
+    def _df(self, sql: str, params: List[Any]) -> pd.DataFrame:
+        with self._lock:
+            return self._con.execute(sql, params).df()
+
+    @staticmethod
+    def _range_filter(start_date: date, end_date: date, cnpjs: Optional[List[str]]):
+        # Mesmo recorte do PostgREST: data_coleta entre start_date e end_date 00:00
+        where = "data_coleta >= ? AND data_coleta <= ? AND preco_produto IS NOT NULL"
+        params: List[Any] = [datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date, datetime.min.time())]
+        if cnpjs and cnpjs != ['all']:
+            where += " AND list_contains(?, cnpj_supermercado)"
+            params.append(list(cnpjs))
+        return where, params
+
+    # --- Consultas ---
+
+    def price_trends(self, start_date: date, end_date: date, cnpjs: Optional[List[str]] = None) -> pd.DataFrame:
+        where, params = self._range_filter(start_date, end_date, cnpjs)
+        trends = self._df(f"""
+            SELECT CAST(data_coleta AS DATE) AS data,
+                   avg(preco_produto) AS preco_medio,
+                   min(preco_produto) AS preco_minimo,
+                   max(preco_produto) AS preco_maximo,
+                   coalesce(stddev_samp(preco_produto) / avg(preco_produto), 0) AS volatilidade,
+                   count(*) AS total_produtos
+            FROM produtos WHERE {where}
+            GROUP BY 1 ORDER BY 1
+        """, params)
+        trends['data'] = pd.to_datetime(trends['data']).dt.date
+        return trends
+
+    def top_products(self, start_date: date, end_date: date, previous_start: date, previous_end: date,
+                     cnpjs: Optional[List[str]], limit: int) -> pd.DataFrame:
+        where, params = self._range_filter(start_date, end_date, cnpjs)
+        prev_where, prev_params = self._range_filter(previous_start, previous_end, cnpjs)
+        return self._df(f"""
+            WITH atual AS (
+                SELECT nome_produto_normalizado,
+                       count(*) AS frequencia,
+                       avg(preco_produto) AS preco_medio,
+                       first(nome_produto ORDER BY data_coleta, id_registro) AS nome_produto,
+                       last(categoria ORDER BY data_coleta, id_registro) AS categoria,
+                       arg_min(nome_supermercado, preco_produto) AS mercado_mais_barato,
+                       min(preco_produto) AS preco_mais_barato
+                FROM produtos WHERE {where}
+                GROUP BY 1
+                ORDER BY frequencia DESC
+                LIMIT ?
+            ),
+            anterior AS (
+                SELECT nome_produto_normalizado, avg(preco_produto) AS preco_anterior
+                FROM produtos WHERE {prev_where}
+                GROUP BY 1
+            )
+            SELECT atual.*,
+                   CASE WHEN anterior.preco_anterior > 0
+                        THEN (atual.preco_medio - anterior.preco_anterior) / anterior.preco_anterior * 100
+                        ELSE 0 END AS variacao_semanal
+            FROM atual LEFT JOIN anterior USING (nome_produto_normalizado)
+            ORDER BY frequencia DESC
+        """, params + [limit] + prev_params)
+
+    def report_aggregates(self, start_date: date, end_date: date, cnpjs: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Agregados do relatório abrangente (métricas, mercados, categorias, faixas e destaques)"""
+        where, params = self._range_filter(start_date, end_date, cnpjs)
+        principais = self._df(f"""
+            SELECT count(*) AS total_produtos,
+                   count(DISTINCT nome_supermercado) AS total_mercados,
+                   avg(preco_produto) AS preco_medio_geral,
+                   max(preco_produto) AS produto_mais_caro,
+                   min(preco_produto) AS produto_mais_barato,
+                   stddev_samp(preco_produto) / avg(preco_produto) AS volatilidade_geral,
+                   count(*) FILTER (WHERE preco_produto <= 5) AS ate_5,
+                   count(*) FILTER (WHERE preco_produto > 5 AND preco_produto <= 10) AS "5_a_10",
+                   count(*) FILTER (WHERE preco_produto > 10 AND preco_produto <= 20) AS "10_a_20",
+                   count(*) FILTER (WHERE preco_produto > 20 AND preco_produto <= 50) AS "20_a_50",
+                   count(*) FILTER (WHERE preco_produto > 50 AND preco_produto <= 100) AS "50_a_100",
+                   count(*) FILTER (WHERE preco_produto > 100) AS acima_100
+            FROM produtos WHERE {where}
+        """, params)
+        mercados = self._df(f"""
+            SELECT nome_supermercado AS mercado,
+                   count(*) AS total_produtos,
+                   avg(preco_produto) AS preco_medio,
+                   min(preco_produto) AS preco_minimo,
+                   max(preco_produto) AS preco_maximo,
+                   stddev_samp(preco_produto) AS desvio_padrao
+            FROM produtos WHERE {where}
+            GROUP BY 1 ORDER BY 1
+        """, params)
+        categorias = self._df(f"""
+            SELECT coalesce(categoria, 'Outros') AS categoria,
+                   count(*) AS count, avg(preco_produto) AS mean,
+                   min(preco_produto) AS min, max(preco_produto) AS max,
+                   stddev_samp(preco_produto) AS std
+            FROM produtos WHERE {where}
+            GROUP BY 1
+        """, params)
+        destaque_sql = f"""
+            SELECT nome_produto, preco_produto, nome_supermercado
+            FROM produtos WHERE {where}
+            ORDER BY preco_produto {{ordem}} LIMIT 10
+        """
+        return {
+            'principais': principais.iloc[0].to_dict(),
+            'mercados': mercados,
+            'categorias': categorias.set_index('categoria'),
+            'mais_caros': self._df(destaque_sql.format(ordem='DESC'), params),
+            'mais_baratos': self._df(destaque_sql.format(ordem='ASC'), params),
+            'precos': self._df(f"SELECT preco_produto FROM produtos WHERE {where}", params)
+        }
+
+    def product_rows(self, barcode: str, start_date: date, end_date: date) -> pd.DataFrame:
+        """Observações de um código de barras no período (filtro feito no SQL)"""
+        where, params = self._range_filter(start_date, end_date, None)
+        return self._df(f"""
+            SELECT * FROM produtos
+            WHERE codigo_barras = ? AND {where}
+            ORDER BY data_coleta
+        """, [barcode] + params)
+
+# Instância global usada pelas rotas
+analytics_engine = AnalyticsEngine()
@@ -0,0 +1,68 @@
+# benchmarks/bench_advanced_metrics.py - Compara o cálculo antigo de /advanced-metrics com o vetorizado
+# Uso: python benchmarks/bench_advanced_metrics.py [--rows 1000000] [--products 2000]
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from synthetic import make_produtos_frame
+from price_analytics import compute_advanced_metrics, categorize_product_name
+
+def legacy_advanced_metrics(df: pd.DataFrame) -> dict:
+    """Reprodução do laço original (uma varredura booleana por produto e DataFrame por categoria)"""
+    price_variations = []
+    for product in df['nome_produto_normalizado'].unique():
+        product_prices = df[df['nome_produto_normalizado'] == product]['preco_produto']
+        if len(product_prices) > 1:
+            price_variations.append(product_prices.std() / product_prices.mean())
+    indice_confianca = 1 - (np.mean(price_variations) if price_variations else 0)
+
+    market_stats = df.groupby('nome_supermercado').agg({'preco_produto': 'mean', 'id_registro': 'count'})
+    mercado_mais_competitivo = market_stats['preco_produto'].idxmin()
+
+    categorized = {}
+    for product in df.to_dict('records'):
+        categorized.setdefault(categorize_product_name(product['nome_produto']), []).append(product)
+    categoria_volatilidade = {}
+    for category, products in categorized.items():
+        cat_df = pd.DataFrame(products)
+        categoria_volatilidade[category] = cat_df['preco_produto'].std() / cat_df['preco_produto'].mean()
+    categoria_mais_volatil = max(categoria_volatilidade.items(), key=lambda x: x[1])[0]
+
+    return {
+        'indice_confianca': indice_confianca,
+        'mercado_mais_competitivo': mercado_mais_competitivo,
+        'categoria_mais_volatil': categoria_mais_volatil
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--products', type=int, default=2_000)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    df = make_produtos_frame(rows=args.rows, products=args.products)
+    previous_df = make_produtos_frame(rows=args.rows, products=args.products, seed=7)
+    print(f"Dataset: {len(df):,} linhas, {df['nome_produto_normalizado'].nunique():,} produtos")
+
+    start = time.perf_counter()
+    new = compute_advanced_metrics(df, previous_df)
+    vectorized_seconds = time.perf_counter() - start
+    print(f"vetorizado: {vectorized_seconds:.3f}s")
+
+    if args.skip_legacy:
+        return
+
+    start = time.perf_counter()
+    old = legacy_advanced_metrics(df)
+    legacy_seconds = time.perf_counter() - start
+    print(f"legado:     {legacy_seconds:.3f}s  (speedup {legacy_seconds / vectorized_seconds:.1f}x)")
+
+    assert np.isclose(old['indice_confianca'], new['indice_confianca'])
+    assert old['mercado_mais_competitivo'] == new['mercado_mais_competitivo']
+    assert old['categoria_mais_volatil'] == new['categoria_mais_volatil']
+
+if __name__ == '__main__':
+    main()
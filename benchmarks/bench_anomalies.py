@@ -0,0 +1,54 @@
+# benchmarks/bench_anomalies.py - Detecção de anomalias vetorizada x laço por grupo
+# Uso: python benchmarks/bench_anomalies.py [--rows 500000] [--products 3000]
+import argparse
+import time
+
+import numpy as np
+from scipy import stats
+
+from synthetic import make_produtos_frame
+from price_analytics import detect_price_anomalies, ANOMALY_THRESHOLDS
+
+def legacy_detect_price_anomalies(df):
+    """Reprodução do laço original sobre os grupos (produto, mercado)"""
+    anomalies = []
+    for (produto, mercado), group in df.groupby(['nome_produto_normalizado', 'nome_supermercado']):
+        if len(group) < 5:
+            continue
+        prices = group['preco_produto'].dropna()
+        z_scores = np.abs(stats.zscore(prices))
+        for idx in np.where(z_scores > 2.5)[0]:
+            anomalies.append((produto, mercado, group.iloc[idx]['preco_produto']))
+    return anomalies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--products', type=int, default=3_000)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    df = make_produtos_frame(rows=args.rows, products=args.products)
+    spikes = df.sample(frac=0.001, random_state=1).index
+    df.loc[spikes, 'preco_produto'] *= 3
+    print(f"Dataset: {len(df):,} linhas")
+
+    for method in ANOMALY_THRESHOLDS:
+        start = time.perf_counter()
+        found = detect_price_anomalies(df, method=method)
+        elapsed = time.perf_counter() - start
+        print(f"{method:>6}: {elapsed:.3f}s  ({len(found)} anomalias)")
+        if method == 'zscore':
+            zscore_seconds, zscore_found = elapsed, found
+
+    if args.skip_legacy:
+        return
+
+    start = time.perf_counter()
+    legacy = legacy_detect_price_anomalies(df)
+    legacy_seconds = time.perf_counter() - start
+    print(f"legado: {legacy_seconds:.3f}s  (speedup {legacy_seconds / zscore_seconds:.1f}x)")
+    assert {(a['produto'], a['mercado'], a['preco']) for a in zscore_found} == set(legacy)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_hot_store.py - Armazenamento quente: incorporação incremental (sync) x carga completa
+# Uso: python benchmarks/bench_hot_store.py [--rows 200000] [--coletas 10] [--retouch 0.2]
+# O banco é um substituto local do PostgREST em memória. A última coleta regrava (upsert por
+# id_registro) uma fração --retouch das vendas já coletadas, como acontece com a janela de
+# dias_pesquisa do coletor, além de trazer vendas novas.
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from synthetic import make_produtos_frame
+from hot_store import HotPriceStore
+
+class FakeQuery:
+    """Subconjunto da API do postgrest-py usado pelo armazenamento quente"""
+    def __init__(self, rows):
+        self.rows, self.filters, self.size = rows, [], None
+
+    def select(self, columns):
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append((column, op, value))
+        return self
+
+    def gt(self, column, value): return self._filter(column, lambda a, b: a > b, value)
+    def gte(self, column, value): return self._filter(column, lambda a, b: a >= b, value)
+    def lte(self, column, value): return self._filter(column, lambda a, b: a <= b, value)
+
+    def order(self, column):
+        return self
+
+    def limit(self, size):
+        self.size = size
+        return self
+
+    def execute(self):
+        # As linhas já estão em ordem de id_registro
+        rows = [r for r in self.rows if all(op(r[c], v) for c, op, v in self.filters)]
+        return SimpleNamespace(data=rows[:self.size])
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.by_id = {row['id_registro']: row for row in rows}
+
+    def upsert(self, rows):
+        self.by_id.update({row['id_registro']: row for row in rows})
+
+    def table(self, name):
+        return FakeQuery(sorted(self.by_id.values(), key=lambda r: r['id_registro']))
+
+def make_rows(count: int, coletas: int):
+    frame = make_produtos_frame(rows=count, days=20)
+    frame['id_registro'] = [f"{i:012d}" for i in range(count)]
+    frame['coleta_id'] = np.arange(count) % coletas + 1
+    frame['data_coleta'] = frame['data_coleta'] + 'T10:00:00'
+    frame['data_ultima_venda'] = frame['data_coleta']
+    frame['categoria'] = None
+    frame['unidade_medida'] = 'UN'
+    return frame.to_dict('records')
+
+def contents(store: HotPriceStore):
+    snapshot = store.current
+    frame = snapshot.frame(snapshot.mask(), ['id_registro', 'coleta_id', 'preco_produto'])
+    return sorted(frame.itertuples(index=False, name=None))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--coletas', type=int, default=10)
+    parser.add_argument('--retouch', type=float, default=0.2)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.coletas)
+    client = FakeSupabase([r for r in rows if r['coleta_id'] < args.coletas])
+    store = HotPriceStore()
+    store.load(client, args.coletas - 1)
+
+    # Última coleta: vendas novas + vendas antigas regravadas com o novo coleta_id
+    rng = np.random.default_rng(7)
+    previous = list(client.by_id.values())
+    retouched = [dict(previous[i], coleta_id=args.coletas) for i in rng.choice(len(previous), int(len(previous) * args.retouch), replace=False)]
+    client.upsert([r for r in rows if r['coleta_id'] == args.coletas] + retouched)
+    print(f"Registros: {len(client.by_id)}, coleta #{args.coletas}: {len(retouched)} vendas regravadas")
+
+    start = time.perf_counter()
+    store.sync(client, args.coletas)
+    sync_s = time.perf_counter() - start
+
+    full = HotPriceStore()
+    start = time.perf_counter()
+    full.load(client, args.coletas)
+    load_s = time.perf_counter() - start
+    print(f"carga completa: {load_s:.3f} s")
+    print(f"          sync: {sync_s:.3f} s  (speedup {load_s / sync_s:.1f}x)")
+
+    # Sem linhas duplicadas: uma linha por id_registro, o mesmo conteúdo da carga completa
+    ids = store.current.columns['id_registro']
+    assert len(store) == len(np.unique(ids)) == len(client.by_id)
+    assert contents(store) == contents(full)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_search_results.py - Pós-processamento da /api/search: pandas x heapq
+# Uso: python benchmarks/bench_search_results.py [--rows 500] [--repeat 2000]
+import argparse
+import time
+
+import pandas as pd
+
+from synthetic import make_produtos_frame
+from price_analytics import cheapest_search_results
+
+def legacy_search_results(rows):
+    """Reprodução do pipeline original (DataFrame + apply + sort + to_dict)"""
+    df = pd.DataFrame(rows)
+    df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
+    df.dropna(subset=['preco_produto'], inplace=True)
+    if not df.empty:
+        preco_medio = df['preco_produto'].mean()
+        df['status_preco'] = df['preco_produto'].apply(
+            lambda x: 'Barato' if x < preco_medio * 0.9 else ('Caro' if x > preco_medio * 1.1 else 'Na Média')
+        )
+    df = df.sort_values(by='preco_produto', ascending=True)
+    return df.head(100).to_dict(orient='records')
+
+def make_rows(count: int):
+    """Linhas no formato da resposta do PostgREST (preços como número, alguns nulos)"""
+    rows = make_produtos_frame(rows=count, products=50).to_dict('records')
+    for i, row in enumerate(rows):
+        row['supermercados'] = {'endereco': f"Rua {i % 12}"}
+        if i % 40 == 0:
+            row['preco_produto'] = None
+    return rows
+
+def timed(func, rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(rows)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"Resposta: {len(rows)} linhas")
+
+    legacy_ms, legacy = timed(legacy_search_results, rows, args.repeat)
+    lean_ms, lean = timed(cheapest_search_results, rows, args.repeat)
+    print(f"pandas: {legacy_ms:.3f} ms por busca")
+    print(f" heapq: {lean_ms:.3f} ms por busca  (speedup {legacy_ms / lean_ms:.1f}x)")
+
+    # Mesmos preços e classificações, na mesma ordem (linhas empatadas podem trocar de lugar)
+    assert [(r['preco_produto'], r['status_preco']) for r in lean] == [(r['preco_produto'], r['status_preco']) for r in legacy]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# benchmarks/bench_user_groups.py - /api/user-groups: três chamadas por associação x consulta com embeds
+# Uso: python benchmarks/bench_user_groups.py [--associations 10000] [--latency-ms 2] [--legacy-sample 300]
+# O banco é um substituto local do PostgREST/Auth em memória que dorme --latency-ms a cada chamada
+# (o custo dominante em produção é a ida e volta de rede, não o processamento).
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import synthetic  # noqa: F401  (ajusta o sys.path para a raiz do projeto)
+
+for _var, _value in (('SUPABASE_URL', 'http://localhost:54321'), ('SUPABASE_KEY', 'x.y.z'),
+                     ('SERVICE_ROLE_KEY', 'x.y.z'), ('ECONOMIZA_ALAGOAS_TOKEN', 'bench')):
+    os.environ.setdefault(_var, _value)
+
+import main
+from user_directory import UserDirectory
+
+MAX_ROWS = 1000  # max-rows do PostgREST: nenhuma resposta passa disso, com ou sem range/limit
+
+class FakeQuery:
+    """Subconjunto da API do postgrest-py usado pelas rotas (filtros, ordem, faixa, limite e embeds)"""
+    def __init__(self, db, table):
+        self.db, self.table, self.filters, self.orders = db, table, [], []
+        self.columns, self.count, self.bounds, self.max = '*', None, None, None
+
+    def select(self, columns='*', count=None):
+        self.columns, self.count = columns, count
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value): return self._filter(column, lambda a, b: a == b, value)
+    def gt(self, column, value): return self._filter(column, lambda a, b: a > b, value)
+    def gte(self, column, value): return self._filter(column, lambda a, b: a >= b, value)
+    def lt(self, column, value): return self._filter(column, lambda a, b: a < b, value)
+    def in_(self, column, values): return self._filter(column, lambda a, b: a in b, set(values))
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def limit(self, size):
+        self.max = size
+        return self
+
+    def _embed(self, row):
+        row = dict(row)
+        if 'grupos(' in self.columns:
+            grupo = self.db.by_id['grupos'].get(row['group_id'])
+            row['grupos'] = {'nome': grupo['nome'], 'dias_acesso': grupo['dias_acesso']} if grupo else None
+        return row
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        self.db.calls += 1
+        rows = [r for r in self.db.tables[self.table] if all(op(r[c], v) for c, op, v in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda r: r[column], reverse=desc)
+        total = len(rows)
+        if self.bounds:
+            rows = rows[self.bounds[0]:self.bounds[1] + 1]
+        rows = rows[:min(self.max or MAX_ROWS, MAX_ROWS)]
+        return SimpleNamespace(data=[self._embed(r) for r in rows], count=total if self.count else None)
+
+class FakeAdmin:
+    def __init__(self, db):
+        self.db = db
+
+    def get_user_by_id(self, user_id):
+        time.sleep(self.db.latency)
+        self.db.calls += 1
+        user = self.db.users.get(user_id)
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, email=user) if user else None)
+
+    def list_users(self, page=1, per_page=50):
+        time.sleep(self.db.latency)
+        self.db.calls += 1
+        ids = list(self.db.users)[(page - 1) * per_page:page * per_page]
+        return [SimpleNamespace(id=i, email=self.db.users[i]) for i in ids]
+
+class FakeSupabase:
+    def __init__(self, associations, users, groups, latency_ms, seed=7):
+        rng = random.Random(seed)
+        today = date.today()
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        user_ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(users)]
+        self.users = {uid: f"usuario{i}@exemplo.com" for i, uid in enumerate(user_ids)}
+        self.tables = {
+            'grupos': [{'id': g, 'nome': f"Grupo {g}", 'dias_acesso': 30 + g} for g in range(1, groups + 1)],
+            'profiles': [{'id': uid, 'full_name': f"Usuário {i}", 'role': 'user'} for i, uid in enumerate(user_ids)],
+            'user_groups': [
+                {
+                    'id': i + 1,
+                    'user_id': rng.choice(user_ids),
+                    'group_id': rng.randint(1, groups),
+                    'data_expiracao': (today + timedelta(days=rng.randint(-30, 90))).isoformat(),
+                    'created_at': (datetime(2026, 1, 1) + timedelta(minutes=i)).isoformat()
+                }
+                for i in range(associations)
+            ]
+        }
+        self.by_id = {name: {row['id']: row for row in rows} for name, rows in self.tables.items()}
+        self.auth = SimpleNamespace(admin=FakeAdmin(self))
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+async def legacy_list_user_groups(client, rows):
+    """Reprodução do laço original: grupos, perfil e email buscados por associação"""
+    details = []
+    for user_group in rows:
+        group_response = await asyncio.to_thread(
+            client.table('grupos').select('*').eq('id', user_group['group_id']).execute
+        )
+        grupo_data = group_response.data[0] if group_response.data else {'nome': 'Grupo Não Encontrado', 'dias_acesso': 0}
+        profile_response = await asyncio.to_thread(
+            client.table('profiles').select('full_name').eq('id', user_group['user_id']).execute
+        )
+        user_name = profile_response.data[0]['full_name'] if profile_response.data else 'N/A'
+        auth_response = await asyncio.to_thread(lambda: client.auth.admin.get_user_by_id(user_group['user_id']))
+        user_email = auth_response.user.email if auth_response.user else 'N/A'
+        details.append(main.UserGroupWithDetails(
+            id=user_group['id'], user_id=user_group['user_id'], group_id=user_group['group_id'],
+            data_expiracao=user_group['data_expiracao'], created_at=user_group['created_at'],
+            grupo_nome=grupo_data['nome'], grupo_dias_acesso=grupo_data['dias_acesso'],
+            user_name=user_name, user_email=user_email
+        ))
+    return details
+
+async def run(args):
+    client = FakeSupabase(args.associations, args.users, args.groups, args.latency_ms)
+    main.supabase_admin = client
+    main.user_directory = UserDirectory()
+    main.user_directory.configure(client)
+    print(f"Associações: {args.associations}, usuários: {args.users}, grupos: {args.groups}, latência: {args.latency_ms} ms/chamada")
+
+    ordered = client.table('user_groups').select('*').order('created_at', desc=True).order('id', desc=True).execute().data
+    sample = ordered[:args.legacy_sample]
+    client.calls = 0
+    start = time.perf_counter()
+    legacy = await legacy_list_user_groups(client, sample)
+    legacy_s = (time.perf_counter() - start) * args.associations / len(sample)
+    print(f"   laço original: ~{legacy_s:.1f} s (extrapolado de {len(sample)} linhas, {client.calls * args.associations // len(sample)} chamadas)")
+
+    async def timed(label, **params):
+        client.calls = 0
+        start = time.perf_counter()
+        result = await main.list_user_groups(**{'user_id': None, 'group_id': None, 'status': None, 'page': None,
+                                                'page_size': 50, 'admin_user': None, **params})
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {elapsed:.3f} s ({client.calls} chamadas, speedup {legacy_s / elapsed:.0f}x)")
+        return result
+
+    cold = await timed("embeds (diretório frio)")
+    await timed("embeds (diretório quente)")
+    page = await timed("embeds, 1ª página (50 linhas)", page=1)
+
+    # Lista completa (acima do limite de linhas por resposta), com o mesmo conteúdo e a mesma ordem do laço original
+    assert len(cold) == args.associations
+    assert [d.model_dump() for d in cold[:len(legacy)]] == [d.model_dump() for d in legacy]
+    assert page.total_count == args.associations and page.data == cold[:50]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--associations', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=3_000)
+    parser.add_argument('--groups', type=int, default=40)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    parser.add_argument('--legacy-sample', type=int, default=300)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
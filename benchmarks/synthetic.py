@@ -0,0 +1,41 @@
+# benchmarks/synthetic.py - Gerador de dados sintéticos no formato da tabela produtos
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Permite importar os módulos da raiz do projeto ao rodar `python benchmarks/<script>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_analytics import PRODUCT_CATEGORIES
+
+def make_produtos_frame(rows: int = 1_000_000, products: int = 2_000, markets: int = 12, days: int = 30, seed: int = 42) -> pd.DataFrame:
+    """Gera um DataFrame com as colunas usadas pelas rotas do dashboard"""
+    rng = np.random.default_rng(seed)
+    keywords = [kw for kws in PRODUCT_CATEGORIES.values() for kw in kws] + ['biscoito', 'pilha', 'vela']
+    product_names = np.array([f"{keywords[i % len(keywords)]} marca{i} {rng.integers(100, 2000)}g" for i in range(products)], dtype=object)
+    barcodes = np.array([f"789{i:010d}" for i in range(products)], dtype=object)
+    base_prices = rng.gamma(2.0, 8.0, size=products) + 1.0
+    market_names = np.array([f"Mercado {m}" for m in range(markets)], dtype=object)
+    market_cnpjs = np.array([f"{m:014d}" for m in range(markets)], dtype=object)
+    start = date.today() - timedelta(days=days - 1)
+    dates = np.array([(start + timedelta(days=d)).isoformat() for d in range(days)], dtype=object)
+
+    product_idx = rng.integers(0, products, size=rows)
+    market_idx = rng.integers(0, markets, size=rows)
+    date_idx = rng.integers(0, days, size=rows)
+    prices = np.round(base_prices[product_idx] * rng.normal(1.0, 0.08, size=rows), 2)
+
+    return pd.DataFrame({
+        'id_registro': np.arange(rows).astype(str),
+        'nome_produto': product_names[product_idx],
+        'nome_produto_normalizado': product_names[product_idx],
+        'codigo_barras': barcodes[product_idx],
+        'nome_supermercado': market_names[market_idx],
+        'cnpj_supermercado': market_cnpjs[market_idx],
+        'data_coleta': dates[date_idx],
+        'preco_produto': prices,
+        'tipo_unidade': 'UN',
+    })
@@ -4,8 +4,9 @@ import hashlib
 from datetime import datetime, timedelta
 import logging
 import time
-from typing import Dict, Any, List, Optional
-import unicodedata
+from typing import Dict, Any, List, Optional, Callable
+import pandas as pd
+from price_analytics import generate_price_alerts, categorize_product_name, normalize_product_name
 
 # --- Configurações Otimizadas ---
 ECONOMIZA_ALAGOAS_API_URL = 'http://api.sefaz.al.gov.br/sfz-economiza-alagoas-api/api/public/produto/pesquisa'
@@ -14,6 +15,8 @@ RETRY_MAX = 3
 RETRY_BASE_MS = 2000
 CONCORRENCIA_PRODUTOS = 4
 TIMEOUT_POR_MERCADO_SEGUNDOS = 20 * 60
+PAGINA_SUPABASE = 1000
+COLUNAS_ALERTA = 'nome_produto_normalizado, nome_supermercado, codigo_barras, preco_produto'
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
 
@@ -22,14 +25,6 @@ def normalizar_texto(txt: str) -> str:
     if not txt: return ""
     return txt.lower().strip()
 
-def remover_acentos(texto: str) -> str:
-    """Remove acentos e caracteres especiais do texto"""
-    if not texto: return ""
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', texto)
-        if unicodedata.category(c) != 'Mn'
-    ).lower()
-
 def gerar_id_registro(item: Dict[str, Any]) -> str:
     h = hashlib.sha1()
     h.update(f"{item.get('cnpj_supermercado')}|{item.get('id_produto')}|{item.get('preco_produto')}|{item.get('data_ultima_venda')}".encode('utf-8'))
@@ -43,6 +38,104 @@ def detectar_tipo_unidade(nome_produto: str, unidade_medida_api: str) -> str:
         if palavra in nome_lower or palavra in unidade_lower: return 'KG'
     return 'UN'
 
+def buscar_paginado(query_factory, tamanho_pagina: int = PAGINA_SUPABASE) -> List[Dict[str, Any]]:
+    """Lê todas as linhas de uma consulta em páginas (o PostgREST limita o tamanho de cada resposta)"""
+    linhas = []
+    inicio = 0
+    while True:
+        pagina = query_factory().range(inicio, inicio + tamanho_pagina - 1).execute().data or []
+        linhas.extend(pagina)
+        if len(pagina) < tamanho_pagina:
+            return linhas
+        inicio += tamanho_pagina
+
+# --- Ganchos de Pós-Coleta ---
+# Funções (síncronas ou assíncronas) chamadas com o coleta_id sempre que uma
+# coleta termina com sucesso: caches, índices e snapshots se atualizam por aqui.
+_GANCHOS_POS_COLETA: List[Callable[[int], Any]] = []
+
+def registrar_gancho_pos_coleta(gancho: Callable[[int], Any]) -> Callable[[int], Any]:
+    """Registra um gancho executado ao fim de cada coleta concluída (pode ser usado como decorator)"""
+    _GANCHOS_POS_COLETA.append(gancho)
+    return gancho
+
+async def executar_ganchos_pos_coleta(coleta_id: int):
+    for gancho in _GANCHOS_POS_COLETA:
+        try:
+            resultado = gancho(coleta_id)
+            if asyncio.iscoroutine(resultado):
+                await resultado
+        except Exception as e:
+            logging.error(f"Erro no gancho pós-coleta {getattr(gancho, '__name__', gancho)} (coleta #{coleta_id}): {e}")
+
+# --- Pós-processamento da Coleta ---
+def _dataframe_precos(linhas: List[Dict[str, Any]]) -> pd.DataFrame:
+    df = pd.DataFrame(linhas)
+    if df.empty:
+        return df
+    df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
+    return df.dropna(subset=['preco_produto'])
+
+COLETAS_ANTERIORES_PAGINA = 50
+
+def _coletas_anteriores_por_mercado(supabase_client: Any, coleta_id: int, cnpjs: List[str]) -> Dict[int, List[str]]:
+    """Para cada CNPJ, a última coleta concluída anterior que incluiu o mercado (coleta_id -> CNPJs)"""
+    pendentes = set(cnpjs)
+    por_coleta: Dict[int, List[str]] = {}
+    ultimo_id = coleta_id
+    while pendentes:
+        coletas = supabase_client.table('coletas').select('id, mercados_selecionados') \
+            .eq('status', 'concluida').lt('id', ultimo_id) \
+            .order('id', desc=True).limit(COLETAS_ANTERIORES_PAGINA).execute().data or []
+        for coleta in coletas:
+            # mercados_selecionados nulo = coleta de todos os mercados
+            mercados = coleta.get('mercados_selecionados')
+            cobertos = set(pendentes) if not mercados else pendentes & set(mercados)
+            if cobertos:
+                por_coleta[coleta['id']] = sorted(cobertos)
+                pendentes -= cobertos
+            if not pendentes:
+                break
+        if len(coletas) < COLETAS_ANTERIORES_PAGINA:
+            break
+        ultimo_id = coletas[-1]['id']
+    return por_coleta
+
+def gerar_alertas_pos_coleta(supabase_client: Any, coleta_id: int, cnpjs: List[str]) -> List[Dict[str, Any]]:
+    """Compara os preços desta coleta com a última coleta concluída de cada mercado"""
+    anteriores = _coletas_anteriores_por_mercado(supabase_client, coleta_id, cnpjs)
+    if not anteriores:
+        return []
+
+    def consulta(id_coleta, cnpjs_coleta):
+        return lambda: supabase_client.table('produtos').select(COLUNAS_ALERTA) \
+            .eq('coleta_id', id_coleta).in_('cnpj_supermercado', cnpjs_coleta).order('id_registro')
+
+    # Só os mercados que têm referência anterior entram nos dois lados da comparação
+    comparaveis = sorted({cnpj for cnpjs_coleta in anteriores.values() for cnpj in cnpjs_coleta})
+    atual = _dataframe_precos(buscar_paginado(consulta(coleta_id, comparaveis)))
+    previa = _dataframe_precos([
+        linha
+        for id_anterior, cnpjs_coleta in anteriores.items()
+        for linha in buscar_paginado(consulta(id_anterior, cnpjs_coleta))
+    ])
+    return generate_price_alerts(atual, previa)
+
+# --- Compatibilidade de Esquema ---
+# A coluna produtos.categoria vem de sql/001; sem ela o upsert falharia inteiro.
+_COLUNA_CATEGORIA_DISPONIVEL = True
+
+def _coluna_inexistente(erro: Exception, coluna: str) -> bool:
+    """Erro do PostgREST para coluna desconhecida (PGRST204 / 42703) que menciona a coluna"""
+    mensagem = str(erro)
+    return coluna in mensagem and ('PGRST204' in mensagem or '42703' in mensagem or 'column' in mensagem.lower())
+
+def desativar_coluna_categoria(erro: Exception):
+    global _COLUNA_CATEGORIA_DISPONIVEL
+    if _COLUNA_CATEGORIA_DISPONIVEL:
+        logging.warning(f"Coluna produtos.categoria indisponível (aplique sql/001_produtos_categoria.sql); gravando sem ela: {erro}")
+    _COLUNA_CATEGORIA_DISPONIVEL = False
+
 # --- Lógica Principal de Coleta ---
 async def consultar_produto(produto: str, mercado: Dict[str, str], data_coleta: str, token: str, coleta_id: int, dias_pesquisa: int = 3) -> List[Dict[str, Any]]:
     cnpj = mercado['cnpj']
@@ -84,6 +177,7 @@ async def consultar_produto(produto: str, mercado: Dict[str, str], data_coleta:
                     'preco_produto': venda_info.get('valorVenda'), 'unidade_medida': unidade_medida_original,
                     'data_ultima_venda': venda_info.get('dataVenda'), 'data_coleta': data_coleta, 
                     'codigo_barras': prod_info.get('gtin'), 'tipo_unidade': detectar_tipo_unidade(nome_produto_original, unidade_medida_original),
+                    'categoria': categorize_product_name(nome_produto_original),
                     'coleta_id': coleta_id
                 }
                 if registro['preco_produto'] is not None:
@@ -126,9 +220,19 @@ async def coletar_dados_mercado(mercado: Dict[str, Any], token: str, supabase_cl
     logging.info(f"COLETA PARA '{mercado['nome']}': {len(resultados_finais)} brutos -> {len(resultados_unicos_lista)} únicos. (Dias: {dias_pesquisa})")
     
     if resultados_unicos_lista:
-        dados_para_db = [{k: v for k, v in item.items() if k != 'id_produto'} for item in resultados_unicos_lista]
+        colunas_omitidas = {'id_produto'} if _COLUNA_CATEGORIA_DISPONIVEL else {'id_produto', 'categoria'}
+        dados_para_db = [{k: v for k, v in item.items() if k not in colunas_omitidas} for item in resultados_unicos_lista]
         try:
-            supabase_client.table('produtos').upsert(dados_para_db, on_conflict='id_registro').execute()
+            try:
+                supabase_client.table('produtos').upsert(dados_para_db, on_conflict='id_registro').execute()
+            except Exception as e:
+                if 'categoria' not in colunas_omitidas and _coluna_inexistente(e, 'categoria'):
+                    # sql/001 ainda não aplicado: grava sem a categoria em vez de perder a coleta
+                    desativar_coluna_categoria(e)
+                    dados_para_db = [{k: v for k, v in item.items() if k != 'categoria'} for item in dados_para_db]
+                    supabase_client.table('produtos').upsert(dados_para_db, on_conflict='id_registro').execute()
+                else:
+                    raise
             registros_salvos = len(dados_para_db)
             logging.info(f"-----> SUPABASE SUCESSO: {registros_salvos} salvos para {mercado['nome']}.")
         except Exception as e:
@@ -309,7 +413,7 @@ async def run_full_collection(
         ]
         
         # Aplicar remoção de acentos em todos os produtos
-        NOMES_PRODUTOS_SEM_ACENTOS = [remover_acentos(produto) for produto in NOMES_PRODUTOS]
+        NOMES_PRODUTOS_SEM_ACENTOS = [normalize_product_name(produto) for produto in NOMES_PRODUTOS]
         
         # Atualizar status tracker
         status_tracker.update({
@@ -353,11 +457,22 @@ async def run_full_collection(
             'total_registros': total_registros_salvos
         }).eq('id', coleta_id).execute()
         
+        # Alertas de preço em relação à coleta anterior (não invalida a coleta se falhar)
+        try:
+            alertas = await asyncio.to_thread(
+                gerar_alertas_pos_coleta, supabase_client, coleta_id, [m['cnpj'] for m in MERCADOS]
+            )
+            status_tracker['report']['priceAlerts'] = alertas
+            logging.info(f"Coleta #{coleta_id}: {len(alertas)} alertas de preço gerados.")
+        except Exception as e:
+            logging.error(f"Erro ao gerar alertas de preço da coleta #{coleta_id}: {e}")
+        
         status_tracker.update({ 
             'status': 'COMPLETED', 
             'progresso': f'Coleta #{coleta_id} finalizada! {total_registros_salvos} registros - {dias_pesquisa} dias'
         })
         logging.info(f"Processo de coleta #{coleta_id} completo. Registros: {total_registros_salvos}, Dias: {dias_pesquisa}")
+        await executar_ganchos_pos_coleta(coleta_id)
 
     except Exception as e:
         logging.error(f"ERRO CRÍTICO na coleta: {e}")
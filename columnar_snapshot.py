@@ -0,0 +1,215 @@
+# columnar_snapshot.py - Exportação colunar (Parquet/Arrow) e snapshot local de produtos
+# Os tipos são fixados num schema Arrow (preço float, datas timestamp, códigos de
+# barras como texto). O snapshot é um arquivo Arrow IPC lido com memory map.
+
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from datetime import date, datetime, timedelta, timezone
+import io
+import logging
+import os
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# --------------------------------------------------------------------------
+# --- CONFIGURAÇÃO E CONSTANTES ---
+# --------------------------------------------------------------------------
+
+SNAPSHOT_PATH = os.getenv("PRODUTOS_SNAPSHOT_PATH", os.path.join("data", "produtos_snapshot.arrow"))
+SNAPSHOT_MAX_AGE_HOURS = int(os.getenv("PRODUTOS_SNAPSHOT_MAX_AGE_HOURS", "24"))
+SNAPSHOT_PAGE_SIZE = 1000
+PARQUET_SPOOL_BYTES = 64 * 1024 * 1024  # acima disso o parquet em montagem vai para disco
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Datas sem fuso vindas do banco são tratadas como UTC
+PRODUTOS_SCHEMA = pa.schema([
+    ('id_registro', pa.string()),
+    ('nome_produto', pa.string()),
+    ('nome_produto_normalizado', pa.string()),
+    ('categoria', pa.string()),
+    ('codigo_barras', pa.string()),
+    ('preco_produto', pa.float64()),
+    ('unidade_medida', pa.string()),
+    ('tipo_unidade', pa.string()),
+    ('nome_supermercado', pa.string()),
+    ('cnpj_supermercado', pa.string()),
+    ('data_ultima_venda', pa.timestamp('us', tz='UTC')),
+    ('data_coleta', pa.timestamp('us', tz='UTC')),
+    ('coleta_id', pa.int64()),
+])
+
+COLUMNAR_COLUMNS = PRODUTOS_SCHEMA.names
+
+COLUMNAR_MEDIA_TYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+# --------------------------------------------------------------------------
+# --- CONVERSÃO ---
+# --------------------------------------------------------------------------
+
+def records_to_batch(records: List[Dict[str, Any]]) -> pa.RecordBatch:
+    """Converte registros do PostgREST num RecordBatch com o schema de produtos"""
+    df = pd.DataFrame.from_records(records, columns=COLUMNAR_COLUMNS)
+    arrays = []
+    for field in PRODUTOS_SCHEMA:
+        column = df[field.name]
+        if pa.types.is_timestamp(field.type):
+            column = pd.to_datetime(column, format='ISO8601', utc=True, errors='coerce')
+        elif pa.types.is_floating(field.type):
+            column = pd.to_numeric(column, errors='coerce')
+        elif pa.types.is_integer(field.type):
+            column = pd.to_numeric(column, errors='coerce').astype('Int64')
+        else:
+            column = column.map(lambda v: None if v is None or v != v else str(v))
+        arrays.append(pa.array(column, type=field.type, from_pandas=True))
+    return pa.RecordBatch.from_arrays(arrays, schema=PRODUTOS_SCHEMA)
+
+async def batches_from_pages(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[pa.RecordBatch]:
+    async for page in pages:
+        yield records_to_batch(page)
+
+async def batches_from_table(table: pa.Table, max_chunksize: int = 64_000) -> AsyncIterator[pa.RecordBatch]:
+    for batch in table.to_batches(max_chunksize=max_chunksize):
+        yield batch
+
+# --------------------------------------------------------------------------
+# --- EXPORTAÇÃO EM STREAMING ---
+# --------------------------------------------------------------------------
+
+async def arrow_stream_chunks(batches: AsyncIterator[pa.RecordBatch]) -> AsyncIterator[bytes]:
+    """Formato Arrow IPC stream: cada lote é enviado assim que fica pronto"""
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, PRODUTOS_SCHEMA)
+    async for batch in batches:
+        writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+async def parquet_chunks(batches: AsyncIterator[pa.RecordBatch]) -> AsyncIterator[bytes]:
+    """Parquet só fica válido com o rodapé, então os row groups vão para um arquivo temporário"""
+    with tempfile.SpooledTemporaryFile(max_size=PARQUET_SPOOL_BYTES) as spool:
+        writer = pq.ParquetWriter(spool, PRODUTOS_SCHEMA, compression='zstd')
+        async for batch in batches:
+            writer.write_batch(batch)
+        writer.close()
+        spool.seek(0)
+        while True:
+            chunk = spool.read(DOWNLOAD_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+# --------------------------------------------------------------------------
+# --- SNAPSHOT LOCAL ---
+# --------------------------------------------------------------------------
+
+def build_snapshot(supabase_client, ultima_coleta_id: Optional[int], path: str = SNAPSHOT_PATH) -> Dict[str, Any]:
+    """Grava a tabela produtos inteira num arquivo Arrow IPC (troca atômica ao final).
+    ultima_coleta_id é a última coleta concluída quando a leitura começou; fica gravada nos
+    metadados como marcador de consistência (não é derivada dos dados: coletas com falha
+    também gravam produtos, e a limpeza de dados pode remover os da última coleta)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    total = 0
+    metadata = {b'gerado_em': datetime.now(timezone.utc).isoformat().encode()}
+    if ultima_coleta_id is not None:
+        metadata[b'ultima_coleta_id'] = str(ultima_coleta_id).encode()
+
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, PRODUTOS_SCHEMA.with_metadata(metadata)) as writer:
+            # Paginação por chave (id_registro > último lido): custo constante por página
+            last_id = None
+            while True:
+                query = supabase_client.table('produtos').select(', '.join(COLUMNAR_COLUMNS))
+                if last_id is not None:
+                    query = query.gt('id_registro', last_id)
+                page = query.order('id_registro').limit(SNAPSHOT_PAGE_SIZE).execute().data or []
+                if page:
+                    batch = records_to_batch(page)
+                    writer.write_batch(batch)
+                    total += batch.num_rows
+                if len(page) < SNAPSHOT_PAGE_SIZE:
+                    break
+                last_id = page[-1]['id_registro']
+
+    os.replace(tmp_path, path)
+    logging.info(f"Snapshot colunar de produtos gravado em {path}: {total} registros (coleta #{ultima_coleta_id})")
+    return {'path': path, 'total_registros': total, 'ultima_coleta_id': ultima_coleta_id}
+
+class ProdutosSnapshot:
+    """Leitura do snapshot via memory map, recarregada quando o arquivo muda"""
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._table: Optional[pa.Table] = None
+        self._mtime: Optional[float] = None
+        self._ultima_coleta_id: Optional[int] = None
+
+    def table(self) -> Optional[pa.Table]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if self._table is None or mtime != self._mtime:
+            source = pa.memory_map(self.path, 'r')
+            self._table = pa.ipc.open_file(source).read_all()
+            self._mtime = mtime
+            marker = (self._table.schema.metadata or {}).get(b'ultima_coleta_id')
+            self._ultima_coleta_id = int(marker) if marker else None
+        return self._table
+
+    def discard(self):
+        """Remove o snapshot (dados alterados fora de uma coleta); será regerado"""
+        self._table = None
+        self._mtime = None
+        self._ultima_coleta_id = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def is_stale(self, max_age_hours: int = SNAPSHOT_MAX_AGE_HOURS) -> bool:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return True
+        # Arquivo sem o marcador da coleta (gerado por uma versão anterior): nunca fica consistente
+        if self.ultima_coleta_id() is None:
+            return True
+        return datetime.now() - datetime.fromtimestamp(mtime) > timedelta(hours=max_age_hours)
+
+    def ultima_coleta_id(self) -> Optional[int]:
+        self.table()
+        return self._ultima_coleta_id
+
+    def info(self) -> Dict[str, Any]:
+        table = self.table()
+        if table is None:
+            return {'disponivel': False, 'path': self.path}
+        metadata = table.schema.metadata or {}
+        return {
+            'disponivel': True,
+            'path': self.path,
+            'total_registros': table.num_rows,
+            'ultima_coleta_id': self.ultima_coleta_id(),
+            'gerado_em': metadata.get(b'gerado_em', b'').decode() or None,
+            'tamanho_bytes': os.path.getsize(self.path)
+        }
+
+def filter_produtos_table(table: pa.Table, start_date: date, end_date: date, cnpjs: Optional[Iterable[str]] = None) -> pa.Table:
+    """Mesmo recorte de get_date_range_data (data_coleta entre start_date e end_date 00:00)"""
+    start = pa.scalar(datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc), type=PRODUTOS_SCHEMA.field('data_coleta').type)
+    end = pa.scalar(datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc), type=PRODUTOS_SCHEMA.field('data_coleta').type)
+    mask = pc.and_(pc.greater_equal(table['data_coleta'], start), pc.less_equal(table['data_coleta'], end))
+    if cnpjs and list(cnpjs) != ['all']:
+        mask = pc.and_(mask, pc.is_in(table['cnpj_supermercado'], value_set=pa.array(list(cnpjs), type=pa.string())))
+    return table.filter(mask)
+
+# Instância global usada pelas rotas
+produtos_snapshot = ProdutosSnapshot()
@@ -14,13 +14,27 @@ import random
 from collections import defaultdict, Counter
 import statistics
 from scipy import stats
-from sklearn.cluster import DBSCAN
-from sklearn.preprocessing import StandardScaler
 import warnings
 warnings.filterwarnings('ignore')
 
 # Importar dependências compartilhadas
-from dependencies import get_current_user, UserProfile, require_page_access, supabase, supabase_admin
+from dependencies import get_current_user, UserProfile, require_page_access, supabase, supabase_admin, DataCache, fetch_all_rows
+import collector_service
+from price_analytics import (
+    PRODUCT_CATEGORIES, PRICE_ALERT_THRESHOLD, compute_advanced_metrics, generate_price_alerts,
+    ensure_categories, detect_price_anomalies, ANOMALY_MIN_GROUP_SIZE,
+    build_price_matrix, price_matrix_to_cells, price_matrix_to_columnar
+)
+from report_builders import calculate_advanced_metrics, build_comprehensive_report, report_from_aggregates, build_export, to_json_bytes, EXPORT_COLUMNS
+from analytics_engine import analytics_engine
+from hot_store import hot_store
+from product_index import product_index, pairs_from_snapshot
+from streaming_export import open_pages, csv_chunks, ndjson_chunks, streaming_export_response
+from columnar_snapshot import (
+    COLUMNAR_COLUMNS, COLUMNAR_MEDIA_TYPES, produtos_snapshot, build_snapshot,
+    filter_produtos_table, batches_from_pages, batches_from_table, arrow_stream_chunks, parquet_chunks
+)
+from report_jobs import report_jobs
 
 # Criar router específico para dashboard
 dashboard_router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
@@ -99,12 +113,32 @@ class TimeRangeRequest(BaseModel):
     cnpjs: Optional[List[str]] = None
     category: Optional[str] = None
 
+class ReportJobRequest(BaseModel):
+    tipo: str = Field(..., pattern='^(comprehensive-report|export)$')
+    start_date: date
+    end_date: date
+    cnpjs: Optional[List[str]] = None
+    export_type: str = Field('csv', pattern='^(csv|json|xlsx)$')
+
+class ReportJobStatus(BaseModel):
+    id: str
+    tipo: str
+    status: str
+    cache_hit: bool
+    erro: Optional[str]
+    criado_em: str
+    finalizado_em: Optional[str]
+    download_url: Optional[str]
+
 class ProductBarcodeAnalysisRequest(BaseModel):
     start_date: date
     end_date: date
     product_barcodes: List[str] = Field(..., max_items=5)
     markets_cnpj: List[str] = Field(..., max_items=10)
-    analysis_type: str = Field("price", regex="^(price|comparison|trend)$")
+    analysis_type: str = Field("price", pattern="^(price|comparison|trend)$")
+    anomaly_method: str = Field("zscore", pattern="^(zscore|mad|iqr)$")
+    anomaly_min_group_size: int = Field(ANOMALY_MIN_GROUP_SIZE, ge=2, le=1000)
+    matrix_format: str = Field("cells", pattern="^(cells|columnar)$", description="cells = dict por célula; columnar = arrays de datas e preços")
 
 class MarketInfo(BaseModel):
     cnpj: str
@@ -112,6 +146,7 @@ class MarketInfo(BaseModel):
     endereco: Optional[str]
     total_produtos: int
     ultima_coleta: Optional[str]
+    dias_coletados: int = 0
 
 class AdvancedMetrics(BaseModel):
     inflacao_mensal: float
@@ -136,36 +171,34 @@ class PriceAlert(BaseModel):
 # --- CONFIGURAÇÃO E CONSTANTES ---
 # --------------------------------------------------------------------------
 
-# Categorias para análise
-PRODUCT_CATEGORIES = {
-    'Alimentos Básicos': ['arroz', 'feijao', 'acucar', 'oleo', 'farinha', 'macarrao', 'sal', 'fuba'],
-    'Carnes': ['carne', 'frango', 'peixe', 'bovina', 'suina', 'linguica', 'bacon', 'file', 'contra'],
-    'Laticínios': ['leite', 'queijo', 'manteiga', 'iogurte', 'requeijao', 'coalhada', 'creme', 'ninho'],
-    'Hortifruti': ['fruta', 'verdura', 'legume', 'alface', 'tomate', 'cebola', 'batata', 'cenoura', 'banana'],
-    'Bebidas': ['refrigerante', 'suco', 'agua', 'cerveja', 'vinho', 'cafe', 'cha', 'energetico'],
-    'Limpeza': ['sabao', 'detergente', 'desinfetante', 'alcool', 'agua sanitaria', 'amaciante', 'multiuso'],
-    'Higiene': ['shampoo', 'sabonete', 'pasta dental', 'papel higienico', 'desodorante', 'condicionador'],
-    'Padaria': ['pao', 'bolo', 'bisnaguinha', 'rosquinha', 'torrada', 'croissant', 'baguete'],
-    'Enlatados': ['conserva', 'sardinha', 'milho', 'ervilha', 'seleta', 'atum', 'molho'],
-    'Grãos': ['lentilha', 'grao', 'ervilha', 'milho', 'soja', 'trigo', 'aveia'],
-    'Outros': []
-}
-
 # Configurações de análise
 VOLATILITY_THRESHOLD = 0.15  # 15% de volatilidade
 BARGAIN_THRESHOLD = 0.10     # 10% de economia mínima
-PRICE_ALERT_THRESHOLD = 0.08 # 8% de variação para alerta
+
+# Caches invalidados ao fim de cada coleta (o TTL cobre os demais workers)
+MARKET_STATS_TTL = 3600
+market_stats_cache = DataCache(ttl_seconds=MARKET_STATS_TTL)
+available_dates_cache = DataCache(ttl_seconds=MARKET_STATS_TTL)
+summary_cache = DataCache(ttl_seconds=MARKET_STATS_TTL)
 
 # --------------------------------------------------------------------------
 # --- FUNÇÕES AUXILIARES PARA ANÁLISE DE DADOS AVANÇADA ---
 # --------------------------------------------------------------------------
 
-async def get_date_range_data(start_date: date, end_date: date, cnpjs: Optional[List[str]] = None) -> List[Dict]:
+async def get_date_range_data(start_date: date, end_date: date, cnpjs: Optional[List[str]] = None) -> pd.DataFrame:
     """Obtém dados do período especificado com cache inteligente"""
     try:
         cache_key = f"data_{start_date}_{end_date}_{hash(str(cnpjs))}"
         # Em produção, implementar cache Redis aqui
         
+        if not await is_range_available(start_date, end_date):
+            return pd.DataFrame()
+        
+        # Janela recente em memória: sem ida ao banco e sem montar um dict por linha
+        if await hot_store_covers(start_date):
+            snapshot = hot_store.current
+            return snapshot.frame(snapshot.mask(start_date, end_date, cnpjs))
+        
         query = supabase.table('produtos').select('*')
         
         # Aplicar filtros
@@ -175,10 +208,10 @@ async def get_date_range_data(start_date: date, end_date: date, cnpjs: Optional[
             query = query.in_('cnpj_supermercado', cnpjs)
                 
         response = await asyncio.to_thread(query.execute)
-        return response.data or []
+        return pd.DataFrame(response.data or [])
     except Exception as e:
         logging.error(f"Erro ao buscar dados do período: {e}")
-        return []
+        return pd.DataFrame()
 
 async def get_complete_market_data() -> List[Dict]:
     """Obtém dados completos de mercados"""
@@ -208,133 +241,40 @@ async def get_collection_data(start_date: date, end_date: date) -> List[Dict]:
         logging.error(f"Erro ao buscar dados de coletas: {e}")
         return []
 
-def calculate_advanced_metrics(df: pd.DataFrame) -> Dict[str, Any]:
-    """Calcula métricas avançadas usando estatística e machine learning"""
-    if df.empty:
-        return {}
-    
-    metrics = {}
-    
-    # Análise de volatilidade
-    prices = df['preco_produto'].dropna()
-    if len(prices) > 1:
-        metrics['volatilidade'] = prices.std() / prices.mean()
-        metrics['assimetria'] = stats.skew(prices)
-        metrics['curtose'] = stats.kurtosis(prices)
-    else:
-        metrics['volatilidade'] = 0
-        metrics['assimetria'] = 0
-        metrics['curtose'] = 0
-    
-    # Detecção de outliers usando IQR
-    Q1 = prices.quantile(0.25)
-    Q3 = prices.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    
-    outliers = prices[(prices < lower_bound) | (prices > upper_bound)]
-    metrics['outliers_count'] = len(outliers)
-    metrics['outliers_percent'] = (len(outliers) / len(prices)) * 100
-    
-    # Clusterização de preços (simplificada)
-    if len(prices) > 10:
-        try:
-            price_values = prices.values.reshape(-1, 1)
-            scaler = StandardScaler()
-            prices_scaled = scaler.fit_transform(price_values)
-            
-            # DBSCAN para detectar clusters de preços
-            clustering = DBSCAN(eps=0.5, min_samples=5).fit(prices_scaled)
-            metrics['price_clusters'] = len(set(clustering.labels_)) - (1 if -1 in clustering.labels_ else 0)
-        except:
-            metrics['price_clusters'] = 1
-    
-    return metrics
-
-def detect_price_anomalies(df: pd.DataFrame) -> List[Dict]:
-    """Detecta anomalias de preço usando métodos estatísticos"""
-    anomalies = []
-    
-    if df.empty or 'preco_produto' not in df.columns:
-        return anomalies
-    
-    # Agrupar por produto e mercado
-    grouped = df.groupby(['nome_produto_normalizado', 'nome_supermercado'])
-    
-    for (produto, mercado), group in grouped:
-        if len(group) < 5:  # Mínimo de pontos para análise
-            continue
-            
-        prices = group['preco_produto'].dropna()
-        if len(prices) < 2:
-            continue
-        
-        # Z-score para detecção de outliers
-        z_scores = np.abs(stats.zscore(prices))
-        outlier_indices = np.where(z_scores > 2.5)[0]
-        
-        for idx in outlier_indices:
-            if idx < len(group):
-                row = group.iloc[idx]
-                anomalies.append({
-                    'produto': produto,
-                    'mercado': mercado,
-                    'preco': row['preco_produto'],
-                    'data': row['data_coleta'],
-                    'z_score': z_scores[idx],
-                    'tipo': 'OUTLIER'
-                })
+async def fetch_market_stats() -> Dict[str, Dict[str, Any]]:
+    """Estatísticas por CNPJ (total de registros, última coleta, dias distintos) agregadas no banco"""
+    try:
+        response = await asyncio.to_thread(supabase.rpc('get_market_stats', {}).execute)
+        return {row['cnpj_supermercado']: row for row in response.data or []}
+    except Exception as e:
+        logging.warning(f"RPC get_market_stats indisponível, agregando localmente: {e}")
     
-    return anomalies
-
-def calculate_price_elasticity(df: pd.DataFrame) -> Dict[str, float]:
-    """Calcula elasticidade-preço aproximada por categoria"""
-    elasticity = {}
+    products_response = await asyncio.to_thread(
+        supabase.table('produtos')
+        .select('cnpj_supermercado, data_coleta')
+        .execute
+    )
     
-    for categoria, produtos in PRODUCT_CATEGORIES.items():
-        cat_products = df[df['nome_produto_normalizado'].str.contains('|'.join(produtos), case=False, na=False)]
-        
-        if len(cat_products) < 10:
-            continue
-            
-        # Agrupar por data e calcular preço médio
-        daily_prices = cat_products.groupby('data_coleta')['preco_produto'].mean()
-        
-        if len(daily_prices) > 5:
-            # Calcular variação percentual (simplificado)
-            price_changes = daily_prices.pct_change().dropna()
-            if len(price_changes) > 0:
-                # Elasticidade aproximada (em produção, usar dados de quantidade)
-                elasticity[categoria] = price_changes.mean()
+    grouped = defaultdict(lambda: {'total_produtos': 0, 'dates': set()})
+    for product in products_response.data or []:
+        stats_entry = grouped[product.get('cnpj_supermercado')]
+        stats_entry['total_produtos'] += 1
+        stats_entry['dates'].add(product.get('data_coleta'))
     
-    return elasticity
+    return {
+        cnpj: {
+            'cnpj_supermercado': cnpj,
+            'total_produtos': entry['total_produtos'],
+            'ultima_coleta': max(entry['dates']) if entry['dates'] else None,
+            'dias_coletados': len({str(d)[:10] for d in entry['dates'] if d})
+        }
+        for cnpj, entry in grouped.items()
+    }
 
-async def categorize_products_advanced(products: List[Dict]) -> Dict[str, List[Dict]]:
-    """Categorização avançada de produtos usando múltiplos critérios"""
-    categorized = {category: [] for category in PRODUCT_CATEGORIES.keys()}
-    categorized['Outros'] = []
-    
-    for product in products:
-        product_name = product.get('nome_produto', '').lower()
-        categorized_flag = False
-        
-        for category, keywords in PRODUCT_CATEGORIES.items():
-            if any(keyword in product_name for keyword in keywords):
-                categorized[category].append(product)
-                categorized_flag = True
-                break
-        
-        if not categorized_flag:
-            # Tentativa de categorização por similaridade
-            if any(word in product_name for word in ['molho', 'ketchup', 'mostarda', 'maionese']):
-                categorized['Enlatados'].append(product)
-            elif any(word in product_name for word in ['biscoito', 'bolacha', 'salgado', 'snack']):
-                categorized['Outros'].append(product)  # Poderia ser uma nova categoria "Snacks"
-            else:
-                categorized['Outros'].append(product)
-    
-    return categorized
+@collector_service.registrar_gancho_pos_coleta
+async def refresh_market_stats(coleta_id: int):
+    """Recalcula as estatísticas por mercado assim que uma coleta termina"""
+    await market_stats_cache.refresh('market_stats', fetch_market_stats)
 
 def calculate_trend_analysis(df: pd.DataFrame) -> Dict[str, Any]:
     """Análise de tendências usando regressão linear"""
@@ -364,29 +304,171 @@ def calculate_trend_analysis(df: pd.DataFrame) -> Dict[str, Any]:
     
     return {}
 
+async def fetch_collection_dates() -> Dict[str, Any]:
+    """Índice de datas com dados, derivado das coletas concluídas (uma linha por coleta)"""
+    def concluded_coletas(columns: str):
+        return supabase.table('coletas').select(columns).eq('status', 'concluida').gt('total_registros', 0)
+    
+    # Todas as coletas, página a página (limite de 1000 linhas do PostgREST); a última vem
+    # de uma consulta própria, pois é o marcador de consistência do snapshot e da janela em memória
+    coletas, latest = await asyncio.gather(
+        asyncio.to_thread(fetch_all_rows, lambda: concluded_coletas('id, iniciada_em, finalizada_em')),
+        asyncio.to_thread(concluded_coletas('id').order('id', desc=True).limit(1).execute)
+    )
+    
+    # data_coleta é gravada durante a execução, então cada coleta cobre de iniciada_em até finalizada_em
+    dates = set()
+    for coleta in coletas:
+        inicio = datetime.fromisoformat(coleta['iniciada_em']).date()
+        fim = datetime.fromisoformat(coleta['finalizada_em']).date() if coleta.get('finalizada_em') else inicio
+        dates.update(inicio + timedelta(days=offset) for offset in range((fim - inicio).days + 1))
+    
+    ordered = sorted(dates, reverse=True)
+    return {
+        'dates': ordered,
+        'min_date': ordered[-1] if ordered else None,
+        'max_date': ordered[0] if ordered else None,
+        'total_coletas': len(coletas),
+        'ultima_coleta_id': latest.data[0]['id'] if latest.data else None
+    }
+
+async def get_collection_date_index() -> Dict[str, Any]:
+    return await available_dates_cache.get('available_dates', fetch_collection_dates)
+
+@collector_service.registrar_gancho_pos_coleta
+async def refresh_collection_dates(coleta_id: int):
+    """Inclui as datas da coleta recém-concluída no índice"""
+    await available_dates_cache.refresh('available_dates', fetch_collection_dates)
+    summary_cache.clear()
+
+def invalidate_collection_caches():
+    """Descarta os caches derivados das coletas (após exclusão ou limpeza de dados)"""
+    market_stats_cache.clear()
+    available_dates_cache.clear()
+    summary_cache.clear()
+    report_jobs.clear_artifacts()
+    produtos_snapshot.discard()
+    asyncio.create_task(refresh_produtos_snapshot())
+    hot_store.loaded = False
+    asyncio.create_task(load_hot_store())
+
+_snapshot_lock = asyncio.Lock()
+
+async def refresh_produtos_snapshot(coleta_id: Optional[int] = None):
+    """Regrava o snapshot colunar de produtos (uma reconstrução por vez), marcado com a
+    última coleta concluída do índice (já atualizado pelo gancho refresh_collection_dates)"""
+    async with _snapshot_lock:
+        try:
+            index = await get_collection_date_index()
+            await asyncio.to_thread(build_snapshot, supabase, index['ultima_coleta_id'])
+        except Exception as e:
+            logging.error(f"Erro ao gerar snapshot colunar de produtos: {e}")
+
+collector_service.registrar_gancho_pos_coleta(refresh_produtos_snapshot)
+
+def rebuild_product_index(full: bool):
+    """Índice invertido de produtos a partir da janela em memória (incremental após cada coleta)"""
+    product_index.update(pairs_from_snapshot(hot_store.current), full=full)
+
+_hot_store_lock = asyncio.Lock()
+
+async def load_hot_store():
+    """Carga completa da janela recente de preços na memória do processo"""
+    try:
+        index = await get_collection_date_index()
+        async with _hot_store_lock:
+            await asyncio.to_thread(hot_store.load, supabase, index['ultima_coleta_id'])
+            await asyncio.to_thread(rebuild_product_index, True)
+    except Exception as e:
+        logging.error(f"Erro ao carregar armazenamento quente de preços: {e}")
+
+async def sync_hot_store(ultima_coleta_id: Optional[int]) -> bool:
+    """Leva a janela em memória até a coleta informada; devolve se ela ficou em dia"""
+    if hot_store.is_current(ultima_coleta_id):
+        return True
+    async with _hot_store_lock:
+        if not hot_store.is_current(ultima_coleta_id):
+            try:
+                full = await asyncio.to_thread(hot_store.sync, supabase, ultima_coleta_id)
+                await asyncio.to_thread(rebuild_product_index, full)
+            except Exception as e:
+                logging.error(f"Erro ao atualizar armazenamento quente até a coleta #{ultima_coleta_id}: {e}")
+    return hot_store.is_current(ultima_coleta_id)
+
+@collector_service.registrar_gancho_pos_coleta
+async def refresh_hot_store(coleta_id: int):
+    """Acrescenta a coleta recém-concluída ao armazenamento quente"""
+    if hot_store.loaded and (hot_store.ultima_coleta_id or 0) < coleta_id:
+        await sync_hot_store(coleta_id)
+
+async def hot_store_ready() -> bool:
+    """Janela em memória carregada e em dia com a última coleta concluída.
+    Coletas concluídas em outro worker só chegam a este pelo índice de datas, então
+    a janela é comparada com ele (como o snapshot) e alcançada antes de ser usada."""
+    if not hot_store.loaded:
+        return False
+    index = await get_collection_date_index()
+    return await sync_hot_store(index['ultima_coleta_id'])
+
+async def hot_store_covers(start_date: date) -> bool:
+    return hot_store.covers(start_date) and await hot_store_ready()
+
+async def snapshot_refresher():
+    """Garante que o snapshot exista e não passe de SNAPSHOT_MAX_AGE_HOURS, mesmo sem coletas"""
+    while True:
+        if produtos_snapshot.is_stale() and not _snapshot_lock.locked():
+            await refresh_produtos_snapshot()
+        await asyncio.sleep(3600)
+
+async def current_snapshot_table():
+    """Tabela do snapshot se ela estiver em dia com a última coleta concluída"""
+    table = await asyncio.to_thread(produtos_snapshot.table)
+    if table is None:
+        return None
+    index = await get_collection_date_index()
+    if produtos_snapshot.ultima_coleta_id() != index['ultima_coleta_id']:
+        return None
+    return table
+
+async def consistent_engine():
+    """Motor analítico sincronizado com o snapshot da última coleta, ou None (usar o PostgREST)"""
+    if not analytics_engine.enabled:
+        return None
+    try:
+        table = await current_snapshot_table()
+        if table is None:
+            return None
+        await asyncio.to_thread(analytics_engine.sync, table, produtos_snapshot.ultima_coleta_id())
+        return analytics_engine
+    except Exception as e:
+        logging.warning(f"Motor analítico indisponível, usando consultas ao banco: {e}")
+        return None
+
 async def get_available_dates() -> List[date]:
     """Obtém as datas disponíveis para análise baseado nas coletas"""
     try:
-        response = await asyncio.to_thread(
-            supabase.table('produtos')
-            .select('data_coleta')
-            .order('data_coleta', desc=True)
-            .execute
-        )
-        
-        if not response.data:
-            return []
-        
-        # Extrair datas únicas
-        dates = list(set([item['data_coleta'] for item in response.data]))
-        # Converter para objetos date e ordenar
-        date_objects = [datetime.fromisoformat(date_str).date() for date_str in dates]
-        return sorted(date_objects, reverse=True)
-        
+        index = await get_collection_date_index()
+        return index['dates']
     except Exception as e:
         logging.error(f"Erro ao buscar datas disponíveis: {e}")
         return []
 
+async def is_range_available(start_date: date, end_date: date) -> bool:
+    """Descarta períodos que não podem ter dados: invertidos ou inteiramente no futuro.
+    O índice de datas vem só das coletas concluídas (coletas com falha ou em andamento também
+    gravam produtos), então estar fora dele não prova que faltam dados e não recusa o período."""
+    # Um dia de folga: data_coleta pode estar em UTC, à frente da data local do servidor
+    if start_date > end_date or start_date > date.today() + timedelta(days=1):
+        return False
+    try:
+        index = await get_collection_date_index()
+    except Exception as e:
+        logging.warning(f"Índice de datas indisponível: {e}")
+        return True
+    if index['min_date'] is not None and (start_date > index['max_date'] or end_date < index['min_date']):
+        logging.debug(f"Período {start_date} a {end_date} fora do índice de coletas; consultando o banco mesmo assim")
+    return True
+
 # --------------------------------------------------------------------------
 # --- ENDPOINTS PRINCIPAIS DO DASHBOARD ---
 # --------------------------------------------------------------------------
@@ -400,66 +482,8 @@ async def get_dashboard_summary(
 ):
     """Retorna resumo geral do dashboard com métricas avançadas"""
     try:
-        # Dados do período atual
-        current_data = await get_date_range_data(start_date, end_date, cnpjs)
-        
-        # Período anterior para comparação
-        days_diff = (end_date - start_date).days
-        previous_start = start_date - timedelta(days=days_diff + 1)
-        previous_end = start_date - timedelta(days=1)
-        previous_data = await get_date_range_data(previous_start, previous_end, cnpjs)
-        
-        # Mercados ativos
-        markets_data = await get_complete_market_data()
-        total_mercados = len(markets_data)
-        
-        # Mercados ativos hoje
-        today_data = await get_date_range_data(date.today(), date.today(), cnpjs)
-        mercados_ativos_hoje = len(set(item.get('cnpj_supermercado', '') for item in today_data)) if today_data else 0
-        
-        # Coletas no período
-        collections_data = await get_collection_data(start_date, end_date)
-        total_coletas = len(collections_data)
-        
-        # Última coleta
-        ultima_coleta = None
-        if collections_data:
-            ultima_coleta = max(collections_data, key=lambda x: x.get('iniciada_em', ''))['iniciada_em']
-        
-        # Status da coleta
-        coleta_status = "ATIVA" if mercados_ativos_hoje > 0 else "INATIVA"
-        if ultima_coleta:
-            last_collection_date = datetime.fromisoformat(ultima_coleta.replace('Z', '+00:00')).date()
-            if (date.today() - last_collection_date).days > 1:
-                coleta_status = "ATRASADA"
-        
-        # Cálculos de produtos
-        produtos_hoje = len(current_data)
-        produtos_periodo_anterior = len(previous_data)
-        
-        if produtos_periodo_anterior > 0:
-            variacao_produtos = ((produtos_hoje - produtos_periodo_anterior) / produtos_periodo_anterior) * 100
-        else:
-            variacao_produtos = 100 if produtos_hoje > 0 else 0
-
-        # Preço médio geral
-        preco_medio_geral = 0.0
-        if current_data:
-            df = pd.DataFrame(current_data)
-            df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
-            preco_medio_geral = df['preco_produto'].mean()
-
-        return DashboardSummary(
-            total_mercados=total_mercados,
-            total_produtos=produtos_hoje,
-            total_coletas=total_coletas,
-            ultima_coleta=ultima_coleta,
-            produtos_hoje=produtos_hoje,
-            variacao_produtos=round(variacao_produtos, 2),
-            preco_medio_geral=round(preco_medio_geral, 2),
-            mercados_ativos_hoje=mercados_ativos_hoje,
-            coleta_status=coleta_status
-        )
+        cache_key = f"summary_{start_date}_{end_date}_{date.today()}_{','.join(sorted(cnpjs or []))}"
+        return await summary_cache.get(cache_key, build_dashboard_summary, start_date, end_date, cnpjs)
         
     except Exception as e:
         logging.error(f"Erro ao gerar resumo do dashboard: {e}")
@@ -476,6 +500,84 @@ async def get_dashboard_summary(
             coleta_status="ATIVA"
         )
 
+async def build_dashboard_summary(start_date: date, end_date: date, cnpjs: Optional[List[str]]) -> DashboardSummary:
+    """Monta o resumo disparando todas as consultas em paralelo (apenas contagens e colunas necessárias)"""
+    days_diff = (end_date - start_date).days
+    previous_start = start_date - timedelta(days=days_diff + 1)
+    previous_end = start_date - timedelta(days=1)
+    
+    def products_query(columns: str, range_start: date, range_end: date):
+        query = supabase.table('produtos').select(columns, count='exact') \
+            .gte('data_coleta', str(range_start)).lte('data_coleta', str(range_end))
+        if cnpjs and cnpjs != ['all']:
+            query = query.in_('cnpj_supermercado', cnpjs)
+        return query
+    
+    current_response, previous_response, markets_response, collections_response, market_stats = await asyncio.gather(
+        # Período atual: contagem + preços para a média
+        asyncio.to_thread(products_query('preco_produto', start_date, end_date).execute),
+        # Período anterior: apenas a contagem
+        asyncio.to_thread(products_query('cnpj_supermercado', previous_start, previous_end).limit(1).execute),
+        asyncio.to_thread(supabase.table('supermercados').select('cnpj', count='exact').limit(1).execute),
+        # Coletas no período: contagem + a mais recente
+        asyncio.to_thread(
+            supabase.table('coletas')
+            .select('iniciada_em', count='exact')
+            .gte('iniciada_em', str(start_date))
+            .lte('iniciada_em', str(end_date))
+            .order('iniciada_em', desc=True)
+            .limit(1)
+            .execute
+        ),
+        market_stats_cache.get('market_stats', fetch_market_stats)
+    )
+    
+    total_mercados = markets_response.count or 0
+    total_coletas = collections_response.count or 0
+    ultima_coleta = collections_response.data[0]['iniciada_em'] if collections_response.data else None
+    
+    # Mercados ativos hoje: CNPJs distintos cuja última coleta é de hoje
+    today_str = date.today().isoformat()
+    mercados_ativos_hoje = sum(
+        1 for cnpj, stats_entry in market_stats.items()
+        if str(stats_entry.get('ultima_coleta') or '')[:10] == today_str
+        and (not cnpjs or cnpjs == ['all'] or cnpj in cnpjs)
+    )
+    
+    # Status da coleta
+    coleta_status = "ATIVA" if mercados_ativos_hoje > 0 else "INATIVA"
+    if ultima_coleta:
+        last_collection_date = datetime.fromisoformat(ultima_coleta.replace('Z', '+00:00')).date()
+        if (date.today() - last_collection_date).days > 1:
+            coleta_status = "ATRASADA"
+    
+    # Cálculos de produtos
+    produtos_hoje = current_response.count or 0
+    produtos_periodo_anterior = previous_response.count or 0
+    
+    if produtos_periodo_anterior > 0:
+        variacao_produtos = ((produtos_hoje - produtos_periodo_anterior) / produtos_periodo_anterior) * 100
+    else:
+        variacao_produtos = 100 if produtos_hoje > 0 else 0
+
+    # Preço médio geral
+    preco_medio_geral = 0.0
+    if current_response.data:
+        precos = pd.to_numeric(pd.Series([item.get('preco_produto') for item in current_response.data]), errors='coerce')
+        preco_medio_geral = float(precos.mean()) if precos.notna().any() else 0.0
+
+    return DashboardSummary(
+        total_mercados=total_mercados,
+        total_produtos=produtos_hoje,
+        total_coletas=total_coletas,
+        ultima_coleta=ultima_coleta,
+        produtos_hoje=produtos_hoje,
+        variacao_produtos=round(variacao_produtos, 2),
+        preco_medio_geral=round(preco_medio_geral, 2),
+        mercados_ativos_hoje=mercados_ativos_hoje,
+        coleta_status=coleta_status
+    )
+
 @dashboard_router.get("/top-products", response_model=List[TopProduct])
 async def get_top_products(
     start_date: date = Query(..., description="Data de início (YYYY-MM-DD)"),
@@ -486,12 +588,28 @@ async def get_top_products(
 ):
     """Retorna os produtos mais encontrados com análise de preços avançada"""
     try:
+        engine = await consistent_engine()
+        if engine:
+            product_stats = await asyncio.to_thread(
+                engine.top_products, start_date, end_date,
+                start_date - timedelta(days=7), end_date - timedelta(days=7), cnpjs, limit
+            )
+            return [TopProduct(
+                nome_produto=row['nome_produto'],
+                frequencia=int(row['frequencia']),
+                preco_medio=round(row['preco_medio'], 2),
+                mercado_mais_barato=row['mercado_mais_barato'] or 'N/A',
+                preco_mais_barato=round(row['preco_mais_barato'], 2),
+                variacao_semanal=round(row['variacao_semanal'], 2),
+                categoria=row['categoria'] or 'Outros'
+            ) for _, row in product_stats.iterrows()]
+        
         data = await get_date_range_data(start_date, end_date, cnpjs)
         
-        if not data:
+        if data.empty:
             return []
         
-        df = pd.DataFrame(data)
+        df = data
         df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
         df = df.dropna(subset=['preco_produto'])
         
@@ -500,15 +618,18 @@ async def get_top_products(
         week_ago_end = end_date - timedelta(days=7)
         previous_week_data = await get_date_range_data(week_ago_start, week_ago_end, cnpjs)
         
+        df = ensure_categories(df)
+        
         # Agrupar por produto
         product_stats = df.groupby('nome_produto_normalizado').agg({
             'id_registro': 'count',
             'preco_produto': 'mean',
             'nome_supermercado': lambda x: x.value_counts().index[0] if not x.empty else 'N/A',
-            'nome_produto': 'first'
+            'nome_produto': 'first',
+            'categoria': 'last'
         }).reset_index()
         
-        product_stats.columns = ['nome_normalizado', 'frequencia', 'preco_medio', 'mercado_mais_comum', 'nome_produto']
+        product_stats.columns = ['nome_normalizado', 'frequencia', 'preco_medio', 'mercado_mais_comum', 'nome_produto', 'categoria']
         
         # Encontrar preço mais barato para cada produto
         cheapest_prices = df.loc[df.groupby('nome_produto_normalizado')['preco_produto'].idxmin()]
@@ -516,8 +637,8 @@ async def get_top_products(
         
         # Calcular variação semanal
         variation_map = {}
-        if previous_week_data:
-            prev_df = pd.DataFrame(previous_week_data)
+        if not previous_week_data.empty:
+            prev_df = previous_week_data
             prev_df['preco_produto'] = pd.to_numeric(prev_df['preco_produto'], errors='coerce')
             prev_df = prev_df.dropna(subset=['preco_produto'])
             
@@ -535,20 +656,11 @@ async def get_top_products(
                     variation = 0
                 variation_map[product] = variation
         
-        # Categorizar produtos
-        categorized = await categorize_products_advanced(data)
-        product_categories = {}
-        for category, products in categorized.items():
-            for product in products:
-                product_name = product.get('nome_produto_normalizado')
-                if product_name:
-                    product_categories[product_name] = category
-        
         top_products = []
         for _, row in product_stats.nlargest(limit, 'frequencia').iterrows():
             cheapest_info = cheapest_map.get(row['nome_normalizado'], {})
             variacao = variation_map.get(row['nome_normalizado'], 0)
-            categoria = product_categories.get(row['nome_normalizado'], 'Outros')
+            categoria = row['categoria'] or 'Outros'
             
             top_product = TopProduct(
                 nome_produto=row['nome_produto'],
@@ -576,33 +688,50 @@ async def get_price_trends(
 ):
     """Retorna tendência de preços ao longo do tempo com análise avançada"""
     try:
-        data = await get_date_range_data(start_date, end_date, cnpjs)
+        engine = await consistent_engine()
+        if engine:
+            trends_data = await asyncio.to_thread(engine.price_trends, start_date, end_date, cnpjs)
+        elif await hot_store_covers(start_date):
+            snapshot = hot_store.current
+            day_stats = snapshot.group_stats(snapshot.mask(start_date, end_date, cnpjs), 'dia')
+            if day_stats.empty:
+                return []
+            trends_data = pd.DataFrame({
+                'data': [d.date() for d in pd.to_datetime(day_stats.index)],
+                'preco_medio': day_stats['mean'].values,
+                'preco_minimo': day_stats['min'].values,
+                'preco_maximo': day_stats['max'].values,
+                'total_produtos': day_stats['count'].values,
+                'volatilidade': (day_stats['std'] / day_stats['mean']).fillna(0).values
+            })
+        else:
+            data = await get_date_range_data(start_date, end_date, cnpjs)
         
-        if not data:
-            return []
+            if data.empty:
+                return []
         
-        df = pd.DataFrame(data)
-        df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
-        df = df.dropna(subset=['preco_produto'])
+            df = data
+            df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
+            df = df.dropna(subset=['preco_produto'])
         
-        # Garantir que temos data_coleta
-        if 'data_coleta' not in df.columns:
-            return []
+            # Garantir que temos data_coleta
+            if 'data_coleta' not in df.columns:
+                return []
             
-        df['data_coleta'] = pd.to_datetime(df['data_coleta']).dt.date
+            df['data_coleta'] = pd.to_datetime(df['data_coleta']).dt.date
         
-        # Agrupar por data e calcular estatísticas avançadas
-        trends_data = df.groupby('data_coleta').agg({
-            'preco_produto': ['mean', 'min', 'max', 'std', 'count']
-        }).reset_index()
+            # Agrupar por data e calcular estatísticas avançadas
+            trends_data = df.groupby('data_coleta').agg({
+                'preco_produto': ['mean', 'min', 'max', 'std', 'count']
+            }).reset_index()
         
-        trends_data.columns = ['data', 'preco_medio', 'preco_minimo', 'preco_maximo', 'desvio_padrao', 'total_produtos']
+            trends_data.columns = ['data', 'preco_medio', 'preco_minimo', 'preco_maximo', 'desvio_padrao', 'total_produtos']
         
-        # Calcular volatilidade (coeficiente de variação)
-        trends_data['volatilidade'] = (trends_data['desvio_padrao'] / trends_data['preco_medio']).fillna(0)
+            # Calcular volatilidade (coeficiente de variação)
+            trends_data['volatilidade'] = (trends_data['desvio_padrao'] / trends_data['preco_medio']).fillna(0)
         
-        # Ordenar por data
-        trends_data = trends_data.sort_values('data')
+            # Ordenar por data
+            trends_data = trends_data.sort_values('data')
         
         return [PriceTrend(**{
             'data': row['data'].isoformat(),
@@ -628,7 +757,7 @@ async def get_advanced_metrics(
     try:
         data = await get_date_range_data(start_date, end_date, cnpjs)
         
-        if not data:
+        if data.empty:
             return AdvancedMetrics(
                 inflacao_mensal=0,
                 volatilidade_geral=0,
@@ -639,7 +768,7 @@ async def get_advanced_metrics(
                 categoria_mais_volatil="N/A"
             )
         
-        df = pd.DataFrame(data)
+        df = data
         df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
         df = df.dropna(subset=['preco_produto'])
         
@@ -649,66 +778,23 @@ async def get_advanced_metrics(
         previous_end = start_date - timedelta(days=1)
         previous_data = await get_date_range_data(previous_start, previous_end, cnpjs)
         
-        # Inflação mensal aproximada
-        current_avg = df['preco_produto'].mean()
-        previous_avg = 0
-        if previous_data:
-            prev_df = pd.DataFrame(previous_data)
+        prev_df = None
+        if not previous_data.empty:
+            prev_df = previous_data
             prev_df['preco_produto'] = pd.to_numeric(prev_df['preco_produto'], errors='coerce')
             prev_df = prev_df.dropna(subset=['preco_produto'])
-            previous_avg = prev_df['preco_produto'].mean()
-        
-        inflacao_mensal = ((current_avg - previous_avg) / previous_avg * 100) if previous_avg > 0 else 0
-        
-        # Volatilidade geral
-        volatilidade_geral = df['preco_produto'].std() / df['preco_produto'].mean()
         
-        # Índice de confiança (baseado na consistência dos preços)
-        price_variations = []
-        for product in df['nome_produto_normalizado'].unique():
-            product_prices = df[df['nome_produto_normalizado'] == product]['preco_produto']
-            if len(product_prices) > 1:
-                variation = product_prices.std() / product_prices.mean()
-                price_variations.append(variation)
-        
-        indice_confianca = 1 - (np.mean(price_variations) if price_variations else 0)
-        
-        # Produtos em alta/baixa
-        produtos_em_alta = 0
-        produtos_em_baixa = 0
-        
-        # Mercado mais competitivo
-        market_stats = df.groupby('nome_supermercado').agg({
-            'preco_produto': 'mean',
-            'id_registro': 'count'
-        })
-        if not market_stats.empty:
-            mercado_mais_competitivo = market_stats['preco_produto'].idxmin()
-        else:
-            mercado_mais_competitivo = "N/A"
-        
-        # Categoria mais volátil
-        categorized = await categorize_products_advanced(data)
-        categoria_volatilidade = {}
-        for category, products in categorized.items():
-            if products:
-                cat_df = pd.DataFrame(products)
-                cat_df['preco_produto'] = pd.to_numeric(cat_df['preco_produto'], errors='coerce')
-                cat_df = cat_df.dropna(subset=['preco_produto'])
-                if not cat_df.empty:
-                    volatilidade = cat_df['preco_produto'].std() / cat_df['preco_produto'].mean()
-                    categoria_volatilidade[category] = volatilidade
-        
-        categoria_mais_volatil = max(categoria_volatilidade.items(), key=lambda x: x[1])[0] if categoria_volatilidade else "N/A"
+        # Todas as métricas em agregações agrupadas (sem varrer o DataFrame por produto)
+        metrics = compute_advanced_metrics(df, prev_df, variation_threshold=PRICE_ALERT_THRESHOLD)
         
         return AdvancedMetrics(
-            inflacao_mensal=round(inflacao_mensal, 2),
-            volatilidade_geral=round(volatilidade_geral, 4),
-            indice_confianca=round(indice_confianca, 4),
-            produtos_em_alta=produtos_em_alta,
-            produtos_em_baixa=produtos_em_baixa,
-            mercado_mais_competitivo=mercado_mais_competitivo,
-            categoria_mais_volatil=categoria_mais_volatil
+            inflacao_mensal=round(metrics['inflacao_mensal'], 2),
+            volatilidade_geral=round(metrics['volatilidade_geral'], 4),
+            indice_confianca=round(metrics['indice_confianca'], 4),
+            produtos_em_alta=metrics['produtos_em_alta'],
+            produtos_em_baixa=metrics['produtos_em_baixa'],
+            mercado_mais_competitivo=metrics['mercado_mais_competitivo'],
+            categoria_mais_volatil=metrics['categoria_mais_volatil']
         )
         
     except Exception as e:
@@ -734,10 +820,10 @@ async def get_price_alerts(
     try:
         data = await get_date_range_data(start_date, end_date, cnpjs)
         
-        if not data:
+        if data.empty:
             return []
         
-        df = pd.DataFrame(data)
+        df = data
         df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
         df = df.dropna(subset=['preco_produto'])
         
@@ -747,43 +833,16 @@ async def get_price_alerts(
         previous_end = start_date - timedelta(days=1)
         previous_data = await get_date_range_data(previous_start, previous_end, cnpjs)
         
-        alerts = []
+        if previous_data.empty:
+            return []
         
-        if previous_data:
-            prev_df = pd.DataFrame(previous_data)
-            prev_df['preco_produto'] = pd.to_numeric(prev_df['preco_produto'], errors='coerce')
-            prev_df = prev_df.dropna(subset=['preco_produto'])
-            
-            # Comparar preços por produto
-            current_prices = df.groupby('nome_produto_normalizado')['preco_produto'].mean()
-            previous_prices = prev_df.groupby('nome_produto_normalizado')['preco_produto'].mean()
-            
-            for product in current_prices.index:
-                if product in previous_prices.index:
-                    current_price = current_prices[product]
-                    previous_price = previous_prices[product]
-                    
-                    if previous_price > 0:
-                        variation = ((current_price - previous_price) / previous_price) * 100
-                        
-                        if abs(variation) >= PRICE_ALERT_THRESHOLD * 100:  # Convertendo para percentual
-                            # Encontrar mercado atual
-                            current_market = df[df['nome_produto_normalizado'] == product]['nome_supermercado'].mode()
-                            market = current_market[0] if len(current_market) > 0 else "N/A"
-                            
-                            alert = PriceAlert(
-                                produto=product,
-                                codigo_barras=df[df['nome_produto_normalizado'] == product]['codigo_barras'].iloc[0] if 'codigo_barras' in df.columns else "",
-                                variacao=round(variation, 2),
-                                tipo="ALTA" if variation > 0 else "BAIXA",
-                                mercado=market,
-                                preco_atual=round(current_price, 2),
-                                preco_anterior=round(previous_price, 2),
-                                gravidade="ALTA" if abs(variation) > 15 else "MEDIA"
-                            )
-                            alerts.append(alert)
-        
-        return sorted(alerts, key=lambda x: abs(x.variacao), reverse=True)[:20]  # Top 20 alertas
+        prev_df = previous_data
+        prev_df['preco_produto'] = pd.to_numeric(prev_df['preco_produto'], errors='coerce')
+        prev_df = prev_df.dropna(subset=['preco_produto'])
+        
+        # Comparação vetorizada entre os períodos (top 20 por variação absoluta)
+        alerts = generate_price_alerts(df, prev_df, threshold=PRICE_ALERT_THRESHOLD, top_k=20)
+        return [PriceAlert(**alert) for alert in alerts]
         
     except Exception as e:
         logging.error(f"Erro ao gerar alertas de preço: {e}")
@@ -793,6 +852,23 @@ async def get_price_alerts(
 # --- ENDPOINTS PARA ANÁLISE DE PRODUTOS POR CÓDIGO DE BARRAS ---
 # --------------------------------------------------------------------------
 
+@dashboard_router.get("/available-dates")
+async def get_available_dates_endpoint(
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Retorna as datas com dados coletados para os seletores de período"""
+    try:
+        index = await get_collection_date_index()
+        return {
+            'dates': [d.isoformat() for d in index['dates']],
+            'min_date': index['min_date'].isoformat() if index['min_date'] else None,
+            'max_date': index['max_date'].isoformat() if index['max_date'] else None,
+            'total_coletas': index['total_coletas']
+        }
+    except Exception as e:
+        logging.error(f"Erro ao buscar datas disponíveis: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @dashboard_router.get("/markets", response_model=List[MarketInfo])
 async def get_markets_for_analysis(
     user: UserProfile = Depends(require_page_access('dashboard'))
@@ -807,35 +883,20 @@ async def get_markets_for_analysis(
             .execute
         )
         
-        # Buscar dados de produtos para estatísticas
-        products_response = await asyncio.to_thread(
-            supabase.table('produtos')
-            .select('cnpj_supermercado, data_coleta')
-            .execute
-        )
-        
-        products_data = products_response.data if products_response.data else []
-        
-        # Calcular estatísticas por mercado
-        market_stats = {}
-        for product in products_data:
-            cnpj = product.get('cnpj_supermercado')
-            if cnpj not in market_stats:
-                market_stats[cnpj] = {'count': 0, 'dates': set()}
-            market_stats[cnpj]['count'] += 1
-            market_stats[cnpj]['dates'].add(product.get('data_coleta'))
+        # Estatísticas agregadas no banco, em cache até a próxima coleta
+        market_stats = await market_stats_cache.get('market_stats', fetch_market_stats)
         
         markets = []
         for market in markets_response.data:
-            stats = market_stats.get(market['cnpj'], {'count': 0, 'dates': set()})
-            ultima_coleta = max(stats['dates']) if stats['dates'] else None
+            stats_entry = market_stats.get(market['cnpj'], {})
             
             markets.append(MarketInfo(
                 cnpj=market['cnpj'],
                 nome=market['nome'],
                 endereco=market.get('endereco'),
-                total_produtos=stats['count'],
-                ultima_coleta=ultima_coleta
+                total_produtos=stats_entry.get('total_produtos', 0),
+                ultima_coleta=stats_entry.get('ultima_coleta'),
+                dias_coletados=stats_entry.get('dias_coletados', 0)
             ))
         
         return markets
@@ -894,6 +955,11 @@ async def get_advanced_product_analysis(
             'statistical_insights': {}
         }
 
+        # Matriz de preços (código de barras, mercado) x data em uma única operação
+        matrix = build_price_matrix(df, columns=analysis_data['dates'])
+        available_series = set(matrix.index)
+        series_order = []
+
         # Organizar dados por produto e mercado
         for barcode in request.product_barcodes:
             product_data = df[df['codigo_barras'] == barcode]
@@ -913,36 +979,26 @@ async def get_advanced_product_analysis(
                 analysis_data['trend_analysis'][barcode] = trend_analysis
                 
                 for market_cnpj in request.markets_cnpj:
-                    market_data = product_data[product_data['cnpj_supermercado'] == market_cnpj]
-                    if not market_data.empty:
-                        # Adicionar informações do mercado
-                        if market_cnpj not in analysis_data['markets']:
-                            analysis_data['markets'].append(market_cnpj)
-                        
-                        if market_cnpj not in analysis_data['market_info']:
-                            market_info = markets_map.get(market_cnpj, {})
-                            analysis_data['market_info'][market_cnpj] = {
-                                'nome': market_info.get('nome', 'N/A'),
-                                'endereco': market_info.get('endereco')
-                            }
-                        
-                        # Preços por data com estatísticas
-                        key = f"{barcode}_{market_cnpj}"
-                        analysis_data['price_matrix'][key] = {}
-                        
-                        for date in analysis_data['dates']:
-                            daily_data = market_data[market_data['data_coleta'] == date]
-                            if not daily_data.empty:
-                                price = daily_data.iloc[0]['preco_produto']
-                                analysis_data['price_matrix'][key][date.isoformat()] = {
-                                    'preco': float(price),
-                                    'disponivel': True
-                                }
-                            else:
-                                analysis_data['price_matrix'][key][date.isoformat()] = {
-                                    'preco': None,
-                                    'disponivel': False
-                                }
+                    if (barcode, market_cnpj) not in available_series:
+                        continue
+                    series_order.append((barcode, market_cnpj))
+                    
+                    # Adicionar informações do mercado
+                    if market_cnpj not in analysis_data['markets']:
+                        analysis_data['markets'].append(market_cnpj)
+                    
+                    if market_cnpj not in analysis_data['market_info']:
+                        market_info = markets_map.get(market_cnpj, {})
+                        analysis_data['market_info'][market_cnpj] = {
+                            'nome': market_info.get('nome', 'N/A'),
+                            'endereco': market_info.get('endereco')
+                        }
+        
+        matrix = matrix.reindex(series_order)
+        if request.matrix_format == 'columnar':
+            analysis_data['price_matrix'] = price_matrix_to_columnar(matrix)
+        else:
+            analysis_data['price_matrix'] = price_matrix_to_cells(matrix)
 
         # Insights estatísticos gerais
         analysis_data['statistical_insights'] = {
@@ -954,7 +1010,11 @@ async def get_advanced_product_analysis(
         }
 
         # Detectar anomalias
-        anomalies = detect_price_anomalies(df)
+        anomalies = detect_price_anomalies(
+            df,
+            method=request.anomaly_method,
+            min_group_size=request.anomaly_min_group_size
+        )
         analysis_data['price_anomalies'] = anomalies[:10]  # Top 10 anomalias
 
         return analysis_data
@@ -974,181 +1034,126 @@ async def generate_comprehensive_report(
 ):
     """Gera relatório abrangente com todas as métricas"""
     try:
-        # Coletar todos os dados
-        data = await get_date_range_data(request.start_date, request.end_date, request.cnpjs)
+        engine = await consistent_engine()
+        if engine:
+            aggregates = await asyncio.to_thread(engine.report_aggregates, request.start_date, request.end_date, request.cnpjs)
+            report = report_from_aggregates(aggregates, request.start_date, request.end_date)
+        else:
+            # Coletar todos os dados
+            data = await get_date_range_data(request.start_date, request.end_date, request.cnpjs)
+            
+            report = None
+            if not data.empty:
+                report = await report_jobs.run_in_pool(build_comprehensive_report, data, request.start_date, request.end_date)
         
-        if not data:
+        if report is None:
             return {"message": "Nenhum dado encontrado para o período especificado"}
         
-        df = pd.DataFrame(data)
-        df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
-        df = df.dropna(subset=['preco_produto'])
-        
-        # Métricas principais
-        total_produtos = len(df)
-        total_mercados = df['nome_supermercado'].nunique()
-        preco_medio_geral = df['preco_produto'].mean()
-        
-        # Análise por mercado
-        market_analysis = df.groupby('nome_supermercado').agg({
-            'id_registro': 'count',
-            'preco_produto': ['mean', 'min', 'max', 'std']
-        }).reset_index()
-        
-        market_analysis.columns = ['mercado', 'total_produtos', 'preco_medio', 'preco_minimo', 'preco_maximo', 'desvio_padrao']
-        market_analysis['volatilidade'] = (market_analysis['desvio_padrao'] / market_analysis['preco_medio']).round(4)
-        
-        # Produtos mais caros e mais baratos
-        produtos_mais_caros = df.nlargest(10, 'preco_produto')[['nome_produto', 'preco_produto', 'nome_supermercado']].to_dict('records')
-        produtos_mais_baratos = df.nsmallest(10, 'preco_produto')[['nome_produto', 'preco_produto', 'nome_supermercado']].to_dict('records')
-        
-        # Distribuição de preços
-        price_ranges = {
-            'ate_5': len(df[df['preco_produto'] <= 5]),
-            '5_a_10': len(df[(df['preco_produto'] > 5) & (df['preco_produto'] <= 10)]),
-            '10_a_20': len(df[(df['preco_produto'] > 10) & (df['preco_produto'] <= 20)]),
-            '20_a_50': len(df[(df['preco_produto'] > 20) & (df['preco_produto'] <= 50)]),
-            '50_a_100': len(df[(df['preco_produto'] > 50) & (df['preco_produto'] <= 100)]),
-            'acima_100': len(df[df['preco_produto'] > 100])
-        }
-        
-        # Análise de categoria
-        categorized = await categorize_products_advanced(data)
-        category_analysis = []
-        for category, products in categorized.items():
-            if products:
-                cat_df = pd.DataFrame(products)
-                cat_df['preco_produto'] = pd.to_numeric(cat_df['preco_produto'], errors='coerce')
-                cat_df = cat_df.dropna(subset=['preco_produto'])
-                
-                category_analysis.append({
-                    'categoria': category,
-                    'total_produtos': len(products),
-                    'preco_medio': round(cat_df['preco_produto'].mean(), 2),
-                    'preco_minimo': round(cat_df['preco_produto'].min(), 2),
-                    'preco_maximo': round(cat_df['preco_produto'].max(), 2),
-                    'volatilidade': round(cat_df['preco_produto'].std() / cat_df['preco_produto'].mean(), 4)
-                })
-        
-        # Métricas avançadas
-        advanced_metrics = calculate_advanced_metrics(df)
-        
-        report = {
-            'periodo': {
-                'inicio': str(request.start_date),
-                'fim': str(request.end_date)
-            },
-            'metricas_principais': {
-                'total_produtos': total_produtos,
-                'total_mercados': total_mercados,
-                'preco_medio_geral': round(preco_medio_geral, 2),
-                'produto_mais_caro': round(df['preco_produto'].max(), 2),
-                'produto_mais_barato': round(df['preco_produto'].min(), 2),
-                'volatilidade_geral': round(df['preco_produto'].std() / df['preco_produto'].mean(), 4)
-            },
-            'analise_mercados': market_analysis.to_dict('records'),
-            'produtos_destaque': {
-                'mais_caros': produtos_mais_caros,
-                'mais_baratos': produtos_mais_baratos
-            },
-            'distribuicao_precos': price_ranges,
-            'analise_categorias': category_analysis,
-            'metricas_avancadas': advanced_metrics,
-            'timestamp_geracao': datetime.now().isoformat()
-        }
-        
         return report
         
     except Exception as e:
         logging.error(f"Erro ao gerar relatório abrangente: {e}")
         return {"message": "Erro ao gerar relatório abrangente"}
 
+# Ordem estável e única das exportações paginadas (chave do keyset)
+PRODUTOS_EXPORT_ORDER = [('data_coleta', False), ('id_registro', False)]
+
+def produtos_range_query(start_date: date, end_date: date, cnpjs: Optional[List[str]] = None, columns: str = '*'):
+    """Consulta de produtos do período (a ordem é aplicada pela paginação: PRODUTOS_EXPORT_ORDER)"""
+    query = supabase.table('produtos').select(columns) \
+        .gte('data_coleta', str(start_date)).lte('data_coleta', str(end_date))
+    if cnpjs and cnpjs != ['all']:
+        query = query.in_('cnpj_supermercado', cnpjs)
+    return query
+
+async def dashboard_json_chunks(pages, start_date: date, end_date: date):
+    """Mesmo documento da exportação JSON, escrito página a página (métricas ao final)"""
+    yield ('{"periodo": ' + json.dumps({'start_date': str(start_date), 'end_date': str(end_date)}) + ', "dados": [').encode('utf-8')
+    total_registros = 0
+    soma_precos = 0.0
+    total_precos = 0
+    mercados = set()
+    async for page in pages:
+        prefix = ', ' if total_registros else ''
+        yield (prefix + ', '.join(json.dumps(row, ensure_ascii=False, default=str) for row in page)).encode('utf-8')
+        total_registros += len(page)
+        for row in page:
+            mercados.add(row.get('nome_supermercado', ''))
+            try:
+                soma_precos += float(row.get('preco_produto'))
+                total_precos += 1
+            except (TypeError, ValueError):
+                pass
+    metricas = {
+        'preco_medio': round(soma_precos / total_precos, 2) if total_precos else None,
+        'total_mercados': len(mercados),
+        'periodo_dias': (end_date - start_date).days
+    }
+    yield ('], "total_registros": ' + str(total_registros) + ', "metricas": ' + json.dumps(metricas) + '}').encode('utf-8')
+
 @dashboard_router.get("/export-advanced-data")
 async def export_advanced_dashboard_data(
     start_date: date = Query(..., description="Data de início (YYYY-MM-DD)"),
     end_date: date = Query(..., description="Data final (YYYY-MM-DD)"),
     cnpjs: Optional[List[str]] = Query(None),
-    export_type: str = Query('csv', regex='^(csv|json|xlsx)$'),
+    export_type: str = Query('csv', pattern='^(csv|ndjson|json|xlsx|parquet|arrow)$'),
+    gzip: bool = Query(False, description="Compactar o arquivo (.gz); vale para csv, ndjson, json e arrow"),
     user: UserProfile = Depends(require_page_access('dashboard'))
 ):
-    """Exporta dados do dashboard em formatos avançados"""
+    """Exporta dados do dashboard em formatos avançados (CSV/NDJSON/JSON em streaming)"""
     try:
         from fastapi.responses import Response
-        import io
-        
-        data = await get_date_range_data(start_date, end_date, cnpjs)
         
-        if not data:
+        # Parquet já sai compactado (zstd) e o xlsx é um zip: gzip não se aplica
+        if gzip and export_type in ('parquet', 'xlsx'):
+            raise HTTPException(status_code=400, detail=f"gzip não é suportado para exportação {export_type} (o formato já é compactado)")
+        
+        filename = f'dashboard_advanced_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_type}'
+        
+        if export_type == 'xlsx':
+            # A planilha precisa ser montada inteira; use /report-jobs para períodos grandes
+            data = await get_date_range_data(start_date, end_date, cnpjs)
+            if data.empty:
+                raise HTTPException(status_code=404, detail="Nenhum dado encontrado para exportação")
+            content, media_type = await report_jobs.run_in_pool(build_export, data, start_date, end_date, export_type)
+            return Response(content=content, media_type=media_type, headers={'Content-Disposition': f'attachment; filename={filename}'})
+        
+        if export_type in COLUMNAR_MEDIA_TYPES:
+            # Formatos colunares: do snapshot local quando ele está em dia, senão página a página do banco
+            table = await current_snapshot_table()
+            if table is not None:
+                table = filter_produtos_table(table, start_date, end_date, cnpjs)
+                if table.num_rows == 0:
+                    raise HTTPException(status_code=404, detail="Nenhum dado encontrado para exportação")
+                batches = batches_from_table(table)
+            else:
+                pages = None
+                if await is_range_available(start_date, end_date):
+                    pages = await open_pages(lambda: produtos_range_query(start_date, end_date, cnpjs, ', '.join(COLUMNAR_COLUMNS)), PRODUTOS_EXPORT_ORDER)
+                if pages is None:
+                    raise HTTPException(status_code=404, detail="Nenhum dado encontrado para exportação")
+                batches = batches_from_pages(pages)
+            
+            chunks = parquet_chunks(batches) if export_type == 'parquet' else arrow_stream_chunks(batches)
+            return streaming_export_response(chunks, COLUMNAR_MEDIA_TYPES[export_type], filename, gzip)
+        
+        # O CSV lê também id_registro, que faz parte da chave da paginação
+        columns = ', '.join(EXPORT_COLUMNS + ['id_registro']) if export_type == 'csv' else '*'
+        pages = None
+        if await is_range_available(start_date, end_date):
+            pages = await open_pages(lambda: produtos_range_query(start_date, end_date, cnpjs, columns), PRODUTOS_EXPORT_ORDER)
+        if pages is None:
             raise HTTPException(status_code=404, detail="Nenhum dado encontrado para exportação")
         
         if export_type == 'csv':
-            df = pd.DataFrame(data)
-            
-            # Selecionar colunas relevantes
-            columns_to_export = ['nome_produto', 'preco_produto', 'nome_supermercado', 'data_coleta', 'tipo_unidade', 'codigo_barras', 'nome_produto_normalizado']
-            df = df[[col for col in columns_to_export if col in df.columns]]
-            
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            content = output.getvalue()
-            output.close()
-            
-            return Response(
-                content=content,
-                media_type='text/csv',
-                headers={'Content-Disposition': f'attachment; filename=dashboard_advanced_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-            )
-            
-        elif export_type == 'xlsx':
-            df = pd.DataFrame(data)
-            
-            # Criar Excel com múltiplas abas
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                # Aba principal
-                df.to_excel(writer, sheet_name='Dados Completos', index=False)
-                
-                # Aba de resumo
-                summary_data = {
-                    'Metrica': ['Total de Produtos', 'Total de Mercados', 'Preço Médio', 'Data Início', 'Data Fim'],
-                    'Valor': [
-                        len(df),
-                        df['nome_supermercado'].nunique(),
-                        round(df['preco_produto'].mean(), 2),
-                        start_date.isoformat(),
-                        end_date.isoformat()
-                    ]
-                }
-                pd.DataFrame(summary_data).to_excel(writer, sheet_name='Resumo', index=False)
-                
-                # Aba de análise por mercado
-                market_analysis = df.groupby('nome_supermercado').agg({
-                    'preco_produto': ['count', 'mean', 'min', 'max']
-                }).round(2)
-                market_analysis.columns = ['Total Produtos', 'Preço Médio', 'Preço Mínimo', 'Preço Máximo']
-                market_analysis.reset_index().to_excel(writer, sheet_name='Análise por Mercado', index=False)
-            
-            content = output.getvalue()
-            output.close()
-            
-            return Response(
-                content=content,
-                media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                headers={'Content-Disposition': f'attachment; filename=dashboard_advanced_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'}
-            )
-            
-        else:  # JSON
-            return {
-                'periodo': {'start_date': str(start_date), 'end_date': str(end_date)},
-                'total_registros': len(data),
-                'metricas': {
-                    'preco_medio': round(pd.DataFrame(data)['preco_produto'].mean(), 2),
-                    'total_mercados': len(set(item.get('nome_supermercado', '') for item in data)),
-                    'periodo_dias': (end_date - start_date).days
-                },
-                'dados': data
-            }
+            chunks = csv_chunks(pages, EXPORT_COLUMNS, lambda row: [row.get(col) for col in EXPORT_COLUMNS])
+            return streaming_export_response(chunks, 'text/csv', filename, gzip)
+        if export_type == 'ndjson':
+            return streaming_export_response(ndjson_chunks(pages), 'application/x-ndjson', filename, gzip)
+        return streaming_export_response(dashboard_json_chunks(pages, start_date, end_date), 'application/json', filename, gzip)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Erro ao exportar dados avançados: {e}")
         raise HTTPException(status_code=500, detail="Erro ao exportar dados")
@@ -1168,20 +1173,23 @@ async def get_product_intelligence(
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
-        # Buscar dados do produto
-        query = supabase.table('produtos').select('*')
-        query = query.eq('codigo_barras', barcode)
-        query = query.gte('data_coleta', str(start_date))
-        query = query.lte('data_coleta', str(end_date))
-        query = query.order('data_coleta')
-        
-        response = await asyncio.to_thread(query.execute)
-        data = response.data
+        engine = await consistent_engine()
+        if engine:
+            df = await asyncio.to_thread(engine.product_rows, barcode, start_date, end_date)
+        else:
+            # Buscar dados do produto
+            query = supabase.table('produtos').select('*')
+            query = query.eq('codigo_barras', barcode)
+            query = query.gte('data_coleta', str(start_date))
+            query = query.lte('data_coleta', str(end_date))
+            query = query.order('data_coleta')
+            
+            response = await asyncio.to_thread(query.execute)
+            df = pd.DataFrame(response.data)
 
-        if not data:
+        if df.empty:
             return {"message": "Nenhum dado encontrado para o produto especificado"}
 
-        df = pd.DataFrame(data)
         df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
         df = df.dropna(subset=['preco_produto'])
         df['data_coleta'] = pd.to_datetime(df['data_coleta']).dt.date
@@ -1317,6 +1325,127 @@ async def advanced_health_check(user: UserProfile = Depends(require_page_access(
         logging.error(f"Advanced health check failed: {e}")
         raise HTTPException(status_code=503, detail="Dashboard service unavailable")
 
+@dashboard_router.get("/snapshot-info")
+async def get_snapshot_info(
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Situação do snapshot colunar local de produtos"""
+    return await asyncio.to_thread(produtos_snapshot.info)
+
+@dashboard_router.get("/hot-store")
+async def get_hot_store_info(
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Uso de memória e janela do armazenamento quente de preços"""
+    return hot_store.memory_usage()
+
+@dashboard_router.get("/product-index")
+async def get_product_index_info(
+    user: UserProfile = Depends(get_current_user)
+):
+    """Tamanho e tempo de construção do índice invertido de produtos (somente admin)"""
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+    return product_index.stats()
+
+# --------------------------------------------------------------------------
+# --- JOBS DE RELATÓRIOS E EXPORTAÇÕES ---
+# --------------------------------------------------------------------------
+
+def _report_job_status(job: Dict[str, Any]) -> ReportJobStatus:
+    return ReportJobStatus(
+        id=job['id'],
+        tipo=job['tipo'],
+        status=job['status'],
+        cache_hit=job['cache_hit'],
+        erro=job['erro'],
+        criado_em=job['criado_em'],
+        finalizado_em=job['finalizado_em'],
+        download_url=f"/api/dashboard/report-jobs/{job['id']}/download" if job['status'] == 'concluido' else None
+    )
+
+def _get_owned_job(job_id: str, user: UserProfile) -> Dict[str, Any]:
+    job = report_jobs.get(job_id)
+    if not job or (job['owner_id'] != user.id and user.role != 'admin'):
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+async def produce_report_artifact(request: ReportJobRequest) -> Dict[str, Any]:
+    """Busca os dados do período e monta o artefato do job no pool de processos"""
+    data = await get_date_range_data(request.start_date, request.end_date, request.cnpjs)
+    if data.empty:
+        raise ValueError("Nenhum dado encontrado para o período especificado")
+    
+    suffix = f"{request.start_date.strftime('%Y%m%d')}_{request.end_date.strftime('%Y%m%d')}"
+    if request.tipo == 'comprehensive-report':
+        report = await report_jobs.run_in_pool(build_comprehensive_report, data, request.start_date, request.end_date)
+        if report is None:
+            raise ValueError("Nenhum preço válido no período especificado")
+        return {
+            'content': to_json_bytes(report),
+            'media_type': 'application/json',
+            'filename': f"relatorio_abrangente_{suffix}.json"
+        }
+    
+    content, media_type = await report_jobs.run_in_pool(build_export, data, request.start_date, request.end_date, request.export_type)
+    return {
+        'content': content,
+        'media_type': media_type,
+        'filename': f"dashboard_advanced_export_{suffix}.{request.export_type}"
+    }
+
+@dashboard_router.post("/report-jobs", response_model=ReportJobStatus, status_code=202)
+async def submit_report_job(
+    request: ReportJobRequest,
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Enfileira a geração de um relatório/exportação e retorna o job para acompanhamento"""
+    try:
+        index = await get_collection_date_index()
+        params = request.model_dump(mode='json')
+        params['cnpjs'] = sorted(request.cnpjs) if request.cnpjs else None
+        if request.tipo == 'comprehensive-report':
+            params.pop('export_type')
+        
+        job = report_jobs.submit(
+            request.tipo, params, user.id, index['ultima_coleta_id'],
+            lambda: produce_report_artifact(request)
+        )
+        return _report_job_status(job)
+    except Exception as e:
+        logging.error(f"Erro ao enfileirar job de relatório: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao enfileirar job de relatório")
+
+@dashboard_router.get("/report-jobs/{job_id}", response_model=ReportJobStatus)
+async def get_report_job(
+    job_id: str,
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Status de um job de relatório"""
+    return _report_job_status(_get_owned_job(job_id, user))
+
+@dashboard_router.get("/report-jobs/{job_id}/download")
+async def download_report_job(
+    job_id: str,
+    user: UserProfile = Depends(require_page_access('dashboard'))
+):
+    """Baixa o artefato de um job concluído"""
+    from fastapi.responses import Response
+    
+    job = _get_owned_job(job_id, user)
+    if job['status'] != 'concluido':
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído (status: {job['status']})")
+    
+    artifact = report_jobs.get_artifact(job)
+    if artifact is None:
+        raise HTTPException(status_code=410, detail="Artefato expirado; envie o job novamente")
+    
+    return Response(
+        content=artifact['content'],
+        media_type=artifact['media_type'],
+        headers={'Content-Disposition': f"attachment; filename={artifact['filename']}"}
+    )
+
 # --------------------------------------------------------------------------
 # --- INICIALIZAÇÃO E CONFIGURAÇÃO ---
 # --------------------------------------------------------------------------
@@ -1335,7 +1464,18 @@ async def startup_event():
     except Exception as e:
         logging.error(f"❌ Erro na conexão com o banco: {e}")
     
+    # Janela recente de preços em memória (carregada em segundo plano)
+    asyncio.create_task(load_hot_store())
+    
+    # Snapshot colunar de produtos (gerado em segundo plano se ausente ou antigo)
+    asyncio.create_task(snapshot_refresher())
+    
     logging.info("✅ Módulo de dashboard inicializado com sucesso")
 
+@dashboard_router.on_event("shutdown")
+async def shutdown_event():
+    """Encerra o pool de processos dos jobs de relatório"""
+    report_jobs.shutdown()
+
 # Exportar o router
 __all__ = ['dashboard_router']
@@ -8,6 +8,7 @@ import logging
 from pydantic import BaseModel
 from postgrest.exceptions import APIError
 import asyncio
+from activity_log import activity_log
 
 # --- Configurações do Supabase ---
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -27,6 +28,7 @@ class UserProfile(BaseModel):
     role: str = "user"
     allowed_pages: List[str] = []
     email: Optional[str] = None
+    full_name: Optional[str] = None
     managed_groups: List[int] = []
 
 # --- Constantes compartilhadas ---
@@ -149,6 +151,7 @@ async def get_current_user(authorization: str = Header(None)) -> UserProfile:
             role=role,
             allowed_pages=allowed_pages,
             email=user.email,
+            full_name=profile_data.get('full_name'),
             managed_groups=managed_groups
         )
     except HTTPException:
@@ -211,6 +214,7 @@ async def get_current_user_optional(authorization: str = Header(None)) -> Option
             role=role,
             allowed_pages=allowed_pages,
             email=user.email,
+            full_name=profile_data.get('full_name'),
             managed_groups=managed_groups
         )
     except Exception as e:
@@ -313,7 +317,7 @@ def setup_logging():
     )
 
 def log_user_activity(user_id: str, action: str, details: dict = None):
-    """Registra atividade do usuário de forma assíncrona"""
+    """Registra atividade do usuário (enfileirado, sem I/O na requisição)"""
     try:
         log_data = {
             "user_id": user_id,
@@ -322,12 +326,8 @@ def log_user_activity(user_id: str, action: str, details: dict = None):
             "created_at": datetime.now().isoformat()
         }
         
-        # Executar em thread separada para não bloquear
-        asyncio.create_task(
-            asyncio.to_thread(
-                supabase_admin.table('user_activity_logs').insert(log_data).execute
-            )
-        )
+        # Gravado em lote pela tarefa de fundo do activity_log
+        activity_log.enqueue('user_activity_logs', log_data)
     except Exception as e:
         logging.error(f"Erro ao registrar atividade do usuário: {e}")
 
@@ -369,18 +369,50 @@ async def get_user_accessible_groups(user: UserProfile) -> List[int]:
         # Subadmin acessa apenas seus grupos designados
         return user.managed_groups
 
-async def get_group_users_count(group_id: int) -> int:
-    """Retorna a quantidade de usuários ativos em um grupo"""
+ACTIVE_COUNTS_PAGE_SIZE = 1000
+
+async def fetch_active_group_counts(today: str) -> Dict[int, int]:
+    """Usuários ativos de todos os grupos numa consulta agregada (RPC get_group_active_counts)"""
     try:
-        today = date.today().isoformat()
         response = await asyncio.to_thread(
-            supabase.table('user_groups')
-            .select('user_id', count='exact')
-            .eq('group_id', group_id)
+            supabase_admin.rpc('get_group_active_counts', {'p_data': today}).execute
+        )
+        return {row['group_id']: row['usuarios_ativos'] for row in response.data or []}
+    except Exception as e:
+        logging.warning(f"RPC get_group_active_counts indisponível, contando pelas associações: {e}")
+
+    # Sem a função no banco: lê só a coluna group_id das associações ativas e agrupa aqui
+    counts: Dict[int, int] = {}
+    start = 0
+    while True:
+        response = await asyncio.to_thread(
+            supabase_admin.table('user_groups')
+            .select('group_id')
             .gte('data_expiracao', today)
+            .order('id')
+            .range(start, start + ACTIVE_COUNTS_PAGE_SIZE - 1)
             .execute
         )
-        return response.count or 0
+        rows = response.data or []
+        for row in rows:
+            counts[row['group_id']] = counts.get(row['group_id'], 0) + 1
+        if len(rows) < ACTIVE_COUNTS_PAGE_SIZE:
+            return counts
+        start += ACTIVE_COUNTS_PAGE_SIZE
+
+async def get_active_group_counts() -> Dict[int, int]:
+    """group_id -> usuários ativos; em cache por GROUP_COUNTS_TTL segundos, ou até uma associação mudar neste worker"""
+    today = date.today().isoformat()
+    return await group_counts_cache.get(f"usuarios_ativos:{today}", fetch_active_group_counts, today)
+
+def invalidate_active_group_counts():
+    """Chamar após inserir, renovar ou remover associações em user_groups (vale só para este worker)"""
+    group_counts_cache.clear()
+
+async def get_group_users_count(group_id: int) -> int:
+    """Retorna a quantidade de usuários ativos em um grupo"""
+    try:
+        return (await get_active_group_counts()).get(group_id, 0)
     except Exception as e:
         logging.error(f"Erro ao contar usuários do grupo {group_id}: {e}")
         return 0
@@ -470,12 +502,32 @@ async def check_database_health() -> Dict[str, Any]:
             "error": str(e)
         }
 
+# --- Leitura paginada ---
+POSTGREST_PAGE_SIZE = 1000  # limite padrão de linhas por resposta do PostgREST
+
+def fetch_all_rows(query_factory, id_column: str = 'id', page_size: int = POSTGREST_PAGE_SIZE) -> List[Dict[str, Any]]:
+    """Todas as linhas da consulta, paginando pela chave id_column (sem o corte de 1000 linhas).
+    query_factory devolve a consulta com select e filtros, sem ordem nem faixa."""
+    rows: List[Dict[str, Any]] = []
+    last_id = None
+    while True:
+        query = query_factory()
+        if last_id is not None:
+            query = query.gt(id_column, last_id)
+        page = query.order(id_column).limit(page_size).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1][id_column]
+
 # --- Funções de cache e performance ---
 class DataCache:
     """Cache simples para melhorar performance"""
     def __init__(self, ttl_seconds: int = 300):
         self.cache = {}
         self.ttl = ttl_seconds
+        # Incrementada a cada invalidação: uma busca iniciada antes dela não grava o resultado
+        self.generation = 0
     
     async def get(self, key: str, fetch_func=None, *args, **kwargs):
         """Obtém dados do cache ou executa função para buscar dados"""
@@ -487,19 +539,39 @@ class DataCache:
                 return data
         
         if fetch_func:
+            generation = self.generation
             data = await fetch_func(*args, **kwargs)
-            self.cache[key] = (data, now)
+            if self.generation == generation:
+                self.cache[key] = (data, now)
             return data
         
         return None
     
     def invalidate(self, key: str):
         """Remove item do cache"""
+        self.generation += 1
         if key in self.cache:
             del self.cache[key]
+    
+    def clear(self):
+        """Remove todos os itens do cache"""
+        self.generation += 1
+        self.cache.clear()
+    
+    async def refresh(self, key: str, fetch_func, *args, **kwargs):
+        """Busca os dados novamente e substitui o valor em cache"""
+        generation = self.generation
+        data = await fetch_func(*args, **kwargs)
+        if self.generation == generation:
+            self.cache[key] = (data, datetime.now())
+        return data
 
 # Instância global do cache
 dashboard_cache = DataCache(ttl_seconds=300)  # 5 minutos
+# Contagem de usuários ativos por grupo. A invalidação após mudanças em user_groups só
+# alcança este processo; os outros workers enxergam a mudança quando o TTL curto vence.
+GROUP_COUNTS_TTL = int(os.getenv("GROUP_COUNTS_TTL", "30"))
+group_counts_cache = DataCache(ttl_seconds=GROUP_COUNTS_TTL)
 
 # --- Funções de validação de permissões para dashboard ---
 async def validate_dashboard_access(user: UserProfile) -> bool:
@@ -8,7 +8,12 @@ import logging
 import asyncio
 
 # Importar dependências compartilhadas
-from dependencies import get_current_user, UserProfile, require_page_access, supabase, supabase_admin, APIError, calcular_data_expiracao
+from dependencies import get_current_user, UserProfile, require_page_access, supabase, supabase_admin, APIError, calcular_data_expiracao, get_active_group_counts, invalidate_active_group_counts
+from user_directory import user_directory
+from group_membership import (
+    GroupBatchRenew, GroupBatchRequest, GroupBatchResult,
+    renew_users_in_group, remove_users_from_group
+)
 
 # Criar router específico para group admins
 group_admin_router = APIRouter(prefix="/api/group-admin", tags=["group-admin"])
@@ -163,44 +168,41 @@ async def list_group_admins(
             supabase.table('group_admins').select('*').order('created_at').execute
         )
         
-        admins_with_details = []
+        admins = response.data or []
+        if not admins:
+            return []
+        user_ids = list({admin['user_id'] for admin in admins})
+        group_ids = list({group_id for admin in admins for group_id in admin['group_ids'] or []})
         
-        for admin in response.data:
-            # Busca informações do usuário
-            user_response = await asyncio.to_thread(
-                supabase.table('profiles').select('full_name').eq('id', admin['user_id']).execute
+        # Uma busca por tabela (perfis, grupos e emails), unidas em memória
+        async def fetch_groups():
+            if not group_ids:
+                return []
+            groups_response = await asyncio.to_thread(
+                supabase.table('grupos').select('id, nome').in_('id', group_ids).execute
             )
-            user_name = user_response.data[0]['full_name'] if user_response.data else 'N/A'
-            
-            # Busca email do usuário
-            user_email = "N/A"
-            try:
-                auth_response = await asyncio.to_thread(
-                    lambda: supabase_admin.auth.admin.get_user_by_id(admin['user_id'])
-                )
-                if auth_response.user:
-                    user_email = auth_response.user.email
-            except Exception as e:
-                logging.error(f"Erro ao buscar email do usuário {admin['user_id']}: {e}")
-            
-            # Busca nomes dos grupos
-            group_names = []
-            if admin['group_ids']:
-                groups_response = await asyncio.to_thread(
-                    supabase.table('grupos').select('nome').in_('id', admin['group_ids']).execute
-                )
-                group_names = [group['nome'] for group in groups_response.data]
-            
-            admin_with_details = GroupAdminWithDetails(
+            return groups_response.data or []
+        
+        profiles, groups, emails = await asyncio.gather(
+            asyncio.to_thread(supabase.table('profiles').select('id, full_name').in_('id', user_ids).execute),
+            fetch_groups(),
+            user_directory.emails(user_ids)
+        )
+        names = {profile['id']: profile.get('full_name') for profile in profiles.data or []}
+        group_names = {group['id']: group['nome'] for group in groups}
+        
+        admins_with_details = [
+            GroupAdminWithDetails(
                 user_id=admin['user_id'],
                 group_ids=admin['group_ids'],
                 created_at=admin['created_at'],
                 updated_at=admin['updated_at'],
-                user_name=user_name,
-                user_email=user_email,
-                group_names=group_names
+                user_name=names.get(admin['user_id']) or 'N/A',
+                user_email=emails.get(admin['user_id']) or 'N/A',
+                group_names=[group_names[g] for g in admin['group_ids'] or [] if g in group_names]
             )
-            admins_with_details.append(admin_with_details)
+            for admin in admins
+        ]
         
         return admins_with_details
         
@@ -299,6 +301,7 @@ async def get_group_users(
             return []
         
         users_with_details = []
+        emails = await user_directory.emails(ug['user_id'] for ug in user_groups_response.data)
         
         for user_group in user_groups_response.data:
             user_id = user_group['user_id']
@@ -312,16 +315,7 @@ async def get_group_users(
                 .execute
             )
             
-            # Busca email do usuário
-            user_email = "N/A"
-            try:
-                auth_response = await asyncio.to_thread(
-                    lambda: supabase_admin.auth.admin.get_user_by_id(user_id)
-                )
-                if auth_response.user:
-                    user_email = auth_response.user.email
-            except Exception as e:
-                logging.error(f"Erro ao buscar email do usuário {user_id}: {e}")
+            user_email = emails.get(user_id) or "N/A"
             
             if profile_response.data:
                 user_data = {
@@ -385,6 +379,7 @@ async def create_group_user(
         if not profile_update_response.data:
             logging.warning(f"Usuário {user_id} foi criado no Auth, mas o perfil não foi encontrado para atualizar.")
             raise HTTPException(status_code=404, detail="Usuário criado, mas o perfil não foi encontrado.")
+        user_directory.put(user_id, email=user_data.email, full_name=user_data.full_name, role='user')
         
         # Associa o usuário ao grupo
         dias_acesso = group_response.data['dias_acesso']
@@ -399,6 +394,7 @@ async def create_group_user(
         await asyncio.to_thread(
             supabase_admin.table('user_groups').insert(user_group_data).execute
         )
+        invalidate_active_group_counts()
         
         logging.info(f"Usuário {user_id} criado e associado ao grupo {user_data.group_id} pelo subadmin {current_user.id}")
         return {"message": "Usuário criado com sucesso no grupo"}
@@ -449,6 +445,7 @@ async def update_group_user(
                 .eq('id', user_id)
                 .execute()
             )
+            user_directory.put(user_id, full_name=user_data.full_name)
         
         # Atualiza email se fornecido
         if user_data.email:
@@ -459,6 +456,7 @@ async def update_group_user(
                         {"email": user_data.email}
                     )
                 )
+                user_directory.put(user_id, email=user_data.email)
             except Exception as e:
                 logging.error(f"Erro ao atualizar email do usuário: {e}")
         
@@ -474,6 +472,7 @@ async def update_group_user(
                         .eq('group_id', group_id)
                         .execute()
                     )
+            invalidate_active_group_counts()
         
         return {"message": "Usuário atualizado com sucesso"}
         
@@ -517,6 +516,7 @@ async def delete_group_user(
                     .eq('group_id', group_id)
                     .execute()
                 )
+        invalidate_active_group_counts()
         
         # Não deleta o usuário do Auth, apenas remove dos grupos
         logging.info(f"Usuário {user_id} removido dos grupos pelo subadmin {current_user.id}")
@@ -526,6 +526,38 @@ async def delete_group_user(
         logging.error(f"Erro ao remover usuário do grupo: {e}")
         raise HTTPException(status_code=500, detail="Erro ao remover usuário do grupo")
 
+# --- Operações em lote no grupo (declaradas antes de /users/{user_id}/... ) ---
+
+async def require_batch_group_access(current_user: UserProfile, group_id: int):
+    if current_user.role != 'admin' and not await verify_group_admin_access(current_user.id, group_id):
+        raise HTTPException(status_code=403, detail="Acesso negado a este grupo")
+
+@group_admin_router.post("/users/batch/renew", response_model=GroupBatchResult)
+async def renew_group_users_batch(
+    batch: GroupBatchRenew,
+    current_user: UserProfile = Depends(get_group_admin_user)
+):
+    """Renova o acesso de vários usuários de um grupo gerenciado (subadmin)"""
+    await require_batch_group_access(current_user, batch.group_id)
+    try:
+        return await renew_users_in_group(supabase_admin, batch.user_ids, batch.group_id, batch.dias_adicionais)
+    except Exception as e:
+        logging.error(f"Erro ao renovar acessos em lote: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro interno ao renovar acessos: {str(e)}")
+
+@group_admin_router.post("/users/batch/remove", response_model=GroupBatchResult)
+async def remove_group_users_batch(
+    batch: GroupBatchRequest,
+    current_user: UserProfile = Depends(get_group_admin_user)
+):
+    """Remove vários usuários de um grupo gerenciado (subadmin)"""
+    await require_batch_group_access(current_user, batch.group_id)
+    try:
+        return await remove_users_from_group(supabase_admin, batch.user_ids, batch.group_id)
+    except Exception as e:
+        logging.error(f"Erro ao remover usuários do grupo em lote: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro ao remover usuários do grupo")
+
 @group_admin_router.post("/users/{user_id}/renew", response_model=dict)
 async def renew_user_access(
     user_id: str,
@@ -583,6 +615,7 @@ async def renew_user_access(
                     .execute()
                 )
                 updated_count += 1
+        invalidate_active_group_counts()
         
         if updated_count == 0:
             raise HTTPException(status_code=403, detail="Nenhuma associação pôde ser renovada")
@@ -625,20 +658,14 @@ async def get_my_groups(
                 .execute
             )
             
+            # Usuários ativos de todos os grupos numa consulta agregada (em cache)
+            active_counts = await get_active_group_counts()
+            
             groups_with_details = []
             for group in groups_response.data:
-                # Contar usuários ativos no grupo
-                user_groups_response = await asyncio.to_thread(
-                    supabase_admin.table('user_groups')
-                    .select('user_id', count='exact')
-                    .eq('group_id', group['id'])
-                    .gte('data_expiracao', date.today().isoformat())
-                    .execute
-                )
-                
                 group_with_details = {
                     **group,
-                    'usuarios_ativos': user_groups_response.count or 0
+                    'usuarios_ativos': active_counts.get(group['id'], 0)
                 }
                 groups_with_details.append(group_with_details)
             
@@ -0,0 +1,199 @@
+# group_membership.py - Operações em lote sobre user_groups (N usuários x 1 grupo)
+# Cada operação faz uma leitura do estado atual e uma escrita em conjunto (upsert pela
+# chave primária, insert ou delete com in_), em vez de select + update/insert por usuário.
+# Se a escrita em conjunto falhar, ela é refeita linha a linha, e o resultado é informado
+# por usuário: adicionado, atualizado, renovado, removido, nao_encontrado ou erro.
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import asyncio
+import logging
+from pydantic import BaseModel, Field
+
+from dependencies import calcular_data_expiracao, invalidate_active_group_counts
+
+MAX_BATCH_USERS = 1000
+
+# --------------------------------------------------------------------------
+# --- MODELOS ---
+# --------------------------------------------------------------------------
+
+class GroupBatchRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_USERS)
+    group_id: int
+
+class GroupBatchAdd(GroupBatchRequest):
+    data_expiracao: Optional[date] = None
+
+class GroupBatchRenew(GroupBatchRequest):
+    dias_adicionais: int = Field(..., ge=1, le=365)
+
+class GroupBatchItemResult(BaseModel):
+    user_id: str
+    status: str
+    data_expiracao: Optional[date] = None
+    detalhe: Optional[str] = None
+
+class GroupBatchResult(BaseModel):
+    group_id: int
+    resultados: List[GroupBatchItemResult]
+    resumo: Dict[str, int]
+
+# --------------------------------------------------------------------------
+# --- AUXILIARES ---
+# --------------------------------------------------------------------------
+
+def _unique(user_ids: List[str]) -> List[str]:
+    """Remove ids repetidos mantendo a ordem do pedido"""
+    return list(dict.fromkeys(user_ids))
+
+def _as_date(value) -> date:
+    return datetime.fromisoformat(value).date() if isinstance(value, str) else value
+
+def renewed_expiration(data_expiracao, dias_adicionais: int, today: Optional[date] = None) -> date:
+    """Mesma regra da renovação individual: soma a partir de hoje se já expirou"""
+    today = today or date.today()
+    data_expiracao = _as_date(data_expiracao)
+    base = today if data_expiracao < today else data_expiracao
+    return base + timedelta(days=dias_adicionais)
+
+def _result(group_id: int, items: List[Dict[str, Any]]) -> GroupBatchResult:
+    resumo: Dict[str, int] = {}
+    for item in items:
+        resumo[item['status']] = resumo.get(item['status'], 0) + 1
+    return GroupBatchResult(group_id=group_id, resultados=items, resumo=resumo)
+
+async def _memberships(client, user_ids: List[str], group_id: int) -> List[Dict[str, Any]]:
+    response = await asyncio.to_thread(
+        client.table('user_groups')
+        .select('id, user_id, group_id, data_expiracao')
+        .eq('group_id', group_id)
+        .in_('user_id', user_ids)
+        .execute
+    )
+    return response.data or []
+
+async def _write(description: str, rows: List[Dict[str, Any]],
+                 build: Callable[[List[Dict[str, Any]]], Any]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """Executa build(rows) numa chamada; se ela falhar, uma chamada por linha.
+    Devolve as linhas retornadas pelo banco e user_id -> mensagem de erro das que falharam"""
+    if not rows:
+        return [], {}
+    try:
+        response = await asyncio.to_thread(build(rows).execute)
+        return response.data or [], {}
+    except Exception as e:
+        logging.error(f"Erro ao {description} em lote, tentando um a um: {e}")
+
+    def write_each():
+        returned, errors = [], {}
+        for row in rows:
+            try:
+                returned.extend(build([row]).execute().data or [])
+            except Exception as e:
+                errors[row['user_id']] = str(e)
+        return returned, errors
+
+    returned, errors = await asyncio.to_thread(write_each)
+    if errors:
+        logging.error(f"Erro ao {description}: {len(errors)} de {len(rows)} falharam")
+    return returned, errors
+
+# --------------------------------------------------------------------------
+# --- OPERAÇÕES ---
+# --------------------------------------------------------------------------
+
+async def add_users_to_group(client, user_ids: List[str], group_id: int, dias_acesso: int,
+                             data_expiracao: Optional[date] = None) -> GroupBatchResult:
+    """Associa os usuários ao grupo; quem já está no grupo tem a expiração atualizada"""
+    user_ids = _unique(user_ids)
+    expiracao = data_expiracao or calcular_data_expiracao(dias_acesso)
+
+    profiles_response, existing = await asyncio.gather(
+        asyncio.to_thread(client.table('profiles').select('id').in_('id', user_ids).execute),
+        _memberships(client, user_ids, group_id)
+    )
+    known = {profile['id'] for profile in profiles_response.data or []}
+    existing_ids = {row['user_id'] for row in existing}
+
+    # Associações existentes: upsert pela chave primária; novas: um único insert
+    updates = [{**row, 'data_expiracao': expiracao.isoformat()} for row in existing]
+    inserts = [
+        {'user_id': user_id, 'group_id': group_id, 'data_expiracao': expiracao.isoformat()}
+        for user_id in user_ids if user_id in known and user_id not in existing_ids
+    ]
+    (_, update_errors), (_, insert_errors) = await asyncio.gather(
+        _write(f"atualizar {len(updates)} associações do grupo {group_id}", updates,
+               lambda rows: client.table('user_groups').upsert(rows, on_conflict='id')),
+        _write(f"inserir {len(inserts)} associações no grupo {group_id}", inserts,
+               lambda rows: client.table('user_groups').insert(rows))
+    )
+    invalidate_active_group_counts()
+    errors = {**update_errors, **insert_errors}
+
+    items = []
+    for user_id in user_ids:
+        if user_id in existing_ids:
+            status = 'atualizado'
+        elif user_id in known:
+            status = 'adicionado'
+        else:
+            items.append({'user_id': user_id, 'status': 'nao_encontrado', 'detalhe': 'Usuário não encontrado'})
+            continue
+        if user_id in errors:
+            items.append({'user_id': user_id, 'status': 'erro', 'detalhe': errors[user_id]})
+        else:
+            items.append({'user_id': user_id, 'status': status, 'data_expiracao': expiracao})
+    logging.info(f"Lote no grupo {group_id}: {len(inserts)} adicionados, {len(updates)} atualizados")
+    return _result(group_id, items)
+
+async def renew_users_in_group(client, user_ids: List[str], group_id: int, dias_adicionais: int) -> GroupBatchResult:
+    """Renova as associações dos usuários no grupo com um único upsert"""
+    user_ids = _unique(user_ids)
+    existing = await _memberships(client, user_ids, group_id)
+    today = date.today()
+    renewed = {}
+    rows = []
+    for row in existing:
+        nova_data = renewed_expiration(row['data_expiracao'], dias_adicionais, today)
+        rows.append({**row, 'data_expiracao': nova_data.isoformat()})
+        renewed[row['user_id']] = nova_data
+
+    _, errors = await _write(f"renovar {len(rows)} associações do grupo {group_id}", rows,
+                             lambda batch: client.table('user_groups').upsert(batch, on_conflict='id'))
+    if rows:
+        invalidate_active_group_counts()
+
+    items = []
+    for user_id in user_ids:
+        if user_id not in renewed:
+            items.append({'user_id': user_id, 'status': 'nao_encontrado', 'detalhe': 'Usuário não pertence ao grupo'})
+        elif user_id in errors:
+            items.append({'user_id': user_id, 'status': 'erro', 'detalhe': errors[user_id]})
+        else:
+            items.append({'user_id': user_id, 'status': 'renovado', 'data_expiracao': renewed[user_id]})
+    logging.info(f"Lote no grupo {group_id}: {len(renewed)} usuários renovados por {dias_adicionais} dias")
+    return _result(group_id, items)
+
+async def remove_users_from_group(client, user_ids: List[str], group_id: int) -> GroupBatchResult:
+    """Remove as associações dos usuários no grupo com um único delete"""
+    user_ids = _unique(user_ids)
+    deleted, errors = await _write(
+        f"remover {len(user_ids)} usuários do grupo {group_id}",
+        [{'user_id': user_id} for user_id in user_ids],
+        lambda rows: client.table('user_groups').delete()
+            .eq('group_id', group_id).in_('user_id', [row['user_id'] for row in rows])
+    )
+    removed = {row['user_id'] for row in deleted}
+    invalidate_active_group_counts()
+
+    items = []
+    for user_id in user_ids:
+        if user_id in errors:
+            items.append({'user_id': user_id, 'status': 'erro', 'detalhe': errors[user_id]})
+        elif user_id in removed:
+            items.append({'user_id': user_id, 'status': 'removido'})
+        else:
+            items.append({'user_id': user_id, 'status': 'nao_encontrado', 'detalhe': 'Usuário não pertence ao grupo'})
+    logging.info(f"Lote no grupo {group_id}: {len(removed)} usuários removidos")
+    return _result(group_id, items)
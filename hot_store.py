@@ -0,0 +1,313 @@
+# hot_store.py - Armazenamento colunar em memória dos preços recentes
+# Mantém no processo os últimos HOT_STORE_DAYS dias de produtos em arrays NumPy,
+# com textos codificados em dicionário (int32), para filtros e agregações sem ida ao banco.
+# Carregado na inicialização e atualizado incrementalmente a cada coleta concluída
+# (neste worker ou em outro: ver sync e a última coleta do índice de datas).
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import date, datetime, timedelta
+import logging
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------
+# --- CONFIGURAÇÃO E CONSTANTES ---
+# --------------------------------------------------------------------------
+
+HOT_STORE_DAYS = int(os.getenv("HOT_STORE_DAYS", "30"))
+HOT_STORE_PAGE_SIZE = 1000
+
+STRING_COLUMNS = [
+    'id_registro', 'nome_produto', 'nome_produto_normalizado', 'categoria', 'codigo_barras',
+    'unidade_medida', 'tipo_unidade', 'nome_supermercado', 'cnpj_supermercado'
+]
+DATE_COLUMNS = ['data_coleta', 'data_ultima_venda']
+HOT_COLUMNS = STRING_COLUMNS + ['preco_produto', 'coleta_id'] + DATE_COLUMNS
+
+class StringDictionary:
+    """Dicionário texto -> código (int32); -1 representa nulo. Só cresce até a próxima carga completa"""
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def encode(self, items: List[Any]) -> np.ndarray:
+        codes = np.empty(len(items), dtype=np.int32)
+        for i, item in enumerate(items):
+            if item is None:
+                codes[i] = -1
+                continue
+            item = str(item)
+            code = self.index.get(item)
+            if code is None:
+                code = len(self.values)
+                self.values.append(item)
+                self.index[item] = code
+            codes[i] = code
+        return codes
+
+    def decode(self, codes: np.ndarray) -> List[Optional[str]]:
+        values = self.values
+        return [values[c] if c >= 0 else None for c in codes.tolist()]
+
+    def lookup(self, value: str) -> int:
+        return self.index.get(value, -2)
+
+    def codes_where(self, predicate: Callable[[str], bool]) -> np.ndarray:
+        """Códigos cujos textos satisfazem o predicado (avaliado uma vez por valor distinto)"""
+        return np.fromiter((code for code, value in enumerate(self.values) if predicate(value)), dtype=np.int32)
+
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(v) for v in self.values) + sys.getsizeof(self.index)
+
+def _to_datetime64(values: List[Any]) -> np.ndarray:
+    # Datas com fuso são convertidas para UTC sem fuso (mesma convenção do snapshot)
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), format='ISO8601', utc=True, errors='coerce')
+    return parsed.dt.tz_localize(None).to_numpy(dtype='datetime64[us]')
+
+def _iso(values: np.ndarray) -> List[Optional[str]]:
+    # Como o PostgREST, omite a fração de segundo quando ela é zero
+    strings = np.datetime_as_string(values, unit='us')
+    return [None if s == 'NaT' else (s[:-7] if s.endswith('.000000') else s) for s in strings.tolist()]
+
+class HotSnapshot:
+    """Versão imutável das colunas + dicionários; as consultas usam sempre o mesmo snapshot"""
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, StringDictionary]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self) -> int:
+        return len(self.columns['preco_produto'])
+
+    def mask(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        cnpjs: Optional[List[str]] = None,
+        name_contains: Optional[str] = None,
+        barcode: Optional[str] = None,
+        names: Optional[Iterable[str]] = None,
+        date_column: str = 'data_coleta'
+    ) -> np.ndarray:
+        """Máscara booleana; datas seguem o recorte do PostgREST (>= start 00:00, <= end 00:00)"""
+        columns = self.columns
+        mask = ~np.isnan(columns['preco_produto'])
+        if start_date is not None:
+            mask &= columns[date_column] >= np.datetime64(start_date, 'us')
+        if end_date is not None:
+            mask &= columns[date_column] <= np.datetime64(end_date, 'us')
+        if cnpjs and cnpjs != ['all']:
+            codes = [self.dictionaries['cnpj_supermercado'].lookup(c) for c in cnpjs]
+            mask &= np.isin(columns['cnpj_supermercado'], codes)
+        if barcode is not None:
+            mask &= columns['codigo_barras'] == self.dictionaries['codigo_barras'].lookup(barcode)
+        if name_contains:
+            term = name_contains.lower()
+            codes = self.dictionaries['nome_produto_normalizado'].codes_where(lambda value: term in value)
+            mask &= np.isin(columns['nome_produto_normalizado'], codes)
+        if names is not None:
+            codes = [self.dictionaries['nome_produto_normalizado'].lookup(n) for n in names]
+            mask &= np.isin(columns['nome_produto_normalizado'], codes)
+        return mask
+
+    def frame(self, mask: np.ndarray, fields: Optional[List[str]] = None) -> pd.DataFrame:
+        """DataFrame das linhas selecionadas (textos decodificados, datas como datetime64)"""
+        data = {}
+        for field in fields or HOT_COLUMNS:
+            values = self.columns[field][mask]
+            data[field] = self.dictionaries[field].decode(values) if field in STRING_COLUMNS else values
+        return pd.DataFrame(data)
+
+    def records(self, mask: np.ndarray) -> List[Dict[str, Any]]:
+        """Linhas no mesmo formato das respostas do PostgREST (datas em ISO)"""
+        decoded = {}
+        for field in HOT_COLUMNS:
+            values = self.columns[field][mask]
+            if field in STRING_COLUMNS:
+                decoded[field] = self.dictionaries[field].decode(values)
+            elif field in DATE_COLUMNS:
+                decoded[field] = _iso(values)
+            else:
+                decoded[field] = values.tolist()
+        return [dict(zip(decoded, row)) for row in zip(*decoded.values())]
+
+    def group_stats(self, mask: np.ndarray, key: str) -> pd.DataFrame:
+        """count/mean/min/max/std do preço por coluna de texto ou por dia ('dia')"""
+        prices = self.columns['preco_produto'][mask]
+        if key == 'dia':
+            keys = self.columns['data_coleta'][mask].astype('datetime64[D]')
+        else:
+            keys = self.columns[key][mask]
+        labels, inverse = np.unique(keys, return_inverse=True)
+        if len(labels) == 0:
+            return pd.DataFrame(columns=['count', 'mean', 'min', 'max', 'std'])
+        count = np.bincount(inverse, minlength=len(labels))
+        total = np.bincount(inverse, weights=prices, minlength=len(labels))
+        total_sq = np.bincount(inverse, weights=prices * prices, minlength=len(labels))
+        order = np.argsort(inverse, kind='stable')
+        starts = np.r_[0, np.cumsum(count)[:-1]]
+        mean = total / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (total_sq - count * mean * mean) / (count - 1)
+        index = labels if key == 'dia' else self.dictionaries[key].decode(labels)
+        return pd.DataFrame({
+            'count': count,
+            'mean': mean,
+            'min': np.minimum.reduceat(prices[order], starts),
+            'max': np.maximum.reduceat(prices[order], starts),
+            'std': np.sqrt(np.clip(variance, 0, None))
+        }, index=pd.Index(index, name=key))
+
+class HotPriceStore:
+    """Janela recente de produtos; cada atualização publica um novo HotSnapshot"""
+    def __init__(self, window_days: int = HOT_STORE_DAYS):
+        self.window_days = window_days
+        self.current = HotSnapshot(
+            {column: np.empty(0, dtype=self._dtype(column)) for column in HOT_COLUMNS},
+            {column: StringDictionary() for column in STRING_COLUMNS}
+        )
+        self.loaded = False
+        self.window_start: Optional[datetime] = None
+        self.coleta_ids: set = set()
+        self.ultima_coleta_id: Optional[int] = None
+        self.updated_at: Optional[str] = None
+        self._write_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.current)
+
+    @staticmethod
+    def _dtype(column: str):
+        if column in STRING_COLUMNS:
+            return np.int32
+        if column in DATE_COLUMNS:
+            return 'datetime64[us]'
+        return np.float64 if column == 'preco_produto' else np.int64
+
+    # --- Carga e atualização ---
+
+    @staticmethod
+    def _encode(records: List[Dict[str, Any]], dictionaries: Dict[str, StringDictionary]) -> Dict[str, np.ndarray]:
+        columns = {
+            column: dictionaries[column].encode([r.get(column) for r in records])
+            for column in STRING_COLUMNS
+        }
+        columns['preco_produto'] = pd.to_numeric(pd.Series([r.get('preco_produto') for r in records], dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        columns['coleta_id'] = pd.to_numeric(pd.Series([r.get('coleta_id') for r in records], dtype=object), errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        for column in DATE_COLUMNS:
+            columns[column] = _to_datetime64([r.get(column) for r in records])
+        return columns
+
+    def _fetch(self, query_factory, dictionaries: Dict[str, StringDictionary]) -> List[Dict[str, np.ndarray]]:
+        # Paginação por chave (id_registro) em vez de offset: cada página é uma busca no índice
+        chunks = []
+        last_id = None
+        while True:
+            query = query_factory()
+            if last_id is not None:
+                query = query.gt('id_registro', last_id)
+            page = query.order('id_registro').limit(HOT_STORE_PAGE_SIZE).execute().data or []
+            if page:
+                chunks.append(self._encode(page, dictionaries))
+                last_id = page[-1]['id_registro']
+            if len(page) < HOT_STORE_PAGE_SIZE:
+                return chunks
+
+    def _concat(self, chunks: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        return {
+            column: np.concatenate([chunk[column] for chunk in chunks]) if chunks else np.empty(0, dtype=self._dtype(column))
+            for column in HOT_COLUMNS
+        }
+
+    def _window_start(self) -> datetime:
+        return datetime.combine(date.today() - timedelta(days=self.window_days), datetime.min.time())
+
+    def _publish(self, snapshot: HotSnapshot, window_start: datetime, ultima_coleta_id: Optional[int]):
+        self.current = snapshot
+        self.window_start = window_start
+        self.coleta_ids = set(np.unique(snapshot.columns['coleta_id']).tolist())
+        self.ultima_coleta_id = ultima_coleta_id
+        self.updated_at = datetime.now().isoformat()
+        self.loaded = True
+
+    def load(self, supabase_client, ultima_coleta_id: Optional[int] = None):
+        """Carga completa da janela recente (também compacta os dicionários)"""
+        with self._write_lock:
+            window_start = self._window_start()
+            dictionaries = {column: StringDictionary() for column in STRING_COLUMNS}
+            chunks = self._fetch(
+                lambda: supabase_client.table('produtos').select(', '.join(HOT_COLUMNS))
+                    .gte('data_coleta', window_start.isoformat()),
+                dictionaries
+            )
+            self._publish(HotSnapshot(self._concat(chunks), dictionaries), window_start, ultima_coleta_id)
+        logging.info(f"Armazenamento quente carregado: {len(self)} registros desde {window_start.date()} ({self.memory_usage()['total_mb']} MB)")
+
+    def is_current(self, ultima_coleta_id: Optional[int]) -> bool:
+        """A janela já reflete a última coleta concluída informada pelo banco?"""
+        return self.loaded and self.ultima_coleta_id == ultima_coleta_id
+
+    def sync(self, supabase_client, ultima_coleta_id: Optional[int]) -> bool:
+        """Acrescenta as coletas posteriores à última incorporada e descarta o que saiu da janela.
+        Se a última coleta do banco for anterior (coletas excluídas), recarrega tudo.
+        Devolve True quando houve carga completa."""
+        if not self.loaded or ultima_coleta_id is None or self.ultima_coleta_id is None \
+                or ultima_coleta_id < self.ultima_coleta_id:
+            self.load(supabase_client, ultima_coleta_id)
+            return True
+        if ultima_coleta_id == self.ultima_coleta_id:
+            return False
+        with self._write_lock:
+            after_id = self.ultima_coleta_id
+            window_start = self._window_start()
+            # Os dicionários só crescem, então snapshots antigos continuam decodificando certo
+            dictionaries = self.current.dictionaries
+            chunks = self._fetch(
+                lambda: supabase_client.table('produtos').select(', '.join(HOT_COLUMNS))
+                    .gt('coleta_id', after_id).lte('coleta_id', ultima_coleta_id)
+                    .gte('data_coleta', window_start.isoformat()),
+                dictionaries
+            )
+            current = self.current.columns
+            # Linhas de coletas posteriores já presentes (carga concorrente) são substituídas pelas relidas
+            keep = (current['data_coleta'] >= np.datetime64(window_start, 'us')) & (current['coleta_id'] <= after_id)
+            # id_registro não depende da coleta: uma venda recoletada volta com outro coleta_id e
+            # substitui a linha antiga (os códigos são comparáveis, os dicionários são os mesmos)
+            if chunks:
+                fetched_ids = np.concatenate([chunk['id_registro'] for chunk in chunks])
+                keep &= ~np.isin(current['id_registro'], fetched_ids)
+            columns = self._concat([{c: current[c][keep] for c in HOT_COLUMNS}] + chunks)
+            self._publish(HotSnapshot(columns, dictionaries), window_start, ultima_coleta_id)
+        logging.info(f"Armazenamento quente: coletas até #{ultima_coleta_id} incorporadas, {len(self)} registros")
+        return False
+
+    def covers(self, start_date: date) -> bool:
+        """A janela em memória contém todos os registros a partir de start_date?"""
+        return self.loaded and self.window_start is not None and start_date >= self.window_start.date()
+
+    # --- Diagnóstico ---
+
+    def memory_usage(self) -> Dict[str, Any]:
+        snapshot = self.current
+        arrays = {column: int(values.nbytes) for column, values in snapshot.columns.items()}
+        dictionaries = {column: d.nbytes() for column, d in snapshot.dictionaries.items()}
+        total = sum(arrays.values()) + sum(dictionaries.values())
+        return {
+            'carregado': self.loaded,
+            'registros': len(snapshot),
+            'janela_dias': self.window_days,
+            'inicio_janela': self.window_start.isoformat() if self.window_start else None,
+            'coletas': sorted(c for c in self.coleta_ids if c >= 0),
+            'ultima_coleta_id': self.ultima_coleta_id,
+            'atualizado_em': self.updated_at,
+            'arrays_bytes': arrays,
+            'dicionarios_bytes': dictionaries,
+            'valores_distintos': {column: len(d.values) for column, d in snapshot.dictionaries.items()},
+            'total_bytes': total,
+            'total_mb': round(total / (1024 * 1024), 2)
+        }
+
+# Instância global do processo
+hot_store = HotPriceStore()
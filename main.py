@@ -1,6 +1,8 @@
 # main.py (completo e corrigido com as novas permissões) - VERSÃO 3.4.2
 import os
 import asyncio
+import base64
+import json
 from datetime import date, timedelta, datetime
 import logging
 from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, Depends, Header, Request
@@ -11,14 +13,26 @@ from supabase import create_client, Client
 from postgrest.exceptions import APIError
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 import pandas as pd
+import numpy as np
+from collections import Counter
 import collector_service
-from dashboard_routes import dashboard_router
+from dashboard_routes import dashboard_router, invalidate_collection_caches, hot_store_covers, hot_store_ready
 
 # Importar dependências compartilhadas e rotas de subadministradores
-from dependencies import get_current_user, get_current_user_optional, require_page_access, UserProfile, supabase, supabase_admin
+from dependencies import get_current_user, get_current_user_optional, require_page_access, UserProfile, supabase, supabase_admin, get_active_group_counts, invalidate_active_group_counts, fetch_all_rows
 from group_admin_routes import group_admin_router
+from streaming_export import open_pages, csv_chunks, ndjson_chunks, streaming_export_response
+from hot_store import hot_store, HOT_STORE_DAYS
+from product_index import product_index
+from price_analytics import classify_price, cheapest_search_page
+from activity_log import activity_log
+from user_directory import user_directory
+from group_membership import (
+    GroupBatchAdd, GroupBatchRenew, GroupBatchRequest, GroupBatchResult,
+    add_users_to_group, renew_users_in_group, remove_users_from_group
+)
 
 # --------------------------------------------------------------------------
 # --- 1. CONFIGURAÇÕES INICIAIS E VARIÁVEIS DE AMBIENTE ---
@@ -71,6 +85,24 @@ initial_status = {
 }
 collection_status: Dict[str, Any] = initial_status.copy()
 
+@app.on_event("startup")
+async def start_background_services():
+    """Gravação dos logs em lote e carga inicial do diretório de usuários"""
+    activity_log.start(supabase_admin)
+    user_directory.configure(supabase_admin)
+    asyncio.create_task(load_user_directory())
+
+async def load_user_directory():
+    try:
+        await user_directory.refresh()
+    except Exception as e:
+        logging.error(f"Erro ao carregar diretório de usuários: {e}")
+
+@app.on_event("shutdown")
+async def stop_activity_log():
+    """Grava os logs ainda na fila antes de encerrar"""
+    await activity_log.stop()
+
 app.add_middleware(
     CORSMiddleware, 
     allow_origins=ALLOWED_ORIGINS,
@@ -206,6 +238,12 @@ class UserGroupWithDetails(UserGroup):
     user_name: Optional[str] = None
     user_email: Optional[str] = None
 
+class UserGroupPage(BaseModel):
+    data: List[UserGroupWithDetails]
+    total_count: int
+    page: int
+    page_size: int
+
 # MODELO PARA RENOVAÇÃO DE ACESSO
 class UserRenewRequest(BaseModel):
     dias_adicionais: int = Field(..., ge=1, le=365)
@@ -213,111 +251,46 @@ class UserRenewRequest(BaseModel):
 # --------------------------------------------------------------------------
 # --- 5. FUNÇÕES DE LOG ---
 # --------------------------------------------------------------------------
+# Os eventos vão para a fila do activity_log e são gravados em lote por uma tarefa de fundo;
+# nome e email vêm do UserProfile já carregado na autenticação (nenhuma consulta extra).
+
+def _log_identity(user: Optional[UserProfile]) -> Dict[str, Any]:
+    if not user:
+        return {"user_id": None, "user_name": None, "user_email": None}
+    return {"user_id": user.id, "user_name": user.full_name or user.email, "user_email": user.email}
+
 def log_search(term: str, type: str, cnpjs: Optional[List[str]], count: int, user: Optional[UserProfile] = None):
-    """Função para registrar logs de busca, rodando em background."""
-    try:
-        user_id = user.id if user else None
-        user_name = None
-        user_email = None
-        
-        if user_id:
-            try:
-                profile_response = supabase_admin.table('profiles').select('full_name').eq('id', user_id).single().execute()
-                if profile_response.data:
-                    user_name = profile_response.data.get('full_name')
-                
-                auth_response = supabase_admin.auth.admin.get_user_by_id(user_id)
-                if auth_response.user:
-                    user_email = auth_response.user.email
-                    if not user_name:
-                        user_name = user_email
-            except Exception as e:
-                logging.error(f"Erro ao buscar informações do usuário {user_id}: {e}")
-        
-        log_data = {
-            "user_id": user_id,
-            "user_name": user_name,
-            "user_email": user_email,
-            "action_type": "search" if type == 'database' else "realtime_search",
-            "search_term": term,
-            "selected_markets": cnpjs if cnpjs else [],
-            "result_count": count
-        }
-        
-        supabase_admin.table('log_de_usuarios').insert(log_data).execute()
-        logging.info(f"Log de busca salvo para usuário {user_id}: {term}")
-        
-    except Exception as e: 
-        logging.error(f"Erro ao salvar log de busca: {e}")
+    """Registra uma busca (enfileirado, sem I/O na requisição)"""
+    activity_log.enqueue('log_de_usuarios', {
+        **_log_identity(user),
+        "action_type": "search" if type == 'database' else "realtime_search",
+        "search_term": term,
+        "selected_markets": cnpjs if cnpjs else [],
+        "result_count": count
+    })
 
 def log_page_access(page_key: str, user: UserProfile):
-    """Função para registrar o acesso à página, rodando em background."""
-    try:
-        user_name = None
-        user_email = None
-        
-        if user.id:
-            try:
-                profile_response = supabase_admin.table('profiles').select('full_name').eq('id', user.id).single().execute()
-                if profile_response.data:
-                    user_name = profile_response.data.get('full_name')
-                
-                auth_response = supabase_admin.auth.admin.get_user_by_id(user.id)
-                if auth_response.user:
-                    user_email = auth_response.user.email
-                    if not user_name:
-                        user_name = user_email
-            except Exception as e:
-                logging.error(f"Erro ao buscar informações do usuário {user.id}: {e}")
-        
-        log_data = {
-            "user_id": user.id,
-            "user_name": user_name,
-            "user_email": user_email,
-            "action_type": "access",
-            "page_accessed": page_key,
-        }
-        supabase_admin.table('log_de_usuarios').insert(log_data).execute()
-        logging.info(f"Log de acesso salvo para usuário {user.id}: {page_key}")
-    except Exception as e:
-        logging.error(f"Erro ao salvar log de acesso à página {page_key} para {user.id}: {e}")
+    """Registra o acesso a uma página (enfileirado)"""
+    activity_log.enqueue('log_de_usuarios', {
+        **_log_identity(user),
+        "action_type": "access",
+        "page_accessed": page_key,
+    })
 
 def log_custom_action_internal(request: CustomActionRequest, user: Optional[UserProfile]):
-    """Função interna para registrar ações customizadas."""
+    """Registra uma ação customizada (enfileirado)"""
+    row = {
+        **_log_identity(user),
+        "action_type": request.action_type,
+        "page_accessed": request.page,
+        "details": request.details
+    }
+    # O horário vem do cliente: se não for uma data ISO válida, fica o default do banco
     try:
-        user_id = user.id if user else None
-        user_name = None
-        user_email = None
-        
-        if user_id:
-            try:
-                profile_response = supabase_admin.table('profiles').select('full_name').eq('id', user_id).single().execute()
-                if profile_response.data:
-                    user_name = profile_response.data.get('full_name')
-                
-                auth_response = supabase_admin.auth.admin.get_user_by_id(user_id)
-                if auth_response.user:
-                    user_email = auth_response.user.email
-                    if not user_name:
-                        user_name = user_email
-            except Exception as e:
-                logging.error(f"Erro ao buscar informações do usuário {user_id}: {e}")
-        
-        log_data = {
-            "user_id": user_id,
-            "user_name": user_name,
-            "user_email": user_email,
-            "action_type": request.action_type,
-            "page_accessed": request.page,
-            "details": request.details,
-            "created_at": request.timestamp
-        }
-        
-        supabase_admin.table('log_de_usuarios').insert(log_data).execute()
-        logging.info(f"Ação customizada registrada: {request.action_type} para usuário {user_id}")
-        
-    except Exception as e:
-        logging.error(f"Erro ao salvar ação customizada: {e}")
+        row["created_at"] = datetime.fromisoformat(request.timestamp).isoformat()
+    except (TypeError, ValueError):
+        logging.warning(f"Timestamp inválido em ação customizada ignorado: {request.timestamp!r}")
+    activity_log.enqueue('log_de_usuarios', row)
 
 # --------------------------------------------------------------------------
 # --- 6. ENDPOINTS DA APLICAÇÃO ---
@@ -374,6 +347,8 @@ async def update_my_profile(profile_data: ProfileUpdateWithCredentials, current_
             if profile_data.new_password:
                 await asyncio.to_thread(lambda: supabase.auth.update_user({"password": profile_data.new_password}))
 
+        user_directory.put(current_user.id, email=profile_data.email, full_name=profile_data.full_name)
+
         if profile_update_data:
             logging.info(f"Atualizando perfil {current_user.id} com os dados: {profile_update_data}")
             response = await asyncio.to_thread(
@@ -437,6 +412,7 @@ async def create_user(user_data: UserCreate, admin_user: UserProfile = Depends(r
             )
             logging.info(f"Admin de grupo criado com ID {user_id} para grupos: {user_data.managed_groups}")
         
+        user_directory.put(user_id, email=user_data.email, full_name=user_data.full_name, role=user_data.role)
         logging.info(f"Perfil do usuário {user_id} atualizado com a role: {user_data.role}")
         return {"message": "Usuário criado com sucesso"}
     except APIError as e:
@@ -477,6 +453,7 @@ async def update_user(user_id: str, user_data: UserUpdate, admin_user: UserProfi
             raise HTTPException(status_code=400, detail=f"Erro ao atualizar perfil: {error_msg}")
         
         print(f"DEBUG: Perfil atualizado com sucesso: {profile_response.data}")
+        user_directory.put(user_id, full_name=user_data.full_name, role=user_data.role)
         
         # Gerenciar grupos de admin
         if user_data.role == "group_admin":
@@ -535,50 +512,57 @@ async def update_user(user_id: str, user_data: UserUpdate, admin_user: UserProfi
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar usuário: {str(e)}")
         
 @app.get("/api/users")
-async def list_users(admin_user: UserProfile = Depends(require_page_access('users'))):
+async def list_users(
+    page: Optional[int] = Query(None, ge=1, description="Página (sem ela, a lista completa é retornada)"),
+    page_size: int = Query(50, ge=1, le=200),
+    search: Optional[str] = Query(None, description="Trecho do nome ou do email"),
+    role: Optional[str] = Query(None, pattern="^(admin|group_admin|user)$"),
+    sort_by: str = Query('full_name', pattern="^(full_name|email|role)$"),
+    sort_dir: str = Query('asc', pattern="^(asc|desc)$"),
+    admin_user: UserProfile = Depends(require_page_access('users'))
+):
     try:
-        profiles_response = await asyncio.to_thread(
-            supabase.table('profiles').select(
-                'id, full_name, role, allowed_pages, avatar_url'
-            ).execute
+        # Três buscas em lote (perfis, grupos gerenciados e emails) unidas em memória;
+        # perfis e grupos gerenciados são lidos por chave, página a página (limite de 1000 linhas do PostgREST)
+        def profiles_query():
+            query = supabase.table('profiles').select('id, full_name, role, allowed_pages, avatar_url')
+            return query.eq('role', role) if role else query
+
+        profiles, admins = await asyncio.gather(
+            asyncio.to_thread(fetch_all_rows, profiles_query),
+            asyncio.to_thread(fetch_all_rows, lambda: supabase_admin.table('group_admins').select('user_id, group_ids'), 'user_id')
         )
-        profiles = profiles_response.data or []
+        managed_by_user = {admin['user_id']: admin.get('group_ids') or [] for admin in admins}
+        emails = await user_directory.emails(profile['id'] for profile in profiles)
 
-        users = []
-        for profile in profiles:
-            email = None
-            try:
-                auth_response = await asyncio.to_thread(
-                    lambda: supabase_admin.auth.admin.get_user_by_id(profile['id'])
-                )
-                if auth_response.user:
-                    email = auth_response.user.email
-            except Exception as e:
-                logging.error(f"Erro ao buscar e-mail do usuário {profile['id']}: {e}")
-
-            # Buscar grupos gerenciados se for admin de grupo
-            managed_groups = []
-            if profile.get('role') == 'group_admin':
-                try:
-                    admin_response = await asyncio.to_thread(
-                        supabase_admin.table('group_admins').select('group_ids').eq('user_id', profile['id']).execute
-                    )
-                    if admin_response.data:
-                        managed_groups = admin_response.data[0].get('group_ids', [])
-                except Exception as e:
-                    logging.error(f"Erro ao buscar grupos gerenciados: {e}")
-
-            users.append({
+        users = [
+            {
                 "id": profile["id"],
                 "full_name": profile.get("full_name"),
                 "role": profile.get("role"),
                 "allowed_pages": profile.get("allowed_pages"),
                 "avatar_url": profile.get("avatar_url"),
-                "email": email or "N/A",
-                "managed_groups": managed_groups
-            })
+                "email": emails.get(profile['id']) or "N/A",
+                "managed_groups": managed_by_user.get(profile['id'], []) if profile.get('role') == 'group_admin' else []
+            }
+            for profile in profiles
+        ]
 
-        return users
+        if search:
+            termo = search.strip().lower()
+            users = [u for u in users if termo in (u['full_name'] or '').lower() or termo in u['email'].lower()]
+
+        if page is None:
+            return users
+
+        users.sort(key=lambda u: (u[sort_by] or '').lower(), reverse=sort_dir == 'desc')
+        offset = (page - 1) * page_size
+        return {
+            "data": users[offset:offset + page_size],
+            "total_count": len(users),
+            "page": page,
+            "page_size": page_size
+        }
 
     except Exception as e:
         logging.error(f"Erro ao listar usuários: {e}")
@@ -596,6 +580,8 @@ async def delete_user(user_id: str, admin_user: UserProfile = Depends(require_pa
         await asyncio.to_thread(
             lambda: supabase_admin.auth.admin.delete_user(user_id)
         )
+        user_directory.remove(user_id)
+        invalidate_active_group_counts()
         logging.info(f"Usuário com ID {user_id} foi excluído pelo admin {admin_user.id}")
         return
     except Exception as e:
@@ -738,6 +724,7 @@ async def delete_collection(collection_id: int, user: UserProfile = Depends(requ
     await asyncio.to_thread(
         lambda: supabase.table('coletas').delete().eq('id', collection_id).execute()
     )
+    invalidate_collection_caches()
     return
 
 @app.post("/api/prune-by-collections")
@@ -748,6 +735,7 @@ async def prune_by_collections(request: PruneByCollectionsRequest, user: UserPro
         lambda: supabase.table('produtos').delete().eq('cnpj_supermercado', request.cnpj).in_('coleta_id', request.collection_ids).execute()
     )
     deleted_count = len(response.data) if response.data else 0
+    invalidate_collection_caches()
     logging.info(f"Limpeza de dados: {deleted_count} registros apagados para o CNPJ {request.cnpj} das coletas {request.collection_ids}.")
     return {"message": "Operação de limpeza concluída com sucesso.", "deleted_count": deleted_count}
 
@@ -758,35 +746,69 @@ async def get_collections_by_market(cnpj: str, user: UserProfile = Depends(requi
     )
     return response.data
 
+# --- PAGINAÇÃO POR CURSOR (KEYSET) ---
+# Ordem estável por (created_at, id) decrescente; o cursor é a chave da última linha entregue,
+# então cada página custa o mesmo que a primeira, independente da profundidade.
+
+def encode_cursor(created_at: str, row_id: Any) -> str:
+    raw = json.dumps([created_at, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+def keyset_query(query, cursor: Optional[str], page_size: int, id_column: str):
+    """Aplica o filtro do cursor e a ordenação; busca uma linha a mais para saber se há próxima página"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",{id_column}.lt."{row_id}")'
+        )
+    return query.order('created_at', desc=True).order(id_column, desc=True).limit(page_size + 1)
+
+def keyset_page(rows: List[Dict[str, Any]], page_size: int, id_column: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Corta a linha extra e gera o cursor da próxima página (None na última)"""
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1][id_column])
+
 # --- LOGS DE USUÁRIOS ---
 @app.get("/api/user-logs")
 async def get_user_logs(
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None),
     page_size: int = Query(20, ge=1, le=100),
     user_id: Optional[str] = Query(None),
+    user_name: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
     action_type: Optional[str] = Query(None),
     user: UserProfile = Depends(require_page_access('user_logs'))
 ):
     try:
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size - 1
-        
-        query = supabase.table('log_de_usuarios').select('*', count='exact')
+        # Total estimado só na primeira página; as seguintes reaproveitam o do cliente
+        query = supabase.table('log_de_usuarios').select('*', count=None if cursor else 'estimated')
         
         if user_id:
             query = query.eq('user_id', user_id)
+        if user_name:
+            query = query.eq('user_name', user_name)
         if date:
             query = query.gte('created_at', f'{date}T00:00:00').lte('created_at', f'{date}T23:59:59')
         if action_type:
             query = query.eq('action_type', action_type)
         
         response = await asyncio.to_thread(
-            query.order('created_at', desc=True).range(start_index, end_index).execute
+            keyset_query(query, cursor, page_size, 'id').execute
         )
+        rows, next_cursor = keyset_page(response.data or [], page_size, 'id')
         
         user_logs = []
-        for log in response.data:
+        for log in rows:
             user_logs.append({
                 'id': log['id'],
                 'user_id': log.get('user_id'),
@@ -802,10 +824,12 @@ async def get_user_logs(
         
         return {
             "data": user_logs,
-            "total_count": response.count or 0,
-            "page": page,
-            "page_size": page_size
+            "total_count": response.count,
+            "page_size": page_size,
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Erro ao buscar logs de usuários: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno ao buscar logs: {str(e)}")
@@ -850,54 +874,46 @@ async def export_user_logs(
     user_id: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
     action_type: Optional[str] = Query(None),
+    export_format: str = Query('csv', alias='format', pattern='^(csv|ndjson)$'),
+    gzip: bool = Query(False, description="Compactar o arquivo (.gz)"),
     user: UserProfile = Depends(require_page_access('user_logs'))
 ):
     try:
-        import csv
-        import io
-        
-        query = supabase.table('log_de_usuarios').select('*')
-        
-        if user_id:
-            query = query.eq('user_id', user_id)
-        if date:
-            query = query.gte('created_at', f'{date}T00:00:00').lte('created_at', f'{date}T23:59:59')
-        if action_type:
-            query = query.eq('action_type', action_type)
-        
-        response = await asyncio.to_thread(
-            query.order('created_at', desc=True).execute
-        )
-        
-        if not response.data:
+        def logs_query():
+            query = supabase.table('log_de_usuarios').select('*')
+            if user_id:
+                query = query.eq('user_id', user_id)
+            if date:
+                query = query.gte('created_at', f'{date}T00:00:00').lte('created_at', f'{date}T23:59:59')
+            if action_type:
+                query = query.eq('action_type', action_type)
+            return query
+        
+        # Mesma ordem (created_at, id) decrescente da listagem por cursor
+        pages = await open_pages(logs_query, [('created_at', True), ('id', True)])
+        if pages is None:
             raise HTTPException(status_code=404, detail="Nenhum log encontrado para exportação")
         
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        writer.writerow(['ID', 'Usuário', 'Email', 'Ação', 'Termo Pesquisado', 'Mercados', 'Resultados', 'Página Acessada', 'Data/Hora'])
+        filename = f'user_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+        if export_format == 'ndjson':
+            return streaming_export_response(ndjson_chunks(pages), 'application/x-ndjson', filename, gzip)
         
-        for log in response.data:
-            writer.writerow([
+        header = ['ID', 'Usuário', 'Email', 'Ação', 'Termo Pesquisado', 'Mercados', 'Resultados', 'Página Acessada', 'Data/Hora']
+        def log_row(log):
+            return [
                 log['id'],
                 log.get('user_name', ''),
                 log.get('user_email', ''),
                 log.get('action_type', ''),
                 log.get('search_term', ''),
-                ', '.join(log.get('selected_markets', [])),
+                ', '.join(log.get('selected_markets') or []),
                 log.get('result_count', ''),
                 log.get('page_accessed', ''),
                 log.get('created_at', '')
-            ])
-        
-        content = output.getvalue()
-        output.close()
-        
-        return Response(
-            content=content,
-            media_type='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=user_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-        )
+            ]
+        return streaming_export_response(csv_chunks(pages, header, log_row), 'text/csv', filename, gzip)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Erro ao exportar logs: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao exportar logs: {str(e)}")
@@ -924,23 +940,21 @@ async def delete_logs_by_date(
 @app.post("/api/log-page-access")
 async def log_page_access_endpoint(
     request: dict,
-    background_tasks: BackgroundTasks,
     current_user: UserProfile = Depends(get_current_user)
 ):
     page_key = request.get('page_key')
     if not page_key:
         raise HTTPException(status_code=400, detail="page_key é obrigatório")
     
-    background_tasks.add_task(log_page_access, page_key, current_user)
+    log_page_access(page_key, current_user)
     return {"message": "Log de acesso registrado"}
 
 @app.post("/api/log-custom-action")
 async def log_custom_action(
     request: CustomActionRequest,
-    background_tasks: BackgroundTasks,
     current_user: UserProfile = Depends(get_current_user_optional)
 ):
-    background_tasks.add_task(log_custom_action_internal, request, current_user)
+    log_custom_action_internal(request, current_user)
     return {"message": "Ação customizada registrada"}
 
 @app.get("/api/usage-statistics")
@@ -993,55 +1007,147 @@ async def get_usage_statistics(
 
 # --- Endpoints Públicos e de Usuário Logado ---
 @app.get("/api/products-log")
-async def get_products_log(page: int = 1, page_size: int = 50, user: UserProfile = Depends(require_page_access('product_log'))):
-    start_index = (page - 1) * page_size
-    end_index = start_index + page_size - 1
+async def get_products_log(
+    cursor: Optional[str] = Query(None),
+    page_size: int = Query(50, ge=1, le=200),
+    user: UserProfile = Depends(require_page_access('product_log'))
+):
+    query = supabase.table('produtos').select('*', count=None if cursor else 'estimated')
+    response = await asyncio.to_thread(
+        keyset_query(query, cursor, page_size, 'id_registro').execute
+    )
+    rows, next_cursor = keyset_page(response.data or [], page_size, 'id_registro')
+    return {"data": rows, "total_count": response.count, "page_size": page_size, "next_cursor": next_cursor}
+
+async def search_products_hot(q: str, cnpjs: Optional[List[str]], page: int, page_size: int) -> Optional[Dict[str, Any]]:
+    """Busca na janela recente em memória (candidatos do índice invertido), do menor preço ao maior"""
+    names = product_index.names_for(q)
+    if not names:
+        return None
+    snapshot = hot_store.current
+    mask = snapshot.mask(cnpjs=cnpjs, names=names)
+    if not mask.any():
+        return None
+    
+    indices = np.flatnonzero(mask)
+    prices = snapshot.columns['preco_produto'][indices]
+    preco_medio = prices.mean()
+    offset = (page - 1) * page_size
+    page_indices = indices[np.argsort(prices, kind='stable')[offset:offset + page_size]]
+    selected = np.zeros_like(mask)
+    selected[page_indices] = True
+    results = sorted(snapshot.records(selected), key=lambda r: r['preco_produto'])
+    
+    if results:
+        enderecos_resp = await asyncio.to_thread(
+            supabase.table('supermercados').select('cnpj, endereco')
+            .in_('cnpj', list({r['cnpj_supermercado'] for r in results})).execute
+        )
+        enderecos = {m['cnpj']: m.get('endereco') for m in enderecos_resp.data or []}
+    
+    for result in results:
+        preco = result['preco_produto']
+        result['status_preco'] = classify_price(preco, preco_medio)
+        result['supermercados'] = {'endereco': enderecos.get(result['cnpj_supermercado'])}
+    return {"results": results, "total": len(indices), "page": page, "page_size": page_size}
+
+def search_window_start() -> date:
+    """Início da janela de busca: a mesma da janela em memória, para que todos os caminhos
+    de /api/search respondam sobre os mesmos registros"""
+    return date.today() - timedelta(days=HOT_STORE_DAYS)
+
+async def search_products_indexed(q: str, cnpjs: Optional[List[str]], page: int, page_size: int) -> Dict[str, Any]:
+    """Busca ranqueada pelo índice de trigramas do banco (RPC search_produtos)"""
     response = await asyncio.to_thread(
-        supabase.table('produtos').select('*', count='exact').order('created_at', desc=True).range(start_index, end_index).execute
+        supabase.rpc('search_produtos', {
+            'p_termo': q,
+            'p_cnpjs': cnpjs or None,
+            'p_limit': page_size,
+            'p_offset': (page - 1) * page_size,
+            'p_desde': search_window_start().isoformat()
+        }).execute
     )
-    return {"data": response.data, "total_count": response.count}
+    rows = response.data or []
+    results = []
+    for row in rows:
+        result = row['produto']
+        result['supermercados'] = {'endereco': row.get('endereco')}
+        result['relevancia'] = row.get('score')
+        result['status_preco'] = classify_price(float(result['preco_produto']), float(row['preco_medio']))
+        results.append(result)
+    total = rows[0]['total_count'] if rows else 0
+    return {"results": results, "total": total, "page": page, "page_size": page_size}
+
+@app.get("/api/products/suggest")
+async def suggest_products(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Autocompletar de nomes e códigos de barras, ordenado pela frequência nas coletas"""
+    if product_index.ready:
+        return {"suggestions": product_index.suggest(q, limit)}
+    
+    # Índice ainda não carregado: prefixo direto no banco
+    try:
+        response = await asyncio.to_thread(
+            supabase.table('produtos').select('nome_produto_normalizado, codigo_barras')
+            .ilike('nome_produto_normalizado', f"{q.lower().strip()}%")
+            .limit(500).execute
+        )
+    except Exception as e:
+        logging.error(f"Erro ao buscar sugestões de produtos: {e}")
+        return {"suggestions": []}
+    
+    frequencias = Counter((r['nome_produto_normalizado'], r.get('codigo_barras')) for r in response.data or [])
+    return {"suggestions": [
+        {'nome_produto_normalizado': nome, 'codigo_barras': gtin, 'frequencia': total}
+        for (nome, gtin), total in frequencias.most_common(limit)
+    ]}
+
+SEARCH_FALLBACK_ROWS = 500
 
 @app.get("/api/search")
 async def search_products(
     q: str, 
-    background_tasks: BackgroundTasks, 
     cnpjs: Optional[List[str]] = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=100),
     current_user: Optional[UserProfile] = Depends(get_current_user_optional)
 ):
+    # 1) Índice invertido local sobre a janela em memória
+    if product_index.ready and await hot_store_ready():
+        payload = await search_products_hot(q, cnpjs, page, page_size)
+        if payload:
+            log_search(q, 'database', cnpjs, payload['total'], current_user)
+            return payload
+    
+    # 2) Índice de trigramas no banco, na mesma janela (tolerante a erros de digitação)
+    try:
+        payload = await search_products_indexed(q, cnpjs, page, page_size)
+        log_search(q, 'database', cnpjs, payload['total'], current_user)
+        return payload
+    except Exception as e:
+        logging.warning(f"Busca indexada indisponível, usando busca por substring: {e}")
+    
+    # 3) Substring no banco, na mesma janela (ranqueia e pagina as primeiras SEARCH_FALLBACK_ROWS ocorrências)
     termo_busca = f"%{q.lower().strip()}%"
     query = supabase.table('produtos').select(
     '*, supermercados(endereco)'
-).ilike('nome_produto_normalizado', termo_busca)
+).ilike('nome_produto_normalizado', termo_busca).gte('data_coleta', search_window_start().isoformat())
     if cnpjs: 
         query = query.in_('cnpj_supermercado', cnpjs)
     
     response = await asyncio.to_thread(
-        query.limit(500).execute
+        query.limit(SEARCH_FALLBACK_ROWS).execute
     )
     
-    background_tasks.add_task(log_search, q, 'database', cnpjs, len(response.data), current_user)
-    
-    if not response.data: 
-        return {"results": []}
-    
-    df = pd.DataFrame(response.data)
-    df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
-    df.dropna(subset=['preco_produto'], inplace=True)
-    
-    if not df.empty:
-        preco_medio = df['preco_produto'].mean()
-        df['status_preco'] = df['preco_produto'].apply(
-            lambda x: 'Barato' if x < preco_medio * 0.9 else ('Caro' if x > preco_medio * 1.1 else 'Na Média')
-        )
-    
-    df = df.sort_values(by='preco_produto', ascending=True)
-    results = df.head(100).to_dict(orient='records')
-    return {"results": results}
+    payload = cheapest_search_page(response.data or [], page, page_size)
+    log_search(q, 'database', cnpjs, payload['total'], current_user)
+    return payload
 
 @app.post("/api/realtime-search")
 async def realtime_search(
     request: RealtimeSearchRequest, 
-    background_tasks: BackgroundTasks, 
     current_user: Optional[UserProfile] = Depends(get_current_user_optional)
 ):
     if not request.cnpjs: 
@@ -1072,7 +1178,7 @@ async def realtime_search(
         elif resultado:
             resultados_finais.extend(resultado)
     
-    background_tasks.add_task(log_search, request.produto, 'realtime', request.cnpjs, len(resultados_finais), current_user)
+    log_search(request.produto, 'realtime', request.cnpjs, len(resultados_finais), current_user)
     
     return {"results": sorted(resultados_finais, key=lambda x: x.get('preco_produto', float('inf')))}
 
@@ -1083,21 +1189,34 @@ async def get_price_history(request: PriceHistoryRequest, user: UserProfile = De
     if (request.end_date - request.start_date).days > 30: 
         raise HTTPException(status_code=400, detail="O período não pode exceder 30 dias.")
     
-    query = supabase.table('produtos').select('nome_supermercado, preco_produto, data_ultima_venda').in_('cnpj_supermercado', request.cnpjs).gte('data_ultima_venda', str(request.start_date)).lte('data_ultima_venda', str(request.end_date))
+    is_barcode = request.product_identifier.isdigit() and len(request.product_identifier) > 7
     
-    if request.product_identifier.isdigit() and len(request.product_identifier) > 7:
-        query = query.eq('codigo_barras', request.product_identifier)
+    # data_ultima_venda <= data_coleta, então a janela em memória cobre o período se começar antes dele
+    if await hot_store_covers(request.start_date):
+        snapshot = hot_store.current
+        mask = snapshot.mask(
+            request.start_date, request.end_date, request.cnpjs,
+            barcode=request.product_identifier if is_barcode else None,
+            name_contains=None if is_barcode else request.product_identifier,
+            date_column='data_ultima_venda'
+        )
+        df = snapshot.frame(mask, ['nome_supermercado', 'preco_produto', 'data_ultima_venda'])
     else:
-        query = query.like('nome_produto_normalizado', f"%{request.product_identifier.lower()}%")
-    
-    response = await asyncio.to_thread(
-        query.execute
-    )
+        query = supabase.table('produtos').select('nome_supermercado, preco_produto, data_ultima_venda').in_('cnpj_supermercado', request.cnpjs).gte('data_ultima_venda', str(request.start_date)).lte('data_ultima_venda', str(request.end_date))
+        
+        if is_barcode:
+            query = query.eq('codigo_barras', request.product_identifier)
+        else:
+            query = query.like('nome_produto_normalizado', f"%{request.product_identifier.lower()}%")
+        
+        response = await asyncio.to_thread(
+            query.execute
+        )
+        df = pd.DataFrame(response.data)
     
-    if not response.data: 
+    if df.empty: 
         return {}
     
-    df = pd.DataFrame(response.data)
     df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
     df.dropna(subset=['preco_produto', 'data_ultima_venda'], inplace=True)
     df['data_ultima_venda'] = pd.to_datetime(df['data_ultima_venda']).dt.date
@@ -1314,7 +1433,6 @@ async def delete_basket(
 async def get_basket_realtime_prices(
     basket_id: int,
     cnpjs: List[str] = Query(..., description="Lista de CNPJs dos mercados para pesquisa."),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     current_user: UserProfile = Depends(require_page_access('baskets'))
 ):
     basket_resp = await asyncio.to_thread(
@@ -1364,7 +1482,7 @@ async def get_basket_realtime_prices(
             resultados_finais.extend(resultado)
             
     basket_name = basket_data.get('nome', f"Cesta #{basket_id}")
-    background_tasks.add_task(log_search, f"[Cesta: {basket_name}]", 'realtime', cnpjs, len(resultados_finais), current_user)
+    log_search(f"[Cesta: {basket_name}]", 'realtime', cnpjs, len(resultados_finais), current_user)
     
     return {"results": sorted(resultados_finais, key=lambda x: (x.get('nome_produto_normalizado', ''), x.get('preco_produto', float('inf'))))}
 
@@ -1507,6 +1625,7 @@ async def add_user_to_group(
             resp = await asyncio.to_thread(
                 supabase.table('user_groups').insert(user_group_data).execute
             )
+        invalidate_active_group_counts()
         
         logging.info(f"Usuário {user_group.user_id} adicionado/atualizado no grupo {user_group.group_id}")
         return resp.data[0]
@@ -1517,73 +1636,125 @@ async def add_user_to_group(
         logging.error(f"Erro ao adicionar usuário ao grupo: {e}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Erro ao adicionar usuário ao grupo: {str(e)}")
 
-@app.get("/api/user-groups", response_model=List[UserGroupWithDetails])
+# --- Operações em lote (N usuários x 1 grupo) ---
+# Declaradas antes de /api/user-groups/{user_group_id}/... para que "batch" não seja lido como id
+@app.post("/api/user-groups/batch", response_model=GroupBatchResult)
+async def add_users_to_group_batch(
+    batch: GroupBatchAdd,
+    admin_user: UserProfile = Depends(require_page_access('group_admin_users'))
+):
+    try:
+        group_resp = await asyncio.to_thread(
+            supabase.table('grupos').select('dias_acesso').eq('id', batch.group_id).execute
+        )
+        if not group_resp.data:
+            raise HTTPException(status_code=404, detail="Grupo não encontrado")
+        return await add_users_to_group(
+            supabase, batch.user_ids, batch.group_id, group_resp.data[0]['dias_acesso'], batch.data_expiracao
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Erro ao adicionar usuários ao grupo em lote: {e}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Erro ao adicionar usuários ao grupo: {str(e)}")
+
+@app.post("/api/user-groups/batch/renew", response_model=GroupBatchResult)
+async def renew_users_batch(
+    batch: GroupBatchRenew,
+    admin_user: UserProfile = Depends(require_page_access('group_admin_users'))
+):
+    try:
+        return await renew_users_in_group(supabase, batch.user_ids, batch.group_id, batch.dias_adicionais)
+    except Exception as e:
+        logging.error(f"Erro ao renovar acessos em lote: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro ao renovar acessos: {str(e)}")
+
+@app.post("/api/user-groups/batch/remove", response_model=GroupBatchResult)
+async def remove_users_batch(
+    batch: GroupBatchRequest,
+    admin_user: UserProfile = Depends(require_page_access('group_admin_users'))
+):
+    try:
+        return await remove_users_from_group(supabase, batch.user_ids, batch.group_id)
+    except Exception as e:
+        logging.error(f"Erro ao remover usuários do grupo em lote: {e}", exc_info=True)
+        raise HTTPException(status_code=400, detail="Erro ao remover usuários do grupo")
+
+# Associações com o grupo embutido (grupos(nome, dias_acesso)); nome e email do usuário vêm do user_directory
+USER_GROUP_DETAILS_SELECT = 'id, user_id, group_id, data_expiracao, created_at, grupos(nome, dias_acesso)'
+
+def fetch_all_user_groups(query_factory) -> List[dict]:
+    """Todas as associações da consulta (página a página pelo id), na ordem das páginas: created_at e id decrescentes"""
+    rows = fetch_all_rows(query_factory)
+    rows.sort(key=lambda row: (datetime.fromisoformat(row['created_at']), row['id']), reverse=True)
+    return rows
+
+async def user_group_details(rows: List[dict], skip_missing_groups: bool = False) -> List[UserGroupWithDetails]:
+    """Monta UserGroupWithDetails a partir das linhas com o embed de grupos; nomes e emails resolvidos em lote"""
+    usuarios = await user_directory.get_many(row['user_id'] for row in rows)
+    details = []
+    for row in rows:
+        grupo = row.get('grupos')
+        if not grupo:
+            if skip_missing_groups:
+                continue
+            grupo = {'nome': 'Grupo Não Encontrado', 'dias_acesso': 0}
+        usuario = usuarios.get(row['user_id'], {})
+        details.append(UserGroupWithDetails(
+            id=row['id'],
+            user_id=row['user_id'],
+            group_id=row['group_id'],
+            data_expiracao=row['data_expiracao'],
+            created_at=row['created_at'],
+            grupo_nome=grupo['nome'],
+            grupo_dias_acesso=grupo['dias_acesso'],
+            user_name=usuario.get('full_name') or 'N/A',
+            user_email=usuario.get('email') or 'N/A'
+        ))
+    return details
+
+@app.get("/api/user-groups", response_model=Union[List[UserGroupWithDetails], UserGroupPage])
 async def list_user_groups(
     user_id: Optional[str] = Query(None),
     group_id: Optional[int] = Query(None),
+    status: Optional[str] = Query(None, pattern="^(ativo|expirado)$"),
+    page: Optional[int] = Query(None, ge=1, description="Página (sem ela, a lista completa é retornada)"),
+    page_size: int = Query(50, ge=1, le=500),
     admin_user: UserProfile = Depends(require_page_access('group_admin_users'))
 ):
     try:
-        query = supabase_admin.table('user_groups').select('*')
-        
-        if user_id:
-            query = query.eq('user_id', user_id)
-        if group_id:
-            query = query.eq('group_id', group_id)
-            
+        def user_groups_query(count: Optional[str] = None):
+            query = supabase_admin.table('user_groups').select(USER_GROUP_DETAILS_SELECT, count=count)
+            if user_id:
+                query = query.eq('user_id', user_id)
+            if group_id:
+                query = query.eq('group_id', group_id)
+            if status == 'ativo':
+                query = query.gte('data_expiracao', date.today().isoformat())
+            elif status == 'expirado':
+                query = query.lt('data_expiracao', date.today().isoformat())
+            return query
+        
+        if page is None:
+            # Lista completa: lida em páginas, o PostgREST devolve no máximo 1000 linhas por resposta
+            rows = await asyncio.to_thread(fetch_all_user_groups, user_groups_query)
+            return await user_group_details(rows)
+        
+        offset = (page - 1) * page_size
         user_groups_response = await asyncio.to_thread(
-            query.order('created_at', desc=True).execute
+            user_groups_query('exact')
+            .order('created_at', desc=True).order('id', desc=True)
+            .range(offset, offset + page_size - 1)
+            .execute
         )
+        details = await user_group_details(user_groups_response.data or [])
         
-        # Se não há dados, retornar lista vazia imediatamente
-        if not user_groups_response.data:
-            return []
-        
-        user_groups_with_details = []
-        
-        for user_group in user_groups_response.data:
-            try:
-                # Buscar informações do grupo
-                group_response = await asyncio.to_thread(
-                    supabase_admin.table('grupos').select('*').eq('id', user_group['group_id']).execute
-                )
-                grupo_data = group_response.data[0] if group_response.data else {'nome': 'Grupo Não Encontrado', 'dias_acesso': 0}
-                
-                # Buscar informações do perfil
-                profile_response = await asyncio.to_thread(
-                    supabase_admin.table('profiles').select('full_name').eq('id', user_group['user_id']).execute
-                )
-                user_name = profile_response.data[0]['full_name'] if profile_response.data else 'N/A'
-                
-                # Buscar email do usuário
-                user_email = "N/A"
-                try:
-                    auth_response = await asyncio.to_thread(
-                        lambda: supabase_admin.auth.admin.get_user_by_id(user_group['user_id'])
-                    )
-                    if auth_response.user:
-                        user_email = auth_response.user.email
-                except Exception as e:
-                    logging.error(f"Erro ao buscar email do usuário {user_group['user_id']}: {e}")
-                
-                user_group_detail = UserGroupWithDetails(
-                    id=user_group['id'],
-                    user_id=user_group['user_id'],
-                    group_id=user_group['group_id'],
-                    data_expiracao=user_group['data_expiracao'],
-                    created_at=user_group['created_at'],
-                    grupo_nome=grupo_data['nome'],
-                    grupo_dias_acesso=grupo_data['dias_acesso'],
-                    user_name=user_name,
-                    user_email=user_email
-                )
-                user_groups_with_details.append(user_group_detail)
-                
-            except Exception as e:
-                logging.error(f"Erro ao processar user_group {user_group.get('id')}: {e}")
-                continue  # Continuar com os próximos registros mesmo se um falhar
-        
-        return user_groups_with_details
+        return UserGroupPage(
+            data=details,
+            total_count=user_groups_response.count or 0,
+            page=page,
+            page_size=page_size
+        )
         
     except Exception as e:
         logging.error(f"Erro ao listar associações usuário-grupo: {e}", exc_info=True)
@@ -1595,59 +1766,12 @@ async def get_user_groups(
     admin_user: UserProfile = Depends(require_page_access('group_admin_users'))
 ):
     try:
-        user_groups_response = await asyncio.to_thread(
-            supabase_admin.table('user_groups').select('*')
-            .eq('user_id', user_id)
-            .order('created_at', desc=True)
-            .execute
+        rows = await asyncio.to_thread(
+            fetch_all_user_groups,
+            lambda: supabase_admin.table('user_groups').select(USER_GROUP_DETAILS_SELECT).eq('user_id', user_id)
         )
-        
-        # Se não há dados, retornar lista vazia
-        if not user_groups_response.data:
-            return []
-        
-        user_groups = []
-        
-        for user_group in user_groups_response.data:
-            try:
-                group_response = await asyncio.to_thread(
-                    supabase_admin.table('grupos').select('*').eq('id', user_group['group_id']).execute
-                )
-                
-                if group_response.data:
-                    profile_response = await asyncio.to_thread(
-                        supabase_admin.table('profiles').select('full_name').eq('id', user_id).execute
-                    )
-                    
-                    user_email = "N/A"
-                    try:
-                        auth_response = await asyncio.to_thread(
-                            lambda: supabase_admin.auth.admin.get_user_by_id(user_id)
-                        )
-                        if auth_response.user:
-                            user_email = auth_response.user.email
-                    except Exception as e:
-                        logging.error(f"Erro ao buscar email do usuário {user_id}: {e}")
-                    
-                    user_name = profile_response.data[0]['full_name'] if profile_response.data else 'N/A'
-                    
-                    group_detail = UserGroupWithDetails(
-                        id=user_group['id'],
-                        user_id=user_group['user_id'],
-                        group_id=user_group['group_id'],
-                        data_expiracao=user_group['data_expiracao'],
-                        created_at=user_group['created_at'],
-                        grupo_nome=group_response.data[0]['nome'],
-                        grupo_dias_acesso=group_response.data[0]['dias_acesso'],
-                        user_name=user_name,
-                        user_email=user_email
-                    )
-                    user_groups.append(group_detail)
-            except Exception as e:
-                logging.error(f"Erro ao processar grupo do usuário {user_id}: {e}")
-                continue
-        
-        return user_groups
+        # Associações cujo grupo não existe mais ficam de fora, como antes
+        return await user_group_details(rows, skip_missing_groups=True)
         
     except Exception as e:
         logging.error(f"Erro ao buscar grupos do usuário: {e}")
@@ -1688,23 +1812,17 @@ async def get_my_groups_detailed(current_user: UserProfile = Depends(get_current
             )
             groups = groups_response.data or []
         
+        # Usuários ativos de todos os grupos numa consulta agregada (em cache)
+        active_counts = await get_active_group_counts()
+        
         # Formatar resposta para o frontend
         groups_with_details = []
         for group in groups:
-            # Contar usuários ativos no grupo
-            user_groups_response = await asyncio.to_thread(
-                supabase_admin.table('user_groups')
-                .select('user_id', count='exact')
-                .eq('group_id', group['id'])
-                .gte('data_expiracao', date.today().isoformat())
-                .execute
-            )
-            
             group_with_details = {
                 'group_id': group['id'],
                 'grupo_nome': group['nome'],
                 'grupo_dias_acesso': group['dias_acesso'],
-                'usuarios_ativos': user_groups_response.count or 0,
+                'usuarios_ativos': active_counts.get(group['id'], 0),
                 'descricao': group.get('descricao', ''),
                 'created_at': group.get('created_at')
             }
@@ -1727,6 +1845,7 @@ async def delete_user_group(
         await asyncio.to_thread(
             lambda: supabase.table('user_groups').delete().eq('id', user_group_id).execute()
         )
+        invalidate_active_group_counts()
         return
     except Exception as e:
         logging.error(f"Erro ao deletar associação usuário-grupo {user_group_id}: {e}")
@@ -1775,6 +1894,7 @@ async def renew_user_group_access(
             .eq('id', user_group_id)
             .execute()
         )
+        invalidate_active_group_counts()
         
         return {"message": f"Acesso renovado por {dias_adicionais} dias"}
         
@@ -1798,23 +1918,14 @@ async def search_users_for_group_admin(
             .execute
         )
         
+        emails = await user_directory.emails(profile['id'] for profile in profiles_response.data)
+        
         users = []
         for profile in profiles_response.data:
-            # Buscar email
-            email = None
-            try:
-                auth_response = await asyncio.to_thread(
-                    lambda: supabase_admin.auth.admin.get_user_by_id(profile['id'])
-                )
-                if auth_response.user:
-                    email = auth_response.user.email
-            except Exception as e:
-                logging.error(f"Erro ao buscar email do usuário {profile['id']}: {e}")
-            
             users.append({
                 "id": profile["id"],
                 "full_name": profile.get("full_name"),
-                "email": email,
+                "email": emails.get(profile['id']),
                 "role": profile.get("role")
             })
         
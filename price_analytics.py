@@ -0,0 +1,426 @@
+# price_analytics.py - Cálculos vetorizados de preços compartilhados pelo dashboard
+# Funções puras sobre DataFrames (sem acesso ao banco) para poderem ser
+# reutilizadas pelas rotas, pelo coletor e pelos benchmarks.
+
+from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from operator import itemgetter
+import heapq
+import math
+import re
+import unicodedata
+import pandas as pd
+import numpy as np
+
+# --------------------------------------------------------------------------
+# --- CONFIGURAÇÃO E CONSTANTES ---
+# --------------------------------------------------------------------------
+
+# Categorias para análise
+PRODUCT_CATEGORIES = {
+    'Alimentos Básicos': ['arroz', 'feijao', 'acucar', 'oleo', 'farinha', 'macarrao', 'sal', 'fuba'],
+    'Carnes': ['carne', 'frango', 'peixe', 'bovina', 'suina', 'linguica', 'bacon', 'file', 'contra'],
+    'Laticínios': ['leite', 'queijo', 'manteiga', 'iogurte', 'requeijao', 'coalhada', 'creme', 'ninho'],
+    'Hortifruti': ['fruta', 'verdura', 'legume', 'alface', 'tomate', 'cebola', 'batata', 'cenoura', 'banana'],
+    'Bebidas': ['refrigerante', 'suco', 'agua', 'cerveja', 'vinho', 'cafe', 'cha', 'energetico'],
+    'Limpeza': ['sabao', 'detergente', 'desinfetante', 'alcool', 'agua sanitaria', 'amaciante', 'multiuso'],
+    'Higiene': ['shampoo', 'sabonete', 'pasta dental', 'papel higienico', 'desodorante', 'condicionador'],
+    'Padaria': ['pao', 'bolo', 'bisnaguinha', 'rosquinha', 'torrada', 'croissant', 'baguete'],
+    'Enlatados': ['conserva', 'sardinha', 'milho', 'ervilha', 'seleta', 'atum', 'molho'],
+    'Grãos': ['lentilha', 'grao', 'ervilha', 'milho', 'soja', 'trigo', 'aveia'],
+    'Outros': []
+}
+
+PRICE_ALERT_THRESHOLD = 0.08 # 8% de variação para alerta
+PRICE_ALERT_SEVERE = 15      # variação (%) a partir da qual o alerta é de gravidade ALTA
+PRICE_ALERT_TOP_K = 20
+
+# Palavras usadas como segunda tentativa quando nenhuma categoria casa
+FALLBACK_ENLATADOS = ['molho', 'ketchup', 'mostarda', 'maionese']
+
+# --------------------------------------------------------------------------
+# --- CATEGORIZAÇÃO ---
+# --------------------------------------------------------------------------
+
+CATEGORY_CACHE_SIZE = 200_000
+
+def normalize_product_name(name: str) -> str:
+    """Minúsculas e sem acentos, a mesma forma usada pelas palavras-chave"""
+    if not name:
+        return ''
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', name)
+        if unicodedata.category(c) != 'Mn'
+    ).lower()
+
+class CategoryMatcher:
+    """
+    Casamento de todas as palavras-chave com uma única regex compilada.
+
+    As alternativas ficam ordenadas pela prioridade da categoria e envolvidas
+    num lookahead, então cada posição do nome devolve a palavra-chave de maior
+    prioridade que começa ali (inclusive sobrepostas). A categoria final é a
+    de menor prioridade encontrada, igual à regra "primeira categoria que casar".
+    """
+    def __init__(self, categories: Dict[str, List[str]], fallback: Dict[str, List[str]], default: str = 'Outros'):
+        self.default = default
+        self._labels = list(categories.keys()) + list(fallback.keys())
+        self._priority = {}
+        for priority, keywords in enumerate(list(categories.values()) + list(fallback.values())):
+            for keyword in keywords:
+                self._priority.setdefault(keyword, priority)
+        ordered = sorted(self._priority, key=lambda kw: (self._priority[kw], -len(kw)))
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(kw) for kw in ordered) + '))') if ordered else None
+
+    def categorize(self, product_name: str) -> str:
+        if self._pattern is None:
+            return self.default
+        best = None
+        for match in self._pattern.finditer(normalize_product_name(product_name)):
+            priority = self._priority[match.group(1)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self._labels[best] if best is not None else self.default
+
+CATEGORY_MATCHER = CategoryMatcher(PRODUCT_CATEGORIES, {'Enlatados': FALLBACK_ENLATADOS})
+
+@lru_cache(maxsize=CATEGORY_CACHE_SIZE)
+def categorize_product_name(product_name: str) -> str:
+    """Retorna a categoria de um nome de produto (primeira categoria que casar), com cache por nome"""
+    return CATEGORY_MATCHER.categorize(product_name)
+
+def assign_categories(names: pd.Series) -> pd.Series:
+    """Categoriza uma coluna de nomes avaliando cada nome distinto uma única vez"""
+    codes, uniques = pd.factorize(names.fillna(''), sort=False)
+    categories = np.array([categorize_product_name(name) for name in uniques], dtype=object)
+    if len(categories) == 0:
+        return pd.Series([], index=names.index, dtype=object)
+    return pd.Series(categories[codes], index=names.index)
+
+def ensure_categories(df: pd.DataFrame, name_column: str = 'nome_produto') -> pd.DataFrame:
+    """
+    Garante a coluna `categoria` no DataFrame.
+
+    Linhas coletadas já trazem a categoria gravada; registros antigos (coluna
+    ausente ou nula) são completados pelo mapeamento em cache.
+    """
+    if df.empty:
+        df['categoria'] = pd.Series(dtype=object)
+        return df
+    if 'categoria' not in df.columns:
+        df['categoria'] = assign_categories(df[name_column])
+        return df
+    missing = df['categoria'].isna()
+    if missing.any():
+        df.loc[missing, 'categoria'] = assign_categories(df.loc[missing, name_column])
+    return df
+
+# --------------------------------------------------------------------------
+# --- MÉTRICAS AVANÇADAS ---
+# --------------------------------------------------------------------------
+
+def _coefficient_of_variation(grouped: pd.DataFrame) -> pd.Series:
+    """std/mean de um agregado com colunas 'std' e 'mean'"""
+    return grouped['std'] / grouped['mean']
+
+def compute_advanced_metrics(
+    df: pd.DataFrame,
+    previous_df: Optional[pd.DataFrame] = None,
+    variation_threshold: float = 0.0
+) -> Dict[str, Any]:
+    """
+    Calcula as métricas de /advanced-metrics com agregações agrupadas.
+
+    Espera `preco_produto` já numérico e sem nulos. Cada métrica por produto,
+    mercado ou categoria é feita com um único groupby em vez de filtrar o
+    DataFrame inteiro para cada valor distinto.
+    """
+    prices = df['preco_produto']
+    current_avg = prices.mean()
+
+    previous_avg = 0
+    previous_by_product = None
+    if previous_df is not None and not previous_df.empty:
+        previous_avg = previous_df['preco_produto'].mean()
+        previous_by_product = previous_df.groupby('nome_produto_normalizado', sort=False)['preco_produto'].mean()
+
+    inflacao_mensal = ((current_avg - previous_avg) / previous_avg * 100) if previous_avg > 0 else 0
+    volatilidade_geral = prices.std() / current_avg
+
+    # Índice de confiança: 1 - média do coeficiente de variação por produto
+    by_product = df.groupby('nome_produto_normalizado', sort=False)['preco_produto'].agg(['mean', 'std', 'count'])
+    variations = _coefficient_of_variation(by_product[by_product['count'] > 1])
+    indice_confianca = 1 - (variations.mean() if not variations.empty else 0)
+
+    # Produtos em alta/baixa em relação ao período anterior
+    produtos_em_alta = 0
+    produtos_em_baixa = 0
+    if previous_by_product is not None:
+        joined = by_product[['mean']].join(previous_by_product.rename('previous'), how='inner')
+        joined = joined[joined['previous'] > 0]
+        change = (joined['mean'] - joined['previous']) / joined['previous']
+        produtos_em_alta = int((change > variation_threshold).sum())
+        produtos_em_baixa = int((change < -variation_threshold).sum())
+
+    # Mercado mais competitivo (menor preço médio)
+    by_market = df.groupby('nome_supermercado', sort=False)['preco_produto'].mean()
+    mercado_mais_competitivo = by_market.idxmin() if not by_market.empty else "N/A"
+
+    # Categoria mais volátil
+    by_category = ensure_categories(df).groupby('categoria', sort=False)['preco_produto'].agg(['mean', 'std'])
+    category_volatility = _coefficient_of_variation(by_category).dropna()
+    categoria_mais_volatil = category_volatility.idxmax() if not category_volatility.empty else "N/A"
+
+    return {
+        'inflacao_mensal': inflacao_mensal,
+        'volatilidade_geral': volatilidade_geral,
+        'indice_confianca': indice_confianca,
+        'produtos_em_alta': produtos_em_alta,
+        'produtos_em_baixa': produtos_em_baixa,
+        'mercado_mais_competitivo': mercado_mais_competitivo,
+        'categoria_mais_volatil': categoria_mais_volatil
+    }
+
+# --------------------------------------------------------------------------
+# --- ALERTAS DE PREÇO ---
+# --------------------------------------------------------------------------
+
+def _most_common_market(df: pd.DataFrame, products: pd.Index) -> pd.Series:
+    """Mercado mais frequente (moda, empate pelo menor nome) de cada produto informado"""
+    rows = df[df['nome_produto_normalizado'].isin(products)]
+    counts = rows.groupby(['nome_produto_normalizado', 'nome_supermercado']).size().reset_index(name='n')
+    counts = counts.sort_values(['nome_produto_normalizado', 'n', 'nome_supermercado'], ascending=[True, False, True])
+    return counts.drop_duplicates('nome_produto_normalizado').set_index('nome_produto_normalizado')['nome_supermercado']
+
+def generate_price_alerts(
+    current_df: pd.DataFrame,
+    previous_df: pd.DataFrame,
+    threshold: float = PRICE_ALERT_THRESHOLD,
+    top_k: int = PRICE_ALERT_TOP_K
+) -> List[Dict[str, Any]]:
+    """
+    Compara o preço médio por produto entre dois períodos e devolve os alertas.
+
+    Os agregados de cada período são calculados com um groupby, unidos por
+    produto e filtrados pela variação; apenas os `top_k` maiores em valor
+    absoluto são detalhados (mercado mais comum e código de barras).
+    """
+    if current_df.empty or previous_df is None or previous_df.empty:
+        return []
+
+    product_key = 'nome_produto_normalizado'
+    current = current_df.groupby(product_key, sort=False)['preco_produto'].mean().rename('preco_atual')
+    previous = previous_df.groupby(product_key, sort=False)['preco_produto'].mean().rename('preco_anterior')
+
+    joined = pd.concat([current, previous], axis=1, join='inner')
+    joined = joined[joined['preco_anterior'] > 0]
+    joined['variacao'] = (joined['preco_atual'] - joined['preco_anterior']) / joined['preco_anterior'] * 100
+
+    abs_variation = joined['variacao'].abs()
+    flagged = abs_variation[abs_variation >= threshold * 100]
+    if flagged.empty:
+        return []
+
+    top = joined.loc[flagged.nlargest(top_k).index]
+    markets = _most_common_market(current_df, top.index)
+    if 'codigo_barras' in current_df.columns:
+        barcodes = current_df[current_df[product_key].isin(top.index)].groupby(product_key)['codigo_barras'].first()
+    else:
+        barcodes = pd.Series(dtype=object)
+
+    return [
+        {
+            'produto': product,
+            'codigo_barras': barcodes.get(product) or "",
+            'variacao': round(row.variacao, 2),
+            'tipo': "ALTA" if row.variacao > 0 else "BAIXA",
+            'mercado': markets.get(product, "N/A"),
+            'preco_atual': round(row.preco_atual, 2),
+            'preco_anterior': round(row.preco_anterior, 2),
+            'gravidade': "ALTA" if abs(row.variacao) > PRICE_ALERT_SEVERE else "MEDIA"
+        }
+        for product, row in zip(top.index, top.itertuples(index=False))
+    ]
+
+# --------------------------------------------------------------------------
+# --- DETECÇÃO DE ANOMALIAS ---
+# --------------------------------------------------------------------------
+
+ANOMALY_KEYS = ['nome_produto_normalizado', 'nome_supermercado']
+ANOMALY_MIN_GROUP_SIZE = 5
+# Limite padrão de cada método: |z| (z-score), |z robusto| (MAD) e múltiplos do IQR
+ANOMALY_THRESHOLDS = {'zscore': 2.5, 'mad': 3.5, 'iqr': 1.5}
+
+def _anomaly_scores(prices: pd.Series, grouped, method: str, threshold: float):
+    """Retorna (score, máscara de outliers) calculados por grupo com transform"""
+    if method == 'zscore':
+        center = grouped.transform('mean')
+        scale = grouped.transform('std', ddof=0)
+        score = (prices - center).abs() / scale
+        return score, score > threshold
+
+    if method == 'mad':
+        center = grouped.transform('median')
+        deviation = (prices - center).abs()
+        by_group = deviation.groupby(grouped.ngroup(), sort=False)
+        # MAD nulo (maioria dos preços iguais) cai para o desvio absoluto médio
+        scale = (by_group.transform('median') * 1.4826).where(lambda s: s > 0, by_group.transform('mean') * 1.2533)
+        score = deviation / scale
+        return score, score > threshold
+
+    q1 = grouped.transform('quantile', 0.25)
+    q3 = grouped.transform('quantile', 0.75)
+    iqr = q3 - q1
+    lower = q1 - threshold * iqr
+    upper = q3 + threshold * iqr
+    score = (prices - grouped.transform('median')).abs() / iqr
+    return score, (prices < lower) | (prices > upper)
+
+def detect_price_anomalies(
+    df: pd.DataFrame,
+    method: str = 'zscore',
+    min_group_size: int = ANOMALY_MIN_GROUP_SIZE,
+    threshold: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Detecta preços atípicos por (produto, mercado) sem iterar sobre os grupos.
+
+    Estatísticas de cada grupo são calculadas com `transform`, os outliers são
+    marcados por uma máscara booleana e selecionados de uma vez. Métodos:
+    'zscore', 'mad' (z robusto pela mediana) e 'iqr' (cercas de Tukey).
+    O resultado sai ordenado pelo score, do mais atípico para o menos.
+    """
+    if df.empty or 'preco_produto' not in df.columns:
+        return []
+    if method not in ANOMALY_THRESHOLDS:
+        raise ValueError(f"Método de anomalia inválido: {method}")
+    threshold = ANOMALY_THRESHOLDS[method] if threshold is None else threshold
+
+    data = df[df['preco_produto'].notna()]
+    grouped = data.groupby([data[key] for key in ANOMALY_KEYS], sort=False)['preco_produto']
+    sizes = grouped.transform('size')
+
+    score, is_outlier = _anomaly_scores(data['preco_produto'], grouped, method, threshold)
+    selected = is_outlier & (sizes >= max(min_group_size, 2))
+    if not selected.any():
+        return []
+
+    score = score.replace([np.inf, -np.inf], np.nan)
+    outliers = data.loc[selected, ANOMALY_KEYS + ['preco_produto', 'data_coleta']].assign(score=score[selected])
+    outliers = outliers.sort_values('score', ascending=False, na_position='first')
+
+    return [
+        {
+            'produto': produto,
+            'mercado': mercado,
+            'preco': float(preco),
+            'data': data_coleta,
+            'z_score': round(float(valor), 4) if pd.notna(valor) else None,
+            'metodo': method,
+            'tipo': 'OUTLIER'
+        }
+        for produto, mercado, preco, data_coleta, valor in outliers.itertuples(index=False, name=None)
+    ]
+
+# --------------------------------------------------------------------------
+# --- MATRIZ DE PREÇOS ---
+# --------------------------------------------------------------------------
+
+def build_price_matrix(
+    df: pd.DataFrame,
+    row_keys: List[str] = ['codigo_barras', 'cnpj_supermercado'],
+    column: str = 'data_coleta',
+    value: str = 'preco_produto',
+    columns: Optional[List[Any]] = None
+) -> pd.DataFrame:
+    """Matriz larga (uma linha por série, uma coluna por data) com o primeiro preço de cada célula"""
+    matrix = df.groupby(row_keys + [column], sort=False)[value].first().unstack(column)
+    if columns is not None:
+        matrix = matrix.reindex(columns=columns)
+    return matrix
+
+def _matrix_rows(matrix: pd.DataFrame):
+    """Itera (chave 'a_b', lista de preços com None nas células vazias)"""
+    values = matrix.to_numpy(dtype=float)
+    cells = np.where(np.isnan(values), None, values).tolist()
+    for index, row in zip(matrix.index, cells):
+        key = '_'.join(str(part) for part in index) if isinstance(index, tuple) else str(index)
+        yield key, row
+
+def _iso(value) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def price_matrix_to_cells(matrix: pd.DataFrame) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Formato original: {serie: {data: {'preco', 'disponivel'}}}"""
+    dates = [_iso(column) for column in matrix.columns]
+    return {
+        key: {
+            day: {'preco': price, 'disponivel': price is not None}
+            for day, price in zip(dates, prices)
+        }
+        for key, prices in _matrix_rows(matrix)
+    }
+
+def price_matrix_to_columnar(matrix: pd.DataFrame) -> Dict[str, Any]:
+    """Formato compacto: um array de datas e um array de preços (ou None) por série"""
+    return {
+        'dates': [_iso(column) for column in matrix.columns],
+        'series': dict(_matrix_rows(matrix))
+    }
+
+# --------------------------------------------------------------------------
+# --- RESULTADOS DE BUSCA ---
+# --------------------------------------------------------------------------
+
+SEARCH_RESULTS_LIMIT = 100
+
+def classify_price(preco: float, preco_medio: float) -> str:
+    """Barato/Caro a partir de 10% abaixo/acima da média dos resultados"""
+    return 'Barato' if preco < preco_medio * 0.9 else ('Caro' if preco > preco_medio * 1.1 else 'Na Média')
+
+def _price_or_none(value) -> Optional[float]:
+    # Mesmo critério de pd.to_numeric(errors='coerce'): inválidos e NaN viram None
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if price != price else price
+
+def _priced_rows(rows: List[Dict[str, Any]]) -> List[tuple]:
+    priced = []
+    for row in rows:
+        price = _price_or_none(row.get('preco_produto'))
+        if price is not None:
+            priced.append((price, row))
+    return priced
+
+def _cheapest(priced: List[tuple], limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+    if not priced:
+        return []
+
+    preco_medio = math.fsum(price for price, _ in priced) / len(priced)
+    results = []
+    for price, row in heapq.nsmallest(offset + limit, priced, key=itemgetter(0))[offset:]:
+        result = dict(row)
+        result['preco_produto'] = price
+        result['status_preco'] = classify_price(price, preco_medio)
+        results.append(result)
+    return results
+
+def cheapest_search_results(rows: List[Dict[str, Any]], limit: int = SEARCH_RESULTS_LIMIT) -> List[Dict[str, Any]]:
+    """Os `limit` menores preços com status_preco, sem DataFrame (poucas centenas de linhas)"""
+    return _cheapest(_priced_rows(rows), limit)
+
+def cheapest_search_page(rows: List[Dict[str, Any]], page: int, page_size: int) -> Dict[str, Any]:
+    """Página dos resultados do menor preço ao maior, no mesmo formato das buscas indexadas"""
+    priced = _priced_rows(rows)
+    return {
+        "results": _cheapest(priced, page_size, (page - 1) * page_size),
+        "total": len(priced),
+        "page": page,
+        "page_size": page_size
+    }
@@ -0,0 +1,175 @@
+# product_index.py - Índice invertido de produtos em memória (busca e autocompletar)
+# Cada entrada é um par distinto (nome_produto_normalizado, codigo_barras) com a sua
+# frequência de observações. Os termos (palavras do nome sem acento e o GTIN) ficam
+# numa lista ordenada, então a busca por prefixo é um bisect seguido das postings.
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from bisect import bisect_left
+from datetime import datetime
+import heapq
+import logging
+import re
+import sys
+import threading
+import time
+import numpy as np
+
+from price_analytics import normalize_product_name
+
+_TOKEN_RE = re.compile(r'\w+')
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(normalize_product_name(text)) if text else []
+
+def pairs_from_snapshot(snapshot) -> List[Tuple[str, Optional[str], int]]:
+    """Pares distintos (nome, GTIN) do armazenamento quente com o número de observações"""
+    columns = snapshot.columns
+    valid = ~np.isnan(columns['preco_produto']) & (columns['nome_produto_normalizado'] >= 0)
+    if not valid.any():
+        return []
+    keys = np.stack([columns['nome_produto_normalizado'][valid], columns['codigo_barras'][valid]], axis=1)
+    unique, counts = np.unique(keys, axis=0, return_counts=True)
+    nomes = snapshot.dictionaries['nome_produto_normalizado'].decode(unique[:, 0])
+    gtins = snapshot.dictionaries['codigo_barras'].decode(unique[:, 1])
+    return list(zip(nomes, gtins, counts.tolist()))
+
+class ProductIndex:
+    """Índice termo -> postings (ids de entrada), com prefixo via lista ordenada de termos"""
+    def __init__(self):
+        self.entries: List[Tuple[str, Optional[str]]] = []
+        self.frequencies: List[int] = []
+        self._entry_ids: Dict[Tuple[str, Optional[str]], int] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.terms: List[str] = []
+        self.ready = False
+        self.metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    # --- Construção ---
+
+    def _add_entry(self, nome: str, gtin: Optional[str]) -> Set[str]:
+        entry_id = len(self.entries)
+        self.entries.append((nome, gtin))
+        self.frequencies.append(0)
+        self._entry_ids[(nome, gtin)] = entry_id
+        terms = set(tokenize(nome))
+        if gtin:
+            terms.add(gtin)
+        new_terms = set()
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                self.postings[term] = [entry_id]
+                new_terms.add(term)
+            else:
+                postings.append(entry_id)
+        return new_terms
+
+    def update(self, pairs: Iterable[Tuple[str, Optional[str], int]], full: bool = False):
+        """Aplica as frequências atuais; só os pares ainda desconhecidos são tokenizados.
+        Pares ausentes ficam com frequência zero e deixam de aparecer nos resultados."""
+        started = time.perf_counter()
+        with self._lock:
+            if full:
+                self.entries, self.frequencies, self._entry_ids, self.postings = [], [], {}, {}
+            frequencies = [0] * len(self.frequencies)
+            new_terms: Set[str] = set()
+            added = 0
+            for nome, gtin, count in pairs:
+                entry_id = self._entry_ids.get((nome, gtin))
+                if entry_id is None:
+                    new_terms |= self._add_entry(nome, gtin)
+                    frequencies.append(0)
+                    entry_id = len(self.entries) - 1
+                    added += 1
+                frequencies[entry_id] = count
+            self.frequencies = frequencies
+            if full or new_terms:
+                self.terms = sorted(self.postings)
+            self.ready = True
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics = {
+                'tipo_ultima_construcao': 'completa' if full else 'incremental',
+                'entradas_novas': added,
+                'tempo_construcao_ms': round(elapsed_ms, 2),
+                'atualizado_em': datetime.now().isoformat()
+            }
+        logging.info(f"Índice de produtos {'reconstruído' if full else 'atualizado'}: {added} entradas novas em {elapsed_ms:.1f} ms")
+
+    # --- Consulta ---
+
+    def _prefix_postings(self, prefix: str) -> Set[int]:
+        """Entradas com algum termo que começa com o prefixo"""
+        found: Set[int] = set()
+        terms = self.terms
+        i = bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            found.update(self.postings[terms[i]])
+            i += 1
+        return found
+
+    def _matching(self, query_terms: List[str]) -> Set[int]:
+        """Entradas ativas em que cada termo da consulta é prefixo de algum termo do produto"""
+        matched: Optional[Set[int]] = None
+        # Termos mais longos primeiro: conjuntos menores, interseção mais rápida
+        for term in sorted(set(query_terms), key=len, reverse=True):
+            found = self._prefix_postings(term)
+            matched = found if matched is None else matched & found
+            if not matched:
+                return set()
+        frequencies = self.frequencies
+        return {i for i in matched if frequencies[i] > 0}
+
+    def match(self, query: str) -> List[int]:
+        """Entradas que casam com a consulta, da mais frequente para a menos frequente"""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+        with self._lock:
+            frequencies = self.frequencies
+            return sorted(self._matching(query_terms), key=lambda i: -frequencies[i])
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top-k por frequência para o autocompletar (nome e GTIN)"""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+        with self._lock:
+            frequencies = self.frequencies
+            top = heapq.nlargest(limit, self._matching(query_terms), key=lambda i: (frequencies[i], -i))
+            return [
+                {
+                    'nome_produto_normalizado': self.entries[i][0],
+                    'codigo_barras': self.entries[i][1],
+                    'frequencia': frequencies[i]
+                }
+                for i in top
+            ]
+
+    def names_for(self, query: str) -> Set[str]:
+        """Nomes normalizados candidatos para a busca de produtos"""
+        return {self.entries[i][0] for i in self.match(query)}
+
+    # --- Diagnóstico ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total_postings = sum(len(p) for p in self.postings.values())
+            memory = (
+                sys.getsizeof(self.entries) + sys.getsizeof(self._entry_ids) + sys.getsizeof(self.postings)
+                + sys.getsizeof(self.terms) + sys.getsizeof(self.frequencies)
+                + sum(sys.getsizeof(t) for t in self.terms)
+                + sum(sys.getsizeof(p) for p in self.postings.values())
+            )
+            return {
+                'pronto': self.ready,
+                'entradas': len(self.entries),
+                'entradas_ativas': sum(1 for f in self.frequencies if f > 0),
+                'termos': len(self.terms),
+                'postings': total_postings,
+                'memoria_aproximada_mb': round(memory / (1024 * 1024), 2),
+                **self.metrics
+            }
+
+# Instância global do processo
+product_index = ProductIndex()
@@ -0,0 +1,278 @@
+# report_builders.py - Montagem de relatórios e arquivos de exportação do dashboard
+# Funções puras (registros -> relatório/bytes), sem acesso ao banco, para poderem
+# rodar dentro do pool de processos dos jobs de relatório.
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date, datetime
+import io
+import json
+import math
+import pandas as pd
+from scipy import stats
+from sklearn.cluster import DBSCAN
+from sklearn.preprocessing import StandardScaler
+
+from price_analytics import PRODUCT_CATEGORIES, ensure_categories
+
+# --------------------------------------------------------------------------
+# --- CONFIGURAÇÃO E CONSTANTES ---
+# --------------------------------------------------------------------------
+
+EXPORT_COLUMNS = ['nome_produto', 'preco_produto', 'nome_supermercado', 'data_coleta', 'tipo_unidade', 'codigo_barras', 'nome_produto_normalizado']
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json'
+}
+
+# --------------------------------------------------------------------------
+# --- MÉTRICAS ---
+# --------------------------------------------------------------------------
+
+def calculate_advanced_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+    """Calcula métricas avançadas usando estatística e machine learning"""
+    if df.empty:
+        return {}
+
+    metrics = {}
+
+    # Análise de volatilidade
+    prices = df['preco_produto'].dropna()
+    if len(prices) > 1:
+        metrics['volatilidade'] = prices.std() / prices.mean()
+        metrics['assimetria'] = stats.skew(prices)
+        metrics['curtose'] = stats.kurtosis(prices)
+    else:
+        metrics['volatilidade'] = 0
+        metrics['assimetria'] = 0
+        metrics['curtose'] = 0
+
+    # Detecção de outliers usando IQR
+    Q1 = prices.quantile(0.25)
+    Q3 = prices.quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+
+    outliers = prices[(prices < lower_bound) | (prices > upper_bound)]
+    metrics['outliers_count'] = len(outliers)
+    metrics['outliers_percent'] = (len(outliers) / len(prices)) * 100
+
+    # Clusterização de preços (simplificada)
+    if len(prices) > 10:
+        try:
+            price_values = prices.values.reshape(-1, 1)
+            scaler = StandardScaler()
+            prices_scaled = scaler.fit_transform(price_values)
+
+            # DBSCAN para detectar clusters de preços
+            clustering = DBSCAN(eps=0.5, min_samples=5).fit(prices_scaled)
+            metrics['price_clusters'] = len(set(clustering.labels_)) - (1 if -1 in clustering.labels_ else 0)
+        except:
+            metrics['price_clusters'] = 1
+
+    return metrics
+
+# --------------------------------------------------------------------------
+# --- RELATÓRIO ABRANGENTE ---
+# --------------------------------------------------------------------------
+
+def _category_analysis(category_stats: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Linhas por categoria (índice) com count/mean/min/max/std, na ordem de PRODUCT_CATEGORIES"""
+    return [
+        {
+            'categoria': category,
+            'total_produtos': int(row['count']),
+            'preco_medio': round(row['mean'], 2),
+            'preco_minimo': round(row['min'], 2),
+            'preco_maximo': round(row['max'], 2),
+            'volatilidade': round(row['std'] / row['mean'], 4)
+        }
+        for category, row in category_stats.reindex(
+            [c for c in PRODUCT_CATEGORIES if c in category_stats.index]
+        ).iterrows()
+    ]
+
+def build_comprehensive_report(data: pd.DataFrame, start_date: date, end_date: date) -> Optional[Dict[str, Any]]:
+    """Relatório com métricas gerais, por mercado e por categoria (None se não houver preços)"""
+    df = data.copy()
+    df['preco_produto'] = pd.to_numeric(df['preco_produto'], errors='coerce')
+    df = df.dropna(subset=['preco_produto'])
+    if df.empty:
+        return None
+
+    # Métricas principais
+    total_produtos = len(df)
+    total_mercados = df['nome_supermercado'].nunique()
+    preco_medio_geral = df['preco_produto'].mean()
+
+    # Análise por mercado
+    market_analysis = df.groupby('nome_supermercado').agg({
+        'id_registro': 'count',
+        'preco_produto': ['mean', 'min', 'max', 'std']
+    }).reset_index()
+
+    market_analysis.columns = ['mercado', 'total_produtos', 'preco_medio', 'preco_minimo', 'preco_maximo', 'desvio_padrao']
+    market_analysis['volatilidade'] = (market_analysis['desvio_padrao'] / market_analysis['preco_medio']).round(4)
+
+    # Produtos mais caros e mais baratos
+    produtos_mais_caros = df.nlargest(10, 'preco_produto')[['nome_produto', 'preco_produto', 'nome_supermercado']].to_dict('records')
+    produtos_mais_baratos = df.nsmallest(10, 'preco_produto')[['nome_produto', 'preco_produto', 'nome_supermercado']].to_dict('records')
+
+    # Distribuição de preços
+    price_ranges = {
+        'ate_5': len(df[df['preco_produto'] <= 5]),
+        '5_a_10': len(df[(df['preco_produto'] > 5) & (df['preco_produto'] <= 10)]),
+        '10_a_20': len(df[(df['preco_produto'] > 10) & (df['preco_produto'] <= 20)]),
+        '20_a_50': len(df[(df['preco_produto'] > 20) & (df['preco_produto'] <= 50)]),
+        '50_a_100': len(df[(df['preco_produto'] > 50) & (df['preco_produto'] <= 100)]),
+        'acima_100': len(df[df['preco_produto'] > 100])
+    }
+
+    # Análise de categoria
+    category_stats = ensure_categories(df).groupby('categoria')['preco_produto'].agg(['count', 'mean', 'min', 'max', 'std'])
+    category_analysis = _category_analysis(category_stats)
+
+    # Métricas avançadas
+    advanced_metrics = calculate_advanced_metrics(df)
+
+    return {
+        'periodo': {
+            'inicio': str(start_date),
+            'fim': str(end_date)
+        },
+        'metricas_principais': {
+            'total_produtos': total_produtos,
+            'total_mercados': total_mercados,
+            'preco_medio_geral': round(preco_medio_geral, 2),
+            'produto_mais_caro': round(df['preco_produto'].max(), 2),
+            'produto_mais_barato': round(df['preco_produto'].min(), 2),
+            'volatilidade_geral': round(df['preco_produto'].std() / df['preco_produto'].mean(), 4)
+        },
+        'analise_mercados': market_analysis.to_dict('records'),
+        'produtos_destaque': {
+            'mais_caros': produtos_mais_caros,
+            'mais_baratos': produtos_mais_baratos
+        },
+        'distribuicao_precos': price_ranges,
+        'analise_categorias': category_analysis,
+        'metricas_avancadas': advanced_metrics,
+        'timestamp_geracao': datetime.now().isoformat()
+    }
+
+def report_from_aggregates(aggregates: Dict[str, Any], start_date: date, end_date: date) -> Optional[Dict[str, Any]]:
+    """Mesmo relatório de build_comprehensive_report, a partir dos agregados do motor analítico"""
+    principais = aggregates['principais']
+    if not principais['total_produtos']:
+        return None
+
+    market_analysis = aggregates['mercados']
+    market_analysis['volatilidade'] = (market_analysis['desvio_padrao'] / market_analysis['preco_medio']).round(4)
+    destaque_columns = ['nome_produto', 'preco_produto', 'nome_supermercado']
+
+    return {
+        'periodo': {
+            'inicio': str(start_date),
+            'fim': str(end_date)
+        },
+        'metricas_principais': {
+            'total_produtos': int(principais['total_produtos']),
+            'total_mercados': int(principais['total_mercados']),
+            'preco_medio_geral': round(principais['preco_medio_geral'], 2),
+            'produto_mais_caro': round(principais['produto_mais_caro'], 2),
+            'produto_mais_barato': round(principais['produto_mais_barato'], 2),
+            'volatilidade_geral': round(principais['volatilidade_geral'], 4)
+        },
+        'analise_mercados': market_analysis.to_dict('records'),
+        'produtos_destaque': {
+            'mais_caros': aggregates['mais_caros'][destaque_columns].to_dict('records'),
+            'mais_baratos': aggregates['mais_baratos'][destaque_columns].to_dict('records')
+        },
+        'distribuicao_precos': {
+            faixa: int(principais[faixa])
+            for faixa in ['ate_5', '5_a_10', '10_a_20', '20_a_50', '50_a_100', 'acima_100']
+        },
+        'analise_categorias': _category_analysis(aggregates['categorias']),
+        'metricas_avancadas': calculate_advanced_metrics(aggregates['precos']),
+        'timestamp_geracao': datetime.now().isoformat()
+    }
+
+# --------------------------------------------------------------------------
+# --- EXPORTAÇÃO ---
+# --------------------------------------------------------------------------
+
+def _json_safe(value):
+    """Converte NaN/inf e tipos numpy para valores serializáveis em JSON"""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def to_json_bytes(payload: Any) -> bytes:
+    return json.dumps(_json_safe(payload), ensure_ascii=False, default=str).encode('utf-8')
+
+def _iso_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """Datas da janela em memória (datetime64) em ISO, como nas respostas do PostgREST"""
+    converted = {
+        column: [None if pd.isna(value) else value.isoformat() for value in df[column]]
+        for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])
+    }
+    return df.assign(**converted) if converted else df
+
+def build_export(data: pd.DataFrame, start_date: date, end_date: date, export_type: str) -> Tuple[bytes, str]:
+    """Gera o conteúdo do arquivo de exportação e o media type correspondente"""
+    df = _iso_dates(data)
+
+    if export_type == 'csv':
+        # Selecionar colunas relevantes
+        df = df[[col for col in EXPORT_COLUMNS if col in df.columns]]
+        return df.to_csv(index=False).encode('utf-8'), EXPORT_MEDIA_TYPES['csv']
+
+    if export_type == 'xlsx':
+        # Criar Excel com múltiplas abas
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            # Aba principal
+            df.to_excel(writer, sheet_name='Dados Completos', index=False)
+
+            # Aba de resumo
+            summary_data = {
+                'Metrica': ['Total de Produtos', 'Total de Mercados', 'Preço Médio', 'Data Início', 'Data Fim'],
+                'Valor': [
+                    len(df),
+                    df['nome_supermercado'].nunique(),
+                    round(df['preco_produto'].mean(), 2),
+                    start_date.isoformat(),
+                    end_date.isoformat()
+                ]
+            }
+            pd.DataFrame(summary_data).to_excel(writer, sheet_name='Resumo', index=False)
+
+            # Aba de análise por mercado
+            market_analysis = df.groupby('nome_supermercado').agg({
+                'preco_produto': ['count', 'mean', 'min', 'max']
+            }).round(2)
+            market_analysis.columns = ['Total Produtos', 'Preço Médio', 'Preço Mínimo', 'Preço Máximo']
+            market_analysis.reset_index().to_excel(writer, sheet_name='Análise por Mercado', index=False)
+
+        return output.getvalue(), EXPORT_MEDIA_TYPES['xlsx']
+
+    # JSON
+    records = df.to_dict('records')
+    payload = {
+        'periodo': {'start_date': str(start_date), 'end_date': str(end_date)},
+        'total_registros': len(records),
+        'metricas': {
+            'preco_medio': round(df['preco_produto'].mean(), 2),
+            'total_mercados': len(set(item.get('nome_supermercado', '') for item in records)),
+            'periodo_dias': (end_date - start_date).days
+        },
+        'dados': records
+    }
+    return to_json_bytes(payload), EXPORT_MEDIA_TYPES['json']
@@ -0,0 +1,154 @@
+# report_jobs.py - Jobs assíncronos para relatórios e exportações pesadas
+# O endpoint apenas enfileira o job; os builders rodam num pool de processos com
+# concorrência limitada e o resultado fica em cache por (parâmetros, versão dos dados).
+# Jobs, artefatos e execuções em andamento vivem na memória do processo: isso pressupõe um
+# único worker do gunicorn, que é o que o Procfile roda (sem -w; WEB_CONCURRENCY > 1 quebraria
+# o polling, pois o status do job poderia ser consultado num worker que não o conhece).
+# clear_artifacts() avança a geração do cache; um job iniciado numa geração anterior não
+# grava seu artefato, para não servir dados anteriores à alteração.
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+# --------------------------------------------------------------------------
+# --- CONFIGURAÇÃO E CONSTANTES ---
+# --------------------------------------------------------------------------
+
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_CONCURRENT = int(os.getenv("REPORT_JOB_MAX_CONCURRENT", "2"))
+REPORT_ARTIFACT_CACHE_SIZE = 32
+REPORT_JOB_TTL_SECONDS = 3600
+
+JOB_PENDENTE = 'pendente'
+JOB_EXECUTANDO = 'executando'
+JOB_CONCLUIDO = 'concluido'
+JOB_FALHOU = 'falhou'
+
+# Um artefato é {'content': bytes, 'media_type': str, 'filename': str}
+ArtifactProducer = Callable[[], Awaitable[Dict[str, Any]]]
+
+class ReportJobManager:
+    """Fila de jobs de relatório com pool de processos e cache de artefatos"""
+    def __init__(self, max_workers: int, max_concurrent: int, cache_size: int, ttl_seconds: int):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.ttl = ttl_seconds
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.artifacts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[int, asyncio.Task]] = {}
+        self.generation = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def artifact_key(kind: str, params: Dict[str, Any], data_version: Any) -> str:
+        raw = json.dumps({'tipo': kind, 'parametros': params, 'versao': data_version}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    async def run_in_pool(self, func, *args, **kwargs):
+        """Executa uma função pura (picklable) no pool de processos"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def submit(self, kind: str, params: Dict[str, Any], owner_id: str, data_version: Any, producer: ArtifactProducer) -> Dict[str, Any]:
+        """Registra o job; se o artefato já existir em cache, ele nasce concluído"""
+        self._prune_jobs()
+        key = self.artifact_key(kind, params, data_version)
+        job = {
+            'id': uuid.uuid4().hex,
+            'tipo': kind,
+            'parametros': params,
+            'status': JOB_PENDENTE,
+            'owner_id': owner_id,
+            'artifact_key': key,
+            'cache_hit': False,
+            'erro': None,
+            'criado_em': datetime.now().isoformat(),
+            'finalizado_em': None
+        }
+        self.jobs[job['id']] = job
+
+        if key in self.artifacts:
+            self.artifacts.move_to_end(key)
+            job.update(status=JOB_CONCLUIDO, cache_hit=True, finalizado_em=datetime.now().isoformat())
+            return job
+
+        # Jobs idênticos em andamento na mesma geração compartilham a mesma execução
+        generation, task = self._inflight.get(key, (None, None))
+        if task is None or generation != self.generation:
+            task = asyncio.create_task(self._produce(key, producer, self.generation))
+            self._inflight[key] = (self.generation, task)
+        asyncio.create_task(self._follow(job, task))
+        return job
+
+    async def _produce(self, key: str, producer: ArtifactProducer, generation: int) -> Dict[str, Any]:
+        try:
+            async with self._semaphore:
+                for job in self.jobs.values():
+                    if job['artifact_key'] == key and job['status'] == JOB_PENDENTE:
+                        job['status'] = JOB_EXECUTANDO
+                artifact = await producer()
+            if generation != self.generation:
+                raise RuntimeError("Dados alterados durante a geração do relatório; envie o job novamente")
+            self.artifacts[key] = artifact
+            self.artifacts.move_to_end(key)
+            while len(self.artifacts) > self.cache_size:
+                self.artifacts.popitem(last=False)
+            return artifact
+        finally:
+            if self._inflight.get(key, (None, None))[0] == generation:
+                del self._inflight[key]
+
+    async def _follow(self, job: Dict[str, Any], task: asyncio.Task):
+        try:
+            await task
+            job['status'] = JOB_CONCLUIDO
+        except Exception as e:
+            logging.error(f"Erro no job de relatório {job['id']} ({job['tipo']}): {e}")
+            job['status'] = JOB_FALHOU
+            job['erro'] = str(e)
+        job['finalizado_em'] = datetime.now().isoformat()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    def get_artifact(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.artifacts.get(job['artifact_key'])
+
+    def clear_artifacts(self):
+        """Descarta artefatos em cache (dados alterados sem nova coleta) e os jobs ainda em execução"""
+        self.generation += 1
+        self.artifacts.clear()
+
+    def _prune_jobs(self):
+        limit = (datetime.now() - timedelta(seconds=self.ttl)).isoformat()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job['finalizado_em'] and job['finalizado_em'] < limit
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Instância global usada pelas rotas do dashboard
+report_jobs = ReportJobManager(
+    max_workers=REPORT_JOB_WORKERS,
+    max_concurrent=REPORT_JOB_MAX_CONCURRENT,
+    cache_size=REPORT_ARTIFACT_CACHE_SIZE,
+    ttl_seconds=REPORT_JOB_TTL_SECONDS
+)
@@ -0,0 +1,8 @@
+-- 001_produtos_categoria.sql - Categoria do produto gravada no momento da coleta
+-- O coletor preenche `categoria` com o matcher de price_analytics.py;
+-- registros antigos ficam nulos e são categorizados sob demanda pela API.
+
+ALTER TABLE produtos ADD COLUMN IF NOT EXISTS categoria text;
+
+CREATE INDEX IF NOT EXISTS idx_produtos_categoria_data
+    ON produtos (categoria, data_coleta);
@@ -0,0 +1,23 @@
+-- 002_market_stats.sql - Estatísticas por mercado agregadas no banco
+-- Usada por GET /api/dashboard/markets no lugar de baixar a tabela produtos inteira.
+
+CREATE INDEX IF NOT EXISTS idx_produtos_cnpj_data
+    ON produtos (cnpj_supermercado, data_coleta);
+
+CREATE OR REPLACE FUNCTION get_market_stats()
+RETURNS TABLE (
+    cnpj_supermercado text,
+    total_produtos bigint,
+    ultima_coleta text,
+    dias_coletados bigint
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        p.cnpj_supermercado,
+        count(*) AS total_produtos,
+        max(p.data_coleta)::text AS ultima_coleta,
+        count(DISTINCT p.data_coleta::date) AS dias_coletados
+    FROM produtos p
+    GROUP BY p.cnpj_supermercado;
+$$;
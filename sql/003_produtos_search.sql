@@ -0,0 +1,63 @@
+-- 003_produtos_search.sql - Índice de busca de produtos (trigramas sobre nome sem acento + GTIN)
+-- Usado por GET /api/search no lugar do ilike '%termo%', que varre a tabela inteira.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() não é IMMUTABLE; o wrapper com dicionário fixo permite usá-lo em índice
+CREATE OR REPLACE FUNCTION f_unaccent(text)
+RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1);
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_produtos_nome_trgm
+    ON produtos USING gin (f_unaccent(nome_produto_normalizado) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_produtos_codigo_barras
+    ON produtos (codigo_barras);
+
+-- Busca ranqueada: GTIN exato primeiro, depois similaridade de palavra (tolera erros de digitação),
+-- com bônus para nomes que começam pelo termo; empate pelo menor preço.
+CREATE OR REPLACE FUNCTION search_produtos(
+    p_termo text,
+    p_cnpjs text[] DEFAULT NULL,
+    p_limit integer DEFAULT 100,
+    p_offset integer DEFAULT 0
+)
+RETURNS TABLE (
+    produto jsonb,
+    endereco text,
+    score real,
+    total_count bigint,
+    preco_medio numeric
+)
+LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.5
+AS $$
+    WITH termo AS (
+        SELECT lower(f_unaccent(trim(p_termo))) AS t
+    ),
+    candidatos AS (
+        SELECT p.*,
+               CASE
+                   WHEN p.codigo_barras = termo.t THEN 2.0
+                   ELSE word_similarity(termo.t, f_unaccent(p.nome_produto_normalizado))
+                        + CASE WHEN f_unaccent(p.nome_produto_normalizado) LIKE termo.t || '%' THEN 0.5 ELSE 0 END
+               END::real AS score
+        FROM produtos p, termo
+        WHERE (p.codigo_barras = termo.t OR termo.t <% f_unaccent(p.nome_produto_normalizado))
+          AND (p_cnpjs IS NULL OR p.cnpj_supermercado = ANY (p_cnpjs))
+          AND p.preco_produto IS NOT NULL
+    )
+    SELECT to_jsonb(c) - 'score',
+           s.endereco,
+           c.score,
+           count(*) OVER (),
+           avg(c.preco_produto) OVER ()
+    FROM candidatos c
+    LEFT JOIN supermercados s ON s.cnpj = c.cnpj_supermercado
+    ORDER BY c.score DESC, c.preco_produto ASC
+    LIMIT p_limit OFFSET p_offset;
+$$;
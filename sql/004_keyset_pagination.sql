@@ -0,0 +1,8 @@
+-- 004_keyset_pagination.sql - Índices para a paginação por cursor de /api/user-logs e /api/products-log
+-- As páginas são lidas em ordem (created_at, id) decrescente a partir da chave da última linha.
+
+CREATE INDEX IF NOT EXISTS idx_log_de_usuarios_created_at_id
+    ON log_de_usuarios (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_produtos_created_at_id_registro
+    ON produtos (created_at DESC, id_registro DESC);
@@ -0,0 +1,7 @@
+-- 005_user_groups_details.sql - Índices para /api/user-groups e /api/users/{user_id}/groups
+-- A listagem embute só grupos(nome, dias_acesso); nome e email do usuário vêm do
+-- diretório de usuários em memória, então não há chave estrangeira nova para profiles.
+
+CREATE INDEX IF NOT EXISTS idx_user_groups_created_at_id ON user_groups (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_groups_user_id ON user_groups (user_id);
+CREATE INDEX IF NOT EXISTS idx_user_groups_group_id_expiracao ON user_groups (group_id, data_expiracao);
@@ -0,0 +1,16 @@
+-- 006_group_active_counts.sql - Usuários ativos por grupo numa única consulta agregada
+-- Usada por get_my_groups (main e group-admin) e dependencies.get_group_users_count no lugar
+-- de um count='exact' por grupo. p_data é a data de hoje no servidor da API.
+
+CREATE OR REPLACE FUNCTION get_group_active_counts(p_data date)
+RETURNS TABLE (
+    group_id bigint,
+    usuarios_ativos bigint
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT ug.group_id, count(*) AS usuarios_ativos
+    FROM user_groups ug
+    WHERE ug.data_expiracao >= p_data
+    GROUP BY ug.group_id;
+$$;
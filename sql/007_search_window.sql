@@ -0,0 +1,50 @@
+-- 007_search_window.sql - search_produtos limitada à mesma janela da busca em memória
+-- GET /api/search passa p_desde = hoje - HOT_STORE_DAYS, então o índice invertido local, a RPC
+-- e o ilike de último recurso respondem sobre os mesmos registros. NULL mantém todo o histórico.
+-- A assinatura muda (parâmetro novo), por isso a versão de 003 é removida antes.
+
+DROP FUNCTION IF EXISTS search_produtos(text, text[], integer, integer);
+
+CREATE OR REPLACE FUNCTION search_produtos(
+    p_termo text,
+    p_cnpjs text[] DEFAULT NULL,
+    p_limit integer DEFAULT 100,
+    p_offset integer DEFAULT 0,
+    p_desde timestamp DEFAULT NULL
+)
+RETURNS TABLE (
+    produto jsonb,
+    endereco text,
+    score real,
+    total_count bigint,
+    preco_medio numeric
+)
+LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.5
+AS $$
+    WITH termo AS (
+        SELECT lower(f_unaccent(trim(p_termo))) AS t
+    ),
+    candidatos AS (
+        SELECT p.*,
+               CASE
+                   WHEN p.codigo_barras = termo.t THEN 2.0
+                   ELSE word_similarity(termo.t, f_unaccent(p.nome_produto_normalizado))
+                        + CASE WHEN f_unaccent(p.nome_produto_normalizado) LIKE termo.t || '%' THEN 0.5 ELSE 0 END
+               END::real AS score
+        FROM produtos p, termo
+        WHERE (p.codigo_barras = termo.t OR termo.t <% f_unaccent(p.nome_produto_normalizado))
+          AND (p_cnpjs IS NULL OR p.cnpj_supermercado = ANY (p_cnpjs))
+          AND (p_desde IS NULL OR p.data_coleta >= p_desde)
+          AND p.preco_produto IS NOT NULL
+    )
+    SELECT to_jsonb(c) - 'score',
+           s.endereco,
+           c.score,
+           count(*) OVER (),
+           avg(c.preco_produto) OVER ()
+    FROM candidatos c
+    LEFT JOIN supermercados s ON s.cnpj = c.cnpj_supermercado
+    ORDER BY c.score DESC, c.preco_produto ASC
+    LIMIT p_limit OFFSET p_offset;
+$$;
@@ -0,0 +1,106 @@
+# streaming_export.py - Exportações em streaming (CSV/NDJSON, gzip opcional)
+# A consulta é lida em páginas e cada página é escrita assim que chega, então
+# a memória usada não depende do tamanho da exportação.
+
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import csv
+import io
+import json
+import logging
+import zlib
+from fastapi.responses import StreamingResponse
+
+EXPORT_PAGE_SIZE = 1000  # limite padrão de linhas por resposta do PostgREST
+
+def _after(query, order: List[Tuple[str, bool]], last: Dict[str, Any]):
+    """Filtro das linhas posteriores a `last` na ordem dada (chave composta, colunas (nome, desc))"""
+    clauses = []
+    for i, (column, desc) in enumerate(order):
+        terms = [f'{c}.eq."{last[c]}"' for c, _ in order[:i]]
+        terms.append(f'{column}.{"lt" if desc else "gt"}."{last[column]}"')
+        clauses.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return query.or_(','.join(clauses))
+
+async def iter_pages(query_factory: Callable[[], Any], order: List[Tuple[str, bool]],
+                     page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Percorre a consulta em páginas pela chave `order` (colunas únicas em conjunto, todas no select).
+    Cada página continua da última linha lida: sem o custo do offset e sem repetir linhas
+    quando a tabela recebe inserções durante a exportação."""
+    last = None
+    while True:
+        query = query_factory()
+        if last is not None:
+            query = _after(query, order, last)
+        for column, desc in order:
+            query = query.order(column, desc=desc)
+        response = await asyncio.to_thread(query.limit(page_size).execute)
+        page = response.data or []
+        if page:
+            yield page
+            last = page[-1]
+        if len(page) < page_size:
+            return
+
+async def open_pages(query_factory: Callable[[], Any], order: List[Tuple[str, bool]],
+                     page_size: int = EXPORT_PAGE_SIZE) -> Optional[AsyncIterator[List[Dict[str, Any]]]]:
+    """Busca a primeira página antes de responder; retorna None se a consulta estiver vazia"""
+    pages = iter_pages(query_factory, order, page_size)
+    try:
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        return None
+
+    async def chained():
+        yield first
+        async for page in pages:
+            yield page
+
+    return chained()
+
+async def csv_chunks(pages: AsyncIterator[List[Dict[str, Any]]], header: List[str], row_func: Callable[[Dict[str, Any]], Iterable[Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    async for page in pages:
+        writer.writerows(row_func(row) for row in page)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+async def ndjson_chunks(pages: AsyncIterator[List[Dict[str, Any]]], row_func: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> AsyncIterator[bytes]:
+    async for page in pages:
+        lines = (json.dumps(row_func(row) if row_func else row, ensure_ascii=False, default=str) for row in page)
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> formato gzip
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def _guarded(chunks: AsyncIterator[bytes], label: str) -> AsyncIterator[bytes]:
+    # Depois do primeiro byte o status HTTP já foi enviado: registra e relança, para que a
+    # transferência seja interrompida e o cliente veja o download falhar (e não um arquivo truncado)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        logging.error(f"Erro durante a exportação em streaming ({label}): {e}")
+        raise
+
+def streaming_export_response(chunks: AsyncIterator[bytes], media_type: str, filename: str, compress: bool = False) -> StreamingResponse:
+    """Resposta de download em streaming; com compress=True o arquivo é entregue como .gz"""
+    if compress:
+        chunks = gzip_chunks(chunks)
+        media_type = 'application/gzip'
+        filename = f"{filename}.gz"
+    return StreamingResponse(
+        _guarded(chunks, filename),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
@@ -0,0 +1,143 @@
+# user_directory.py - Cache do diretório de usuários (id -> nome, email, role)
+# Carregado em lote pela API admin de usuários (paginada) + tabela profiles, para que
+# listagens e logs não façam um get_user_by_id por usuário. Recarregado após
+# USER_DIRECTORY_TTL segundos e atualizado pontualmente quando um usuário muda.
+# Ids que não existem mais (ex.: associações de usuários excluídos) ficam marcados como
+# ausentes por USER_DIRECTORY_MISSING_TTL segundos, sem nova busca a cada listagem.
+
+from typing import Any, Dict, Iterable, Optional
+import asyncio
+import logging
+import os
+import time
+
+USER_DIRECTORY_TTL = int(os.getenv("USER_DIRECTORY_TTL", "600"))
+USER_DIRECTORY_MISSING_TTL = int(os.getenv("USER_DIRECTORY_MISSING_TTL", "600"))
+AUTH_USERS_PAGE_SIZE = 1000
+PROFILES_PAGE_SIZE = 1000
+
+class UserDirectory:
+    """Entradas {'id', 'email', 'full_name', 'role'} indexadas pelo id do usuário"""
+    def __init__(self, ttl: int = USER_DIRECTORY_TTL, missing_ttl: int = USER_DIRECTORY_MISSING_TTL):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.missing: Dict[str, float] = {}  # id -> quando a busca individual não o encontrou
+        self.loaded_at: Optional[float] = None
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    def configure(self, admin_client):
+        self._client = admin_client
+
+    # --- Carga ---
+
+    def _fetch_all(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        page = 1
+        while True:
+            users = self._client.auth.admin.list_users(page=page, per_page=AUTH_USERS_PAGE_SIZE)
+            for user in users:
+                entries[user.id] = {'id': user.id, 'email': user.email, 'full_name': None, 'role': None}
+            if len(users) < AUTH_USERS_PAGE_SIZE:
+                break
+            page += 1
+
+        last_id = None
+        while True:
+            query = self._client.table('profiles').select('id, full_name, role')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            profiles = query.order('id').limit(PROFILES_PAGE_SIZE).execute().data or []
+            for profile in profiles:
+                entry = entries.setdefault(profile['id'], {'id': profile['id'], 'email': None})
+                entry['full_name'] = profile.get('full_name')
+                entry['role'] = profile.get('role')
+            if len(profiles) < PROFILES_PAGE_SIZE:
+                break
+            last_id = profiles[-1]['id']
+        return entries
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def refresh(self):
+        async with self._lock:
+            entries = await asyncio.to_thread(self._fetch_all)
+            self.entries = entries
+            self.loaded_at = time.monotonic()
+        logging.info(f"Diretório de usuários carregado: {len(entries)} usuários")
+
+    async def _ensure_loaded(self):
+        if not self.is_stale():
+            return
+        if self._lock.locked():
+            # Outra requisição já está carregando: só espera se ainda não há nenhuma carga
+            if self.loaded_at is None:
+                async with self._lock:
+                    pass
+            return
+        await self.refresh()
+
+    def _fetch_one(self, user_id: str) -> Optional[Dict[str, Any]]:
+        # Usuário criado depois da última carga (fora das rotas que atualizam o cache)
+        auth_response = self._client.auth.admin.get_user_by_id(user_id)
+        if not auth_response.user:
+            return None
+        profile = self._client.table('profiles').select('full_name, role').eq('id', user_id).execute().data or [{}]
+        return {'id': user_id, 'email': auth_response.user.email, 'full_name': profile[0].get('full_name'), 'role': profile[0].get('role')}
+
+    # --- Consulta ---
+
+    async def get_many(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Entradas dos ids pedidos; ids desconhecidos são buscados individualmente uma vez
+        (os não encontrados ficam marcados como ausentes por missing_ttl segundos)"""
+        try:
+            await self._ensure_loaded()
+        except Exception as e:
+            logging.error(f"Erro ao carregar diretório de usuários: {e}")
+        found = {}
+        now = time.monotonic()
+        for user_id in set(user_ids):
+            entry = self.entries.get(user_id)
+            if entry is None and not self._known_missing(user_id, now):
+                try:
+                    entry = await asyncio.to_thread(self._fetch_one, user_id)
+                    if entry is None:
+                        self.missing[user_id] = now
+                except Exception as e:
+                    logging.error(f"Erro ao buscar usuário {user_id}: {e}")
+                if entry is not None:
+                    self.entries[user_id] = entry
+            if entry is not None:
+                found[user_id] = entry
+        return found
+
+    def _known_missing(self, user_id: str, now: float) -> bool:
+        missing_at = self.missing.get(user_id)
+        if missing_at is None:
+            return False
+        if now - missing_at > self.missing_ttl:
+            del self.missing[user_id]
+            return False
+        return True
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def emails(self, user_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        return {user_id: entry.get('email') for user_id, entry in (await self.get_many(user_ids)).items()}
+
+    # --- Atualização pontual ---
+
+    def put(self, user_id: str, **fields):
+        """Atualiza (ou cria) a entrada após criação/edição de um usuário"""
+        self.missing.pop(user_id, None)
+        entry = self.entries.setdefault(user_id, {'id': user_id, 'email': None, 'full_name': None, 'role': None})
+        entry.update({key: value for key, value in fields.items() if value is not None})
+
+    def remove(self, user_id: str):
+        self.entries.pop(user_id, None)
+
+# Instância global do processo
+user_directory = UserDirectory()
@@ -30,6 +30,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     document.getElementById('btnSearchPrices').addEventListener('click', handleSearchPrices);
     document.getElementById('editProductForm').addEventListener('submit', handleEditProductSubmit);
     
+    // Autocompletar de produtos no editor da cesta
+    setupProductSuggestions();
+    
     // Botão para abrir modal de criação
     document.getElementById('btnCreateBasket').addEventListener('click', () => {
         createBasketModal.style.display = 'block';
@@ -62,6 +65,65 @@ function initializeModals() {
     editProductModal = document.getElementById('editProductModal');
 }
 
+/**
+ * Autocompletar do nome do produto: requisições com debounce, canceladas a cada nova digitação.
+ * Ao escolher uma sugestão, o código de barras é preenchido se estiver vazio.
+ */
+function setupProductSuggestions() {
+    const nameInput = document.getElementById('productName');
+    const barcodeInput = document.getElementById('productBarcode');
+    const suggestionsList = document.createElement('datalist');
+    suggestionsList.id = 'productSuggestions';
+    nameInput.after(suggestionsList);
+    nameInput.setAttribute('list', suggestionsList.id);
+
+    let timer = null;
+    let controller = null;
+    let barcodesByName = {};
+
+    const fetchSuggestions = async (query) => {
+        if (controller) controller.abort();
+        const current = new AbortController();
+        controller = current;
+        try {
+            const response = await authenticatedFetch(`/api/products/suggest?q=${encodeURIComponent(query)}`, { signal: current.signal });
+            if (!response.ok) return;
+            const data = await response.json();
+            if (current.signal.aborted) return;
+            suggestionsList.innerHTML = '';
+            barcodesByName = {};
+            (data.suggestions || []).forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.nome_produto_normalizado;
+                if (suggestion.codigo_barras) {
+                    option.label = suggestion.codigo_barras;
+                    barcodesByName[suggestion.nome_produto_normalizado] ??= suggestion.codigo_barras;
+                }
+                suggestionsList.appendChild(option);
+            });
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Erro ao buscar sugestões:', error);
+        }
+    };
+
+    nameInput.addEventListener('input', () => {
+        const query = nameInput.value.trim();
+        clearTimeout(timer);
+        if (controller) controller.abort();
+
+        // Valor escolhido na lista de sugestões
+        if (barcodesByName[query] && !barcodeInput.value.trim()) {
+            barcodeInput.value = barcodesByName[query];
+            return;
+        }
+        if (query.length < 2) {
+            suggestionsList.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(() => fetchSuggestions(query), 200);
+    });
+}
+
 /**
  * Carrega a lista de supermercados para o modal de busca de preços.
  */
@@ -226,6 +226,7 @@ document.addEventListener('DOMContentLoaded', () => {
             showMessage('Selecione ao menos um supermercado para busca em tempo real.'); return;
         }
 
+        cancelSuggestions();
         showLoader(true);
         resultsGrid.innerHTML = '';
         currentResults = [];
@@ -263,6 +264,53 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // --- SUGESTÕES (AUTOCOMPLETAR) ---
+    const SUGGEST_DEBOUNCE_MS = 200;
+    const suggestionsList = document.createElement('datalist');
+    suggestionsList.id = 'searchSuggestions';
+    searchInput.after(suggestionsList);
+    searchInput.setAttribute('list', suggestionsList.id);
+    let suggestTimer = null;
+    let suggestController = null;
+
+    const cancelSuggestions = () => {
+        clearTimeout(suggestTimer);
+        if (suggestController) suggestController.abort();
+        suggestController = null;
+    };
+
+    const fetchSuggestions = async (query) => {
+        // Só a última digitação importa: a requisição anterior é cancelada
+        if (suggestController) suggestController.abort();
+        const controller = new AbortController();
+        suggestController = controller;
+        try {
+            const response = await authenticatedFetch(`/api/products/suggest?q=${encodeURIComponent(query)}`, { signal: controller.signal });
+            if (!response.ok) return;
+            const data = await response.json();
+            if (controller.signal.aborted) return;
+            suggestionsList.innerHTML = '';
+            (data.suggestions || []).forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.nome_produto_normalizado;
+                if (suggestion.codigo_barras) option.label = suggestion.codigo_barras;
+                suggestionsList.appendChild(option);
+            });
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Erro ao buscar sugestões:', error);
+        }
+    };
+
+    searchInput.addEventListener('input', () => {
+        const query = searchInput.value.trim();
+        cancelSuggestions();
+        if (query.length < 2) {
+            suggestionsList.innerHTML = '';
+            return;
+        }
+        suggestTimer = setTimeout(() => fetchSuggestions(query), SUGGEST_DEBOUNCE_MS);
+    });
+
     // --- EVENTOS ---
     searchButton.addEventListener('click', () => performSearch());
     searchInput.addEventListener('keypress', (event) => { 
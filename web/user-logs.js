@@ -1,8 +1,12 @@
 // user-logs.js - COM NOMES DOS SUPERMERCADOS (tabela supermercado)
 
-let currentPage = 1;
-const logsPerPage = 10;
+const logsPerPage = 20;
 let allLogs = [];
+let nextCursor = null;   // cursor da próxima página (null = fim da lista)
+let totalCount = null;   // total estimado, informado pela API na primeira página
+let isLoadingLogs = false;
+let logsRequestId = 0;    // respostas de requisições substituídas são ignoradas
+let currentFilters = {};
 let marketMap = {}; // Mapa para armazenar CNPJ -> Nome
 
 document.addEventListener('DOMContentLoaded', function() {
@@ -74,45 +78,63 @@ function getMarketNames(marketData) {
     }
 }
 
-async function loadUserLogs(page = 1) {
+/**
+ * Carrega logs pela API com paginação por cursor.
+ * reset=true recomeça a lista (filtros novos ou exclusão); false acrescenta a próxima página.
+ */
+async function loadUserLogs(reset = true) {
+    if (!reset && (isLoadingLogs || !nextCursor)) return;
+    const requestId = ++logsRequestId;
+    isLoadingLogs = true;
+
     try {
-        showLoadingState();
-        
-        console.log('Carregando logs do Supabase...');
-        
-        const { data, error, count } = await supabase
-            .from('log_de_usuarios')
-            .select('*', { count: 'exact' })
-            .order('created_at', { ascending: false })
-            .range((page - 1) * logsPerPage, page * logsPerPage - 1);
+        if (reset) {
+            allLogs = [];
+            nextCursor = null;
+            totalCount = null;
+            showLoadingState();
+        }
 
-        if (error) {
-            console.error('Erro ao carregar logs:', error);
-            showError('Erro ao carregar logs: ' + error.message);
-            return;
+        const params = new URLSearchParams({ page_size: logsPerPage });
+        Object.entries(currentFilters).forEach(([key, value]) => {
+            if (value) params.append(key, value);
+        });
+        if (nextCursor) params.append('cursor', nextCursor);
+
+        const response = await authenticatedFetch(`/api/user-logs?${params.toString()}`);
+        if (!response.ok) {
+            const err = await response.json().catch(() => ({}));
+            throw new Error(err.detail || `Erro ${response.status}`);
         }
+        const result = await response.json();
+        if (requestId !== logsRequestId) return;
 
-        console.log('Logs carregados:', data);
-        
-        if (!data || data.length === 0) {
+        if (result.total_count !== null && result.total_count !== undefined) {
+            totalCount = result.total_count;
+        }
+        nextCursor = result.next_cursor;
+        const logs = result.data || [];
+        allLogs = allLogs.concat(logs);
+
+        if (allLogs.length === 0) {
             renderEmptyState();
-            updatePagination(0, page);
-            return;
+        } else {
+            renderLogsTable(logs, !reset);
         }
+        updatePagination();
 
-        allLogs = data;
-        renderLogsTable(data);
-        updatePagination(count, page);
-        
     } catch (error) {
-        console.error('Erro inesperado:', error);
-        showError('Erro inesperado ao carregar logs');
+        if (requestId !== logsRequestId) return;
+        console.error('Erro ao carregar logs:', error);
+        showError('Erro ao carregar logs: ' + error.message);
+    } finally {
+        if (requestId === logsRequestId) isLoadingLogs = false;
     }
 }
 
-function renderLogsTable(logs) {
+function renderLogsTable(logs, append = false) {
     const tbody = document.querySelector('#logsTable tbody');
-    tbody.innerHTML = '';
+    if (!append) tbody.innerHTML = '';
 
     logs.forEach(log => {
         const row = document.createElement('tr');
@@ -178,31 +200,22 @@ function showLoadingState() {
     `;
 }
 
-function updatePagination(totalCount, currentPage) {
-    const totalPages = Math.ceil(totalCount / logsPerPage);
+function updatePagination() {
     const pageInfo = document.getElementById('pageInfo');
-    const prevBtn = document.getElementById('prevPage');
-    const nextBtn = document.getElementById('nextPage');
+    const loadMoreBtn = document.getElementById('loadMore');
 
-    pageInfo.textContent = `Página ${currentPage} de ${totalPages || 1}`;
-    
-    prevBtn.disabled = currentPage <= 1;
-    nextBtn.disabled = currentPage >= totalPages;
+    const totalText = totalCount !== null ? ` de aproximadamente ${totalCount}` : '';
+    pageInfo.textContent = `Exibindo ${allLogs.length}${totalText} logs`;
+    loadMoreBtn.style.display = nextCursor ? '' : 'none';
 }
 
 function setupEventListeners() {
-    // Paginação
-    document.getElementById('prevPage').addEventListener('click', () => {
-        if (currentPage > 1) {
-            currentPage--;
-            loadUserLogs(currentPage);
-        }
-    });
-
-    document.getElementById('nextPage').addEventListener('click', () => {
-        currentPage++;
-        loadUserLogs(currentPage);
-    });
+    // Rolagem infinita (o botão fica como alternativa)
+    document.getElementById('loadMore').addEventListener('click', () => loadUserLogs(false));
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadUserLogs(false);
+    }, { rootMargin: '200px' });
+    observer.observe(document.getElementById('logsSentinel'));
 
     // Filtros
     document.getElementById('filterButton').addEventListener('click', applyFilters);
@@ -244,52 +257,20 @@ async function loadUsersForFilters() {
 
 // Funções de filtro
 async function applyFilters() {
-    try {
-        const userFilter = document.getElementById('userFilter').value;
-        const dateFilter = document.getElementById('dateFilter').value;
-        const actionFilter = document.getElementById('actionFilter').value;
-
-        let query = supabase
-            .from('log_de_usuarios')
-            .select('*', { count: 'exact' })
-            .order('created_at', { ascending: false });
-
-        // Aplicar filtros
-        if (userFilter) {
-            query = query.eq('user_name', userFilter);
-        }
-        if (dateFilter) {
-            const startDate = new Date(dateFilter);
-            const endDate = new Date(dateFilter);
-            endDate.setDate(endDate.getDate() + 1);
-            
-            query = query.gte('created_at', startDate.toISOString())
-                        .lt('created_at', endDate.toISOString());
-        }
-        if (actionFilter) {
-            query = query.eq('action_type', actionFilter);
-        }
-
-        const { data, error, count } = await query;
-
-        if (error) throw error;
-
-        currentPage = 1;
-        allLogs = data || [];
-        renderLogsTable(allLogs);
-        updatePagination(count, currentPage);
-
-    } catch (error) {
-        console.error('Erro ao aplicar filtros:', error);
-        showError('Erro ao aplicar filtros');
-    }
+    currentFilters = {
+        user_name: document.getElementById('userFilter').value,
+        date: document.getElementById('dateFilter').value,
+        action_type: document.getElementById('actionFilter').value
+    };
+    await loadUserLogs();
 }
 
 function clearFilters() {
     document.getElementById('userFilter').value = '';
     document.getElementById('dateFilter').value = '';
     document.getElementById('actionFilter').value = '';
-    loadUserLogs(1);
+    currentFilters = {};
+    loadUserLogs();
 }
 
 // Funções de exclusão
@@ -305,7 +286,7 @@ async function deleteLog(logId) {
         if (error) throw error;
 
         // Recarregar a lista
-        loadUserLogs(currentPage);
+        loadUserLogs();
     } catch (error) {
         console.error('Erro ao excluir log:', error);
         alert('Erro ao excluir log: ' + error.message);
@@ -335,7 +316,7 @@ async function deleteLogsByDate() {
         if (error) throw error;
 
         alert('Logs excluídos com sucesso!');
-        loadUserLogs(1);
+        loadUserLogs();
     } catch (error) {
         console.error('Erro ao excluir logs por data:', error);
         alert('Erro ao excluir logs: ' + error.message);
@@ -360,7 +341,7 @@ async function deleteLogsByUser() {
         if (error) throw error;
 
         alert('Logs excluídos com sucesso!');
-        loadUserLogs(1);
+        loadUserLogs();
     } catch (error) {
         console.error('Erro ao excluir logs por usuário:', error);
         alert('Erro ao excluir logs: ' + error.message);
@@ -379,7 +360,7 @@ async function deleteAllLogs() {
         if (error) throw error;
 
         alert('Todos os logs foram excluídos com sucesso!');
-        loadUserLogs(1);
+        loadUserLogs();
     } catch (error) {
         console.error('Erro ao excluir todos os logs:', error);
         alert('Erro ao excluir logs: ' + error.message);
@@ -12,9 +12,21 @@ document.addEventListener('DOMContentLoaded', () => {
     const permissionCards = document.querySelectorAll('.permission-card');
     const managedGroupsContainer = document.getElementById('managedGroupsContainer');
     const managedGroupsDiv = document.getElementById('managedGroups');
+    const searchInput = document.getElementById('usersSearch');
+    const roleFilter = document.getElementById('usersRoleFilter');
+    const pageInfo = document.getElementById('usersPageInfo');
+    const prevPageButton = document.getElementById('usersPrevPage');
+    const nextPageButton = document.getElementById('usersNextPage');
+    const sortHeaders = document.querySelectorAll('th.sortable');
 
     // --- VARIÁVEIS GLOBAIS ---
     let allGroups = [];
+    const usersPerPage = 50;
+    let currentPage = 1;
+    let totalUsers = 0;
+    let sortBy = 'full_name';
+    let sortDir = 'asc';
+    let searchTimer = null;
 
     // --- LÓGICA DE NEGÓCIO ---
 
@@ -120,15 +132,34 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Paginação, filtros e ordenação são feitos no servidor
     const loadUsers = async () => {
         try {
-            const response = await authenticatedFetch('/api/users');
+            const params = new URLSearchParams({
+                page: currentPage,
+                page_size: usersPerPage,
+                sort_by: sortBy,
+                sort_dir: sortDir
+            });
+            const search = searchInput ? searchInput.value.trim() : '';
+            if (search) params.set('search', search);
+            if (roleFilter && roleFilter.value) params.set('role', roleFilter.value);
+
+            const response = await authenticatedFetch(`/api/users?${params.toString()}`);
             
             if (!response.ok) {
                 throw new Error('Erro ao carregar usuários');
             }
             
-            const users = await response.json();
+            const result = await response.json();
+            const users = result.data;
+            totalUsers = result.total_count;
+
+            // Página esvaziada (ex.: após excluir o último usuário dela)
+            if (users.length === 0 && currentPage > 1) {
+                currentPage = Math.max(1, Math.ceil(totalUsers / usersPerPage));
+                return loadUsers();
+            }
             
             tableBody.innerHTML = '';
             users.forEach(user => {
@@ -156,12 +187,29 @@ document.addEventListener('DOMContentLoaded', () => {
                 `;
                 tableBody.appendChild(row);
             });
+            updatePagination();
         } catch (error) {
             console.error('Erro ao carregar usuários:', error);
             alert('Não foi possível carregar a lista de usuários.');
         }
     };
 
+    const updatePagination = () => {
+        const totalPages = Math.max(1, Math.ceil(totalUsers / usersPerPage));
+        if (pageInfo) {
+            pageInfo.textContent = totalUsers > 0
+                ? `Página ${currentPage} de ${totalPages} (${totalUsers} usuários)`
+                : 'Nenhum usuário encontrado';
+        }
+        if (prevPageButton) prevPageButton.disabled = currentPage <= 1;
+        if (nextPageButton) nextPageButton.disabled = currentPage >= totalPages;
+        sortHeaders.forEach(th => {
+            const icon = th.querySelector('i');
+            if (!icon) return;
+            icon.className = th.dataset.sort !== sortBy ? 'fas fa-sort' : (sortDir === 'asc' ? 'fas fa-sort-up' : 'fas fa-sort-down');
+        });
+    };
+
     const resetForm = () => {
         formTitle.textContent = 'Adicionar Novo Usuário';
         userIdInput.value = '';
@@ -359,6 +407,54 @@ document.addEventListener('DOMContentLoaded', () => {
     
     saveButton.addEventListener('click', saveUser);
     cancelButton.addEventListener('click', resetForm);
+
+    if (searchInput) {
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                currentPage = 1;
+                loadUsers();
+            }, 300);
+        });
+    }
+
+    if (roleFilter) {
+        roleFilter.addEventListener('change', () => {
+            currentPage = 1;
+            loadUsers();
+        });
+    }
+
+    sortHeaders.forEach(th => {
+        th.addEventListener('click', () => {
+            if (sortBy === th.dataset.sort) {
+                sortDir = sortDir === 'asc' ? 'desc' : 'asc';
+            } else {
+                sortBy = th.dataset.sort;
+                sortDir = 'asc';
+            }
+            currentPage = 1;
+            loadUsers();
+        });
+    });
+
+    if (prevPageButton) {
+        prevPageButton.addEventListener('click', () => {
+            if (currentPage > 1) {
+                currentPage--;
+                loadUsers();
+            }
+        });
+    }
+
+    if (nextPageButton) {
+        nextPageButton.addEventListener('click', () => {
+            if (currentPage * usersPerPage < totalUsers) {
+                currentPage++;
+                loadUsers();
+            }
+        });
+    }
     
     // Inicialização da página
     const initializePage = async () => {